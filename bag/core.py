@@ -415,8 +415,9 @@ class BagProject(object):
     bag_config_path : str or None
         the bag configuration file path.  If None, will attempt to read from
         environment variable BAG_CONFIG_PATH.
-    port : Optional[int]
-        the BAG server process port number.  If not given, will read from port file.
+    port : Optional[Union[int, List[int]]]
+        the BAG server process port number.  If not given, will read from port file.  If multiple
+        ports are given, database operations are distributed over all BAG server processes.
 
     Attributes
     ----------
@@ -436,12 +437,23 @@ class BagProject(object):
         bag_tmp_dir = os.environ.get('BAG_TEMP_DIR', None)
 
         # get port files
+        port_list = []
         if port is None:
             socket_config = self.bag_config['socket']
             if 'port_file' in socket_config:
-                port, msg = _get_port_number(socket_config['port_file'])
-                if msg:
-                    print('*WARNING* %s' % msg)
+                port_file_list = socket_config['port_file']
+                if not isinstance(port_file_list, list):
+                    port_file_list = [port_file_list]
+                for port_file in port_file_list:
+                    port, msg = _get_port_number(port_file)
+                    if msg:
+                        print('*WARNING* %s: %s' % (port_file, msg))
+                    else:
+                        port_list.append(port)
+        elif isinstance(port, list):
+            port_list = port
+        else:
+            port_list = [port]
 
         # create ZMQDealer object
         dealer_kwargs = {}
@@ -461,11 +473,15 @@ class BagProject(object):
         # create design module database.
         self.dsn_db = design.Database(self.bag_config['lib_defs'], self.tech_info)
 
-        if port is not None:
+        if port_list:
             # make DbAccess instance.
-            dealer = interface.ZMQDealer(port, **dealer_kwargs)
             db_cls = _import_class_from_str(self.bag_config['database']['class'])
-            self.impl_db = db_cls(dealer, bag_tmp_dir, self.bag_config['database'])
+            db_list = [db_cls(interface.ZMQDealer(port, **dealer_kwargs), bag_tmp_dir, self.bag_config['database'])
+                       for port in port_list]
+            if len(db_list) == 1:
+                self.impl_db = db_list[0]
+            else:
+                self.impl_db = interface.SkillPool(db_list, bag_tmp_dir, self.bag_config['database'])
         else:
             self.impl_db = None
 
@@ -667,7 +683,7 @@ class BagProject(object):
         self.impl_db.instantiate_layout_pcell(lib_name, cell_name, view_name,
                                               inst_lib, inst_cell, params, pin_mapping)
 
-    def instantiate_layout(self, lib_name, view_name, via_tech, layout_list):
+    def instantiate_layout(self, lib_name, view_name, via_tech, layout_list, **kwargs):
         """Create a batch of layouts.
 
         Parameters
@@ -678,13 +694,16 @@ class BagProject(object):
             layout view name.
         via_tech : string
             via technology name.
-        layout_list : list[any]
-            a list of layouts to create
+        layout_list : Iterable[any]
+            an iterable of layouts to create.  Children must come before parents.
+        **kwargs :
+            additional options for the database implementation, such as chunk_size and
+            debug for :meth:`bag.interface.skill.SkillInterface.instantiate_layout`.
         """
         if self.impl_db is None:
             raise Exception('BAG Server is not set up.')
 
-        self.impl_db.instantiate_layout(lib_name, view_name, via_tech, layout_list)
+        self.impl_db.instantiate_layout(lib_name, view_name, via_tech, layout_list, **kwargs)
 
     def release_write_locks(self, lib_name, cell_view_list):
         """Release write locks from all the given cells.
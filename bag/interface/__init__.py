@@ -31,5 +31,6 @@ from builtins import *
 
 from .server import SkillServer
 from .zmqwrapper import ZMQRouter, ZMQDealer
+from .pool import SkillPool
 
-__all__ = ['SkillServer', 'ZMQRouter', 'ZMQDealer', ]
+__all__ = ['SkillServer', 'ZMQRouter', 'ZMQDealer', 'SkillPool', ]
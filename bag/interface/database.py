@@ -352,7 +352,7 @@ class DbAccess(with_metaclass(abc.ABCMeta, object)):
         pass
 
     @abc.abstractmethod
-    def instantiate_layout(self, lib_name, view_name, via_tech, layout_list):
+    def instantiate_layout(self, lib_name, view_name, via_tech, layout_list, **kwargs):
         """Create a batch of layouts.
 
         Parameters
@@ -363,8 +363,10 @@ class DbAccess(with_metaclass(abc.ABCMeta, object)):
             layout view name.
         via_tech : str
             via technology library name.
-        layout_list : list[any]
-            a list of layouts to create
+        layout_list : Iterable[any]
+            an iterable of layouts to create.  Children must come before parents.
+        **kwargs :
+            implementation specific options.
         """
         pass
 
@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+########################################################################################################################
+#
+# Copyright (c) 2014, Regents of the University of California
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+#   disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+#    following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+########################################################################################################################
+
+"""This module defines SkillPool, a database interface that distributes work over multiple Virtuoso processes.
+"""
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+# noinspection PyUnresolvedReferences,PyCompatibility
+from builtins import *
+
+import time
+from collections import deque
+from typing import List, Dict, Optional, Any, Tuple, Iterable, Set, Deque
+
+import zmq
+
+from .database import DbAccess
+from .skill import SkillInterface, SkillFuture, VirtuosoException, _format_layout_list
+
+
+class SkillPool(DbAccess):
+    """A database interface that distributes operations over multiple Virtuoso processes.
+
+    Each worker is a :class:`~bag.interface.skill.SkillInterface` connected to its own
+    :class:`~bag.interface.SkillServer`.  Operations on a library are always sent to the same
+    worker, so two Virtuoso processes never write to the same library at the same time.  A library
+    is assigned to the least busy worker when it is first used.  The exception is
+    instantiate_layout(), which creates independent cells on all workers in parallel.  A layout
+    cell is created on the worker that created its children when possible, and children created by
+    other workers are purged from the worker's memory first, so it never uses stale copies.
+
+    Parameters
+    ----------
+    db_list : List[SkillInterface]
+        the workers.
+    tmp_dir : string
+        temporary file directory for DbAccess.
+    db_config : dict[str, any]
+        the database configuration dictionary.
+    """
+
+    def __init__(self, db_list, tmp_dir, db_config):
+        # type: (List[SkillInterface], str, Dict[str, Any]) -> None
+        if not db_list:
+            raise ValueError('SkillPool must have at least one worker.')
+        DbAccess.__init__(self, tmp_dir, db_config)
+        self._workers = db_list
+        self._lib_worker = {}  # type: Dict[str, int]
+        # workers that may hold write locks in each library
+        self._lib_users = {}  # type: Dict[str, Set[int]]
+        # worker that created each layout cellview
+        self._cell_worker = {}  # type: Dict[Tuple[str, str, str], int]
+        self._layout_timing = []  # type: List[Tuple[List[str], float]]
+        self._poller = zmq.Poller()
+        self._sock_table = {}  # type: Dict[Any, int]
+        for idx, db in enumerate(db_list):
+            # noinspection PyUnresolvedReferences
+            self._poller.register(db.handler.socket, zmq.POLLIN)
+            self._sock_table[db.handler.socket] = idx
+
+    @property
+    def num_workers(self):
+        # type: () -> int
+        """Returns the number of workers."""
+        return len(self._workers)
+
+    @property
+    def layout_timing(self):
+        # type: () -> List[Tuple[List[str], float]]
+        """Returns the cell names and creation time in seconds of each chunk of the last instantiate_layout()."""
+        return self._layout_timing
+
+    def get_worker(self, lib_name):
+        # type: (str) -> SkillInterface
+        """Returns the worker assigned to the given library.
+
+        If the library is not assigned yet, it is assigned to the worker with the fewest
+        pending requests, breaking ties by the number of assigned libraries.
+
+        Parameters
+        ----------
+        lib_name : str
+            the library name.
+
+        Returns
+        -------
+        db : SkillInterface
+            the worker assigned to the given library.
+        """
+        idx = self._lib_worker.get(lib_name, None)
+        if idx is None:
+            num_libs = [0] * len(self._workers)
+            for val in self._lib_worker.values():
+                num_libs[val] += 1
+            idx = min(range(len(self._workers)), key=lambda i: (self._workers[i].num_pending, num_libs[i]))
+            self._lib_worker[lib_name] = idx
+            self._lib_users[lib_name] = {idx}
+        return self._workers[idx]
+
+    def close(self):
+        """Terminate all database servers gracefully.
+        """
+        for db in self._workers:
+            db.close()
+
+    def parse_schematic_template(self, lib_name, cell_name):
+        return self.get_worker(lib_name).parse_schematic_template(lib_name, cell_name)
+
+    def get_cells_in_library(self, lib_name):
+        return self.get_worker(lib_name).get_cells_in_library(lib_name)
+
+    def create_library(self, lib_name, lib_path=''):
+        return self.get_worker(lib_name).create_library(lib_name, lib_path=lib_path)
+
+    def create_implementation(self, lib_name, template_list, change_list, lib_path=''):
+        return self.get_worker(lib_name).create_implementation(lib_name, template_list, change_list,
+                                                               lib_path=lib_path)
+
+    def instantiate_testbench(self, tb_lib, tb_cell, targ_lib, dut_lib, dut_cell, new_lib_path=''):
+        return self.get_worker(targ_lib).instantiate_testbench(tb_lib, tb_cell, targ_lib, dut_lib, dut_cell,
+                                                               new_lib_path=new_lib_path)
+
+    def get_testbench_info(self, tb_lib, tb_cell):
+        return self.get_worker(tb_lib).get_testbench_info(tb_lib, tb_cell)
+
+    def update_testbench(self, lib, cell, parameters, sim_envs, config_rules, env_parameters):
+        return self.get_worker(lib).update_testbench(lib, cell, parameters, sim_envs, config_rules,
+                                                     env_parameters)
+
+    def instantiate_layout_pcell(self, lib_name, cell_name, view_name,
+                                 inst_lib, inst_cell, params, pin_mapping):
+        return self.get_worker(lib_name).instantiate_layout_pcell(lib_name, cell_name, view_name, inst_lib,
+                                                                  inst_cell, params, pin_mapping)
+
+    def release_write_locks(self, lib_name, cell_view_list):
+        self.get_worker(lib_name)
+        for idx in sorted(self._lib_users[lib_name]):
+            self._workers[idx].release_write_locks(lib_name, cell_view_list)
+
+    def run_lvs(self, lib_name, cell_name, sch_view, lay_view, lvs_params,
+                block=True, callback=None):
+        return self.get_worker(lib_name).run_lvs(lib_name, cell_name, sch_view, lay_view, lvs_params,
+                                                 block=block, callback=callback)
+
+    def run_rcx(self, lib_name, cell_name, sch_view, lay_view, rcx_params,
+                block=True, callback=None, create_schematic=True):
+        return self.get_worker(lib_name).run_rcx(lib_name, cell_name, sch_view, lay_view, rcx_params,
+                                                 block=block, callback=callback,
+                                                 create_schematic=create_schematic)
+
+    def create_schematic_from_netlist(self, netlist, lib_name, cell_name,
+                                      sch_view=None, **kwargs):
+        return self.get_worker(lib_name).create_schematic_from_netlist(netlist, lib_name, cell_name,
+                                                                       sch_view=sch_view, **kwargs)
+
+    def create_verilog_view(self, verilog_file, lib_name, cell_name, **kwargs):
+        return self.get_worker(lib_name).create_verilog_view(verilog_file, lib_name, cell_name, **kwargs)
+
+    def instantiate_layout(self, lib_name, view_name, via_tech, layout_list, chunk_size=1,
+                           max_pending=2, debug=False):
+        # type: (str, str, str, Iterable[List[Any]], int, int, bool) -> Optional[str]
+        """Create a batch of layouts using all workers in parallel.
+
+        A cell is sent to a worker once all its children in this batch are created, so independent
+        cells are created on different workers at the same time.  To keep dependency chains on one
+        worker, a cell is sent to the worker that created most of its children, and it waits if that
+        worker is busy.  Children created by other workers are refreshed on that worker before the
+        cell is created.  Each worker has at most max_pending chunks of at most chunk_size cells in
+        flight.  All workers must share the same cds.lib file, so every worker can see the library
+        and cells created by other workers.  The time from sending to creation of each chunk is
+        available from the layout_timing property afterwards.
+
+        Parameters
+        ----------
+        lib_name : str
+            layout library name.
+        view_name : str
+            layout view name.
+        via_tech : str
+            via technology library name.
+        layout_list : Iterable[List[Any]]
+            an iterable of layouts to create.  Children must come before parents.
+        chunk_size : int
+            maximum number of cells to create per skill request.
+        max_pending : int
+            maximum number of chunks sent to each worker but not yet created.
+        debug : bool
+            True to print progress and timing of each chunk.
+
+        Returns
+        -------
+        result : Optional[str]
+            a string representation of the result of the last skill request to finish, or None
+            if layout_list is empty.
+        """
+        if chunk_size < 1 or max_pending < 1:
+            raise ValueError('chunk_size and max_pending must be positive.')
+
+        # create the library on the assigned worker first
+        self.create_library(lib_name)
+
+        num_workers = len(self._workers)
+        pending = [deque() for _ in range(num_workers)]  # type: List[Deque[Tuple[List[str], SkillFuture, float]]]
+        ready = deque()  # type: Deque[List[Any]]
+        # cells in this batch that are not created yet, and their parents waiting on them.
+        unfinished = {}  # type: Dict[str, List[str]]
+        blocked = {}  # type: Dict[str, Tuple[List[Any], Set[str]]]
+        timing_list = self._layout_timing = []  # type: List[Tuple[List[str], float]]
+        last_future = None  # type: Optional[SkillFuture]
+        error = None  # type: Optional[Exception]
+        layout_iter = iter(layout_list)
+        exhausted = False
+        num_done = 0
+        while True:
+            # read layouts until there are enough ready cells to fill all free slots.
+            num_free = sum((max_pending - len(q) for q in pending))
+            while error is None and not exhausted and len(ready) < num_free * chunk_size:
+                try:
+                    info_list = next(layout_iter)
+                except StopIteration:
+                    exhausted = True
+                    break
+                cell_name = info_list[0]
+                deps = set((inst['cell'] for inst in info_list[1]
+                            if inst['lib'] == lib_name and inst['cell'] in unfinished))
+                unfinished[cell_name] = []
+                if deps:
+                    blocked[cell_name] = (info_list, deps)
+                    for child in deps:
+                        unfinished[child].append(cell_name)
+                else:
+                    ready.append(info_list)
+
+            # send ready cells to workers.  Cells without known children go to the least busy worker.
+            chunks = [[] for _ in range(num_workers)]  # type: List[List[List[Any]]]
+            refresh = [set() for _ in range(num_workers)]  # type: List[Set[Tuple[str, str, str]]]
+            waiting = deque()  # type: Deque[List[Any]]
+            while error is None and ready:
+                info_list = ready.popleft()
+                child_list = [(inst['lib'], inst['cell'], inst['view']) for inst in info_list[1]]
+                child_list = [key for key in child_list if key in self._cell_worker]
+                if child_list:
+                    num_children = [0] * num_workers
+                    for key in child_list:
+                        num_children[self._cell_worker[key]] += 1
+                    idx = max(range(num_workers), key=lambda i: (num_children[i], -len(pending[i])))
+                else:
+                    idx = min(range(num_workers), key=lambda i: (len(pending[i]), -len(chunks[i])))
+                if not chunks[idx] and len(pending[idx]) >= max_pending:
+                    # worker is busy, try again later.
+                    waiting.append(info_list)
+                    continue
+
+                chunks[idx].append(info_list)
+                refresh[idx].update((key for key in child_list if self._cell_worker[key] != idx))
+                self._cell_worker[(lib_name, info_list[0], view_name)] = idx
+                if len(chunks[idx]) == chunk_size:
+                    future = self._create_layout_async(idx, lib_name, view_name, via_tech, chunks[idx],
+                                                       refresh[idx])
+                    pending[idx].append(([val[0] for val in chunks[idx]], future, time.time()))
+                    chunks[idx] = []
+                    refresh[idx] = set()
+            for idx, chunk in enumerate(chunks):
+                if chunk:
+                    future = self._create_layout_async(idx, lib_name, view_name, via_tech, chunk, refresh[idx])
+                    pending[idx].append(([val[0] for val in chunk], future, time.time()))
+            waiting.extend(ready)
+            ready = waiting
+
+            if not any(pending):
+                break
+
+            # wait for any worker to finish a chunk.
+            for sock, _ in self._poller.poll():
+                idx = self._sock_table[sock]
+                self._workers[idx].recv_reply()
+                while pending[idx] and pending[idx][0][1].done():
+                    cell_names, future, start = pending[idx].popleft()
+                    last_future = future
+                    try:
+                        future.result()
+                    except VirtuosoException as ex:
+                        if error is None:
+                            error = ex
+                    cur_time = time.time()
+                    timing_list.append((cell_names, cur_time - start))
+                    num_done += len(cell_names)
+                    if debug:
+                        print('created layout %s on worker %d (%d cells done) in %.4g seconds' %
+                              (', '.join(cell_names), idx, num_done, cur_time - start))
+                    for cell_name in cell_names:
+                        for parent in unfinished.pop(cell_name):
+                            parent_info, deps = blocked[parent]
+                            deps.discard(cell_name)
+                            if not deps:
+                                del blocked[parent]
+                                ready.append(parent_info)
+
+        if error is not None:
+            raise error
+        return None if last_future is None else last_future.result()
+
+    def _create_layout_async(self, idx, lib_name, view_name, via_tech, layout_list, refresh_set):
+        # type: (int, str, str, str, List[List[Any]], Set[Tuple[str, str, str]]) -> SkillFuture
+        """Send a request to create the given layouts on the given worker.
+
+        Parameters
+        ----------
+        idx : int
+            the worker index.
+        lib_name : str
+            layout library name.
+        view_name : str
+            layout view name.
+        via_tech : str
+            via technology library name.
+        layout_list : List[List[Any]]
+            the layouts to create.
+        refresh_set : Set[Tuple[str, str, str]]
+            (lib, cell, view) of cellviews created by other workers.  These are purged from the
+            worker's memory first, so the worker reads them from disk.
+
+        Returns
+        -------
+        future : SkillFuture
+            the SkillFuture object used to obtain the result.
+        """
+        db = self._workers[idx]
+        lib_users = self._lib_users[lib_name]
+        if idx not in lib_users:
+            db.create_library(lib_name)
+            lib_users.add(idx)
+
+        cmd = 'create_layout( "%s" "%s" "%s" {layout_list} )' % (lib_name, view_name, via_tech)
+        in_files = {'layout_list': _format_layout_list(layout_list)}
+        if refresh_set:
+            cmd = 'progn( refresh_cellviews( {cell_view_list} ) %s )' % cmd
+            in_files['cell_view_list'] = sorted(refresh_set)
+        return db.eval_skill_async(cmd, input_files=in_files)
@@ -33,7 +33,9 @@ Client-side communication:
 
 the client will always send a request object, which is a python dictionary.
 This script processes the request and sends the appropriate commands to
-Virtuoso.
+Virtuoso.  Requests are processed in the order received.  If a request contains
+a 'req_id' entry, the same entry is added to its reply, so the client can keep
+multiple requests in flight.
 
 Virtuoso side communication:
 
@@ -50,11 +52,14 @@ from builtins import *
 
 import os
 import traceback
+from itertools import chain
+from typing import Any, Dict, Optional, Tuple, List, Sequence
 
 from jinja2 import Template
 
 import bag.io
 from .. import verification
+from .zmqwrapper import MessageDecodeError
 
 calibre_tmp = bag.io.read_resource(bag.__name__, os.path.join('virtuoso_files', 'calibreview_setup.pytemp'))
 
@@ -62,6 +67,9 @@ calibre_tmp = bag.io.read_resource(bag.__name__, os.path.join('virtuoso_files',
 def _object_to_skill_file_helper(py_obj, file_obj):
     """Recursive helper function for object_to_skill_file
 
+    This is the reference implementation of the skill file format.  object_to_skill_file() uses
+    :class:`SkillFileWriter`, which produces the same output much faster.
+
     Parameters
     ----------
     py_obj : any
@@ -103,6 +111,141 @@ def _object_to_skill_file_helper(py_obj, file_obj):
         raise Exception('Unsupported python data type: %s' % type(py_obj))
 
 
+class SkillFileWriter(object):
+    """Writes Python objects to files readable by Skill.
+
+    Produces the same output as _object_to_skill_file_helper(), but renders text into a buffer
+    that is written to file in large blocks.  Lists of floats, integers, or strings, and lists of
+    float lists (such as bounding boxes), are rendered with a single join instead of element by
+    element.
+
+    Parameters
+    ----------
+    file_obj : file
+        the file object to write to.  Must be created with bag.io
+        package so that encodings are handled correctly.
+    buf_size : int
+        number of buffered text fragments before writing to file.
+    """
+
+    def __init__(self, file_obj, buf_size=100000):
+        # type: (Any, int) -> None
+        self._file = file_obj
+        self._buf_size = buf_size
+        self._parts = []  # type: List[str]
+
+    def flush(self):
+        # type: () -> None
+        """Write all buffered text to file."""
+        if self._parts:
+            self._file.write(''.join(self._parts))
+            # clear in place, since callers hold references to the buffer.
+            del self._parts[:]
+
+    def write(self, py_obj):
+        # type: (Any) -> None
+        """Render the given object into the buffer.
+
+        Parameters
+        ----------
+        py_obj : any
+            the object to convert.
+        """
+        obj_type = type(py_obj)
+        if obj_type is list or obj_type is tuple:
+            self._write_list(py_obj)
+        elif obj_type is dict:
+            self._write_dict(py_obj)
+        else:
+            self._write_general(py_obj)
+
+    def _write_general(self, py_obj):
+        # type: (Any) -> None
+        """Render the given object, which may be raw bytes or a subclass of a supported type."""
+        parts = self._parts
+        # fix potential raw bytes
+        py_obj = bag.io.fix_string(py_obj)
+        if isinstance(py_obj, str):
+            parts.append(py_obj)
+        elif isinstance(py_obj, float):
+            parts.append('#float %f' % py_obj)
+        elif isinstance(py_obj, bool):
+            parts.append('#bool 1' if py_obj else '#bool 0')
+        elif isinstance(py_obj, int):
+            parts.append('#int %d' % py_obj)
+        elif isinstance(py_obj, list) or isinstance(py_obj, tuple):
+            self._write_list(py_obj)
+        elif isinstance(py_obj, dict):
+            self._write_dict(py_obj)
+        else:
+            raise Exception('Unsupported python data type: %s' % type(py_obj))
+
+    def _write_list(self, py_list):
+        # type: (Sequence[Any]) -> None
+        """Render the given list into the buffer."""
+        parts = self._parts
+        if py_list:
+            elem_types = set(map(type, py_list))
+            if len(elem_types) == 1:
+                elem_type = elem_types.pop()
+                if elem_type is float:
+                    parts.append('#list\n%s#end' % ''.join(['#float %f\n' % val for val in py_list]))
+                    return
+                if elem_type is int:
+                    parts.append('#list\n%s#end' % ''.join(['#int %d\n' % val for val in py_list]))
+                    return
+                if elem_type is str:
+                    parts.append('#list\n%s\n#end' % '\n'.join(py_list))
+                    return
+                if elem_type is list and set(map(type, chain.from_iterable(py_list))) == {float}:
+                    parts.append('#list\n%s#end' %
+                                 ''.join(['#list\n%s#end\n' % ''.join(['#float %f\n' % val for val in row])
+                                          for row in py_list]))
+                    return
+
+        parts.append('#list\n')
+        for val in py_list:
+            val_type = type(val)
+            if val_type is str:
+                parts.append(val)
+            elif val_type is float:
+                parts.append('#float %f' % val)
+            elif val_type is int:
+                parts.append('#int %d' % val)
+            elif val_type is list or val_type is tuple:
+                self._write_list(val)
+            elif val_type is dict:
+                self._write_dict(val)
+            else:
+                self._write_general(val)
+            parts.append('\n')
+            if len(parts) >= self._buf_size:
+                self.flush()
+        parts.append('#end')
+
+    def _write_dict(self, py_dict):
+        # type: (Dict[Any, Any]) -> None
+        """Render the given dictionary into the buffer as a disembodied property list."""
+        parts = self._parts
+        parts.append('#prop_list\n')
+        for key, val in py_dict.items():
+            val_type = type(val)
+            if val_type is str:
+                parts.append('%s\n%s\n' % (key, val))
+            elif val_type is float:
+                parts.append('%s\n#float %f\n' % (key, val))
+            elif val_type is int:
+                parts.append('%s\n#int %d\n' % (key, val))
+            else:
+                parts.append('{}\n'.format(key))
+                if val_type is list or val_type is tuple:
+                    self._write_list(val)
+                else:
+                    self.write(val)
+                parts.append('\n')
+        parts.append('#end')
+
+
 def object_to_skill_file(py_obj, file_obj):
     """Write the given python object to a file readable by Skill.
 
@@ -118,7 +261,9 @@ def object_to_skill_file(py_obj, file_obj):
         the file object to write to.  Must be created with bag.io
         package so that encodings are handled correctly.
     """
-    _object_to_skill_file_helper(py_obj, file_obj)
+    writer = SkillFileWriter(file_obj)
+    writer.write(py_obj)
+    writer.flush()
     file_obj.write('\n')
 
 
@@ -155,6 +300,12 @@ class SkillServer(object):
         self.checker = None  # type: verification.base.Checker
         self.calview_cell_map = None
         self.calview_name = None
+        # a request received while Virtuoso is busy, its sender, and its processed skill arguments.
+        self._next_request = None  # type: Optional[Tuple[Any, Tuple[bytes, str], Optional[Tuple[Optional[str], Optional[str], Optional[str]]]]]
+        # ID of the request being processed.
+        self._req_id = None  # type: Any
+        # address and codec name of the sender of the request being processed.
+        self._req_sender = None  # type: Optional[Tuple[bytes, str]]
 
         # create a directory for all temporary files
         self.dtmp = bag.io.make_temp_dir('skillTmp', parent_dir=tmpdir)
@@ -164,16 +315,33 @@ class SkillServer(object):
         """
         while not self.handler.is_closed():
             # check if socket received message
-            if self.handler.poll_for_read(5):
-                req = self.handler.recv_obj()
+            if self._next_request is not None or self.handler.poll_for_read(5):
+                if self._next_request is not None:
+                    req, self._req_sender, skill_args = self._next_request
+                    self._next_request = None
+                else:
+                    req, self._req_sender = self._recv_request()
+                    skill_args = None
+                self._req_id = req.get('req_id', None) if isinstance(req, dict) else None
                 if isinstance(req, dict) and 'type' in req:
                     if req['type'] == 'exit':
                         self.close()
+                    elif req['type'] == 'decode_error':
+                        self.send_reply(dict(type='error', data=req['data']))
+                    elif req['type'] == 'codec':
+                        self.handler.negotiate_codec(req, addr=self._req_sender[0],
+                                                     codec_name=self._req_sender[1])
                     elif req['type'] == 'skill':
-                        expr, out_file = self.process_skill_request(req)
-                        if expr is not None:
+                        if skill_args is None:
+                            skill_args = self._prepare_skill_request(req)
+                        expr, out_file, err_msg = skill_args
+                        if err_msg is not None:
+                            self.send_reply(dict(type='error', data=err_msg))
+                        else:
                             # send expression to virtuoso
                             self.send_skill(expr)
+                            # write input files of the next request while Virtuoso is busy.
+                            self._prefetch_request()
                             msg = self.recv_skill()
                             self.process_skill_result(msg, out_file)
                     elif req['type'] == 'init_checker':
@@ -184,10 +352,39 @@ class SkillServer(object):
                         self.process_rcx_request(req)
                     else:
                         msg = '*Error* bag server error: bag request:\n%s' % str(req)
-                        self.handler.send_obj(dict(type='error', data=msg))
+                        self.send_reply(dict(type='error', data=msg))
                 else:
                     msg = '*Error* bag server error: bag request:\n%s' % str(req)
-                    self.handler.send_obj(dict(type='error', data=msg))
+                    self.send_reply(dict(type='error', data=msg))
+
+    def _recv_request(self):
+        # type: () -> Tuple[Any, Tuple[bytes, str]]
+        """Receive the next request.
+
+        Returns the request, and the address and codec name of its sender, so the reply goes
+        to the right client even if other requests are received in the meantime.  If the
+        request cannot be decoded, returns a request of type 'decode_error', whose data is the
+        error message to send back.
+        """
+        try:
+            req = self.handler.recv_obj()
+        except MessageDecodeError as ex:
+            req = dict(type='decode_error', data='*Error* bag server error: %s' % ex)
+        return req, (self.handler.get_last_sender_addr(), self.handler.get_last_sender_codec())
+
+    def send_reply(self, obj):
+        # type: (Dict[str, Any]) -> None
+        """Send the reply of the current request, tagged with the request ID if it has one.
+
+        Parameters
+        ----------
+        obj : Dict[str, Any]
+            the reply object.
+        """
+        if self._req_id is not None:
+            obj['req_id'] = self._req_id
+        addr, codec_name = self._req_sender
+        self.handler.send_obj(obj, addr=addr, codec_name=codec_name)
 
     def send_skill(self, expr):
         """Sends expr to virtuoso for evaluation.
@@ -232,14 +429,40 @@ class SkillServer(object):
         out_file : str or None
             if not None, the result will be written to this file.
         """
+        expr, out_file, err_msg = self._prepare_skill_request(request)
+        if err_msg is not None:
+            self.send_reply(dict(type='error', data=err_msg))
+            return None, None
+        return expr, out_file
+
+    def _prepare_skill_request(self, request):
+        # type: (Dict[str, Any]) -> Tuple[Optional[str], Optional[str], Optional[str]]
+        """Create input/output files of the given skill request and returns the expression.
+
+        Same as process_skill_request(), but returns the error message instead of sending it,
+        so requests can be prepared ahead of time without changing the reply order.
+
+        Parameters
+        ----------
+        request : Dict[str, Any]
+            the request object.
+
+        Returns
+        -------
+        expr : Optional[str]
+            expression to be evaluated by Virtuoso.  None if an error occurred.
+        out_file : Optional[str]
+            if not None, the result will be written to this file.
+        err_msg : Optional[str]
+            the error message, None if no errors occurred.
+        """
         try:
             expr = request['expr']
             input_files = request['input_files'] or {}
             out_file = request['out_file']
         except KeyError as e:
             msg = '*Error* bag server error: %s' % str(e)
-            self.handler.send_obj(dict(type='error', data=msg))
-            return None, None
+            return None, None, msg
 
         fname_dict = {}
         # write input parameters to files
@@ -251,8 +474,7 @@ class SkillServer(object):
                 except Exception:
                     stack_trace = traceback.format_exc()
                     msg = '*Error* bag server error: \n%s' % stack_trace
-                    self.handler.send_obj(dict(type='error', data=msg))
-                    return None, None
+                    return None, None, msg
 
         # generate output file
         if out_file:
@@ -262,7 +484,17 @@ class SkillServer(object):
 
         # fill in parameters to expression
         expr = expr.format(**fname_dict)
-        return expr, out_file
+        return expr, out_file, None
+
+    def _prefetch_request(self):
+        # type: () -> None
+        """Receive the next request if available, and prepare it if it is a skill request."""
+        if self._next_request is None and self.handler.poll_for_read(0):
+            req, sender = self._recv_request()
+            skill_args = None
+            if isinstance(req, dict) and req.get('type') == 'skill':
+                skill_args = self._prepare_skill_request(req)
+            self._next_request = (req, sender, skill_args)
 
     def process_skill_result(self, msg, out_file=None):
         """Process the given skill output, then send result to socket.
@@ -277,7 +509,7 @@ class SkillServer(object):
         # read file if needed, and only if there are no errors.
         if msg.startswith('*Error*'):
             # an error occurred, forward error message directly
-            self.handler.send_obj(dict(type='error', data=msg))
+            self.send_reply(dict(type='error', data=msg))
         elif out_file:
             # read result from file.
             try:
@@ -287,10 +519,10 @@ class SkillServer(object):
                 stack_trace = traceback.format_exc()
                 msg = '*Error* error reading file:\n%s' % stack_trace
                 data = dict(type='error', data=msg)
-            self.handler.send_obj(data)
+            self.send_reply(data)
         else:
             # return output from virtuoso directly
-            self.handler.send_obj(dict(type='str', data=msg))
+            self.send_reply(dict(type='str', data=msg))
 
     def process_checker_request(self, req):
         """Process the given checker request."""
@@ -301,17 +533,17 @@ class SkillServer(object):
         except Exception:
             stack_trace = traceback.format_exc()
             msg = '*Error* error creating Checker: %s' % stack_trace
-            self.handler.send_obj(dict(type='error', data=msg))
+            self.send_reply(dict(type='error', data=msg))
             self.checker = None
 
         if self.checker is not None:
-            self.handler.send_obj(dict(type='str', data='done'))
+            self.send_reply(dict(type='str', data='done'))
 
     def process_lvs_request(self, req):
         """Process the given LVS request."""
         if self.checker is None:
             msg = '*Error* Checker is not initialized.'
-            self.handler.send_obj(dict(type='error', data=msg))
+            self.send_reply(dict(type='error', data=msg))
             return
 
         try:
@@ -323,24 +555,24 @@ class SkillServer(object):
         except KeyError:
             stack_trace = traceback.format_exc()
             msg = '*Error* malformed request: %s\nstack trace: \n%s' % (str(req), stack_trace)
-            self.handler.send_obj(dict(type='error', data=msg))
+            self.send_reply(dict(type='error', data=msg))
             return
 
         with bag.io.open_temp(prefix='lvsLog', delete=False, dir=self.dtmp) as logfile:
             log_fname = logfile.name
         try:
             result = self.checker.run_lvs(lib_name, cell_name, lay_view, sch_view, log_fname, lvs_params)
-            self.handler.send_obj(dict(type='tuple', data=(result, log_fname)))
+            self.send_reply(dict(type='tuple', data=(result, log_fname)))
         except Exception:
             stack_trace = traceback.format_exc()
             msg = '*Error* error running LVS:\n%s' % stack_trace
-            self.handler.send_obj(dict(type='error', data=msg))
+            self.send_reply(dict(type='error', data=msg))
 
     def process_rcx_request(self, req):
         """Process the given LVS request."""
         if self.checker is None:
             msg = '*Error* Checker is not initialized.'
-            self.handler.send_obj(dict(type='error', data=msg))
+            self.send_reply(dict(type='error', data=msg))
             return
 
         try:
@@ -351,7 +583,7 @@ class SkillServer(object):
             rcx_params = req['rcx_params']
         except KeyError:
             msg = '*Error* malformed request: %s' % str(req)
-            self.handler.send_obj(dict(type='error', data=msg))
+            self.send_reply(dict(type='error', data=msg))
             return
 
         with bag.io.open_temp(prefix='rcxLog', delete=False, dir=self.dtmp) as logfile:
@@ -362,11 +594,11 @@ class SkillServer(object):
         except Exception:
             stack_trace = traceback.format_exc()
             msg = '*Error* error running RCX:\n%s' % stack_trace
-            self.handler.send_obj(dict(type='error', data=msg))
+            self.send_reply(dict(type='error', data=msg))
             return
 
         if netlist is None:
-            self.handler.send_obj(dict(type='tuple', data=(False, log_fname)))
+            self.send_reply(dict(type='tuple', data=(False, log_fname)))
         else:
             # delete old calibre view
             cmd = 'delete_cellview( "%s" "%s" "%s" )' % (lib_name, cell_name, self.calview_name)
@@ -387,4 +619,4 @@ class SkillServer(object):
             cmd = 'mgc_rve_load_setup_file( "%s" )' % setup_file
             self.send_skill(cmd)
             self.recv_skill()
-            self.handler.send_obj(dict(type='tuple', data=(True, log_fname)))
+            self.send_reply(dict(type='tuple', data=(True, log_fname)))
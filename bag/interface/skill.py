@@ -31,8 +31,10 @@ from __future__ import (absolute_import, division,
 from builtins import *
 
 import os
+import time
+from collections import deque, OrderedDict
 import yaml
-from typing import List, Dict, Optional, Any, Tuple
+from typing import List, Dict, Optional, Any, Tuple, Iterable, Iterator, Deque, Callable
 
 from jinja2 import Template
 
@@ -113,6 +115,38 @@ def _handle_reply(reply):
         raise Exception('Unknown reply format: %s' % reply)
 
 
+def _format_layout_list(layout_list):
+    # type: (List[List[Any]]) -> List[List[Any]]
+    """Convert instance parameter dictionaries in the given layout list to pcell params list format."""
+    new_layout_list = []
+    for info_list in layout_list:
+        new_inst_list = []
+        for inst in info_list[1]:
+            if 'params' in inst:
+                inst = inst.copy()
+                inst['params'] = _dict_to_pcell_params(inst['params'])
+            new_inst_list.append(inst)
+
+        new_info_list = info_list[:]
+        new_info_list[1] = new_inst_list
+        new_layout_list.append(new_info_list)
+
+    return new_layout_list
+
+
+def _chunk_iter(obj_iter, chunk_size):
+    # type: (Iterable[Any], int) -> Iterator[List[Any]]
+    """Group objects of the given iterable into lists of at most chunk_size objects."""
+    chunk = []
+    for obj in obj_iter:
+        chunk.append(obj)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
 class VirtuosoException(Exception):
     """Exception raised when Virtuoso returns an error."""
 
@@ -120,6 +154,108 @@ class VirtuosoException(Exception):
         Exception.__init__(self, *args, **kwargs)
 
 
+def _parse_batch_result(content):
+    # type: (str) -> List[str]
+    """Parse the output file of eval_skill_batch.
+
+    Each result is written as a line containing the number of bytes in the result, followed
+    by the result and a newline.  Raises VirtuosoException if any expression failed.
+    """
+    data = bag.io.to_bytes(content)
+    results = []
+    idx = 0
+    while idx < len(data):
+        end = data.index(b'\n', idx)
+        start = end + 1
+        stop = start + int(data[idx:end])
+        results.append(bag.io.fix_string(data[start:stop]))
+        idx = stop + 1
+
+    for val in results:
+        if val.startswith('*Error*'):
+            raise VirtuosoException(val)
+    return results
+
+
+class SkillFuture(object):
+    """The result of a skill request that may not be available yet.
+
+    Replies are received by the :class:`SkillInterface` that sent the request, only when
+    the result of a pending request is needed.  Calling result() on this object receives
+    all replies up to and including the reply of this request.
+
+    Parameters
+    ----------
+    db : SkillInterface
+        the SkillInterface that sent the request.
+    req_id : int
+        the request ID.
+    post_fun : Optional[Callable[[Any], Any]]
+        if not None, this function is applied to the reply data to compute the result.
+    """
+
+    def __init__(self, db, req_id, post_fun=None):
+        # type: (SkillInterface, int, Optional[Callable[[Any], Any]]) -> None
+        self._db = db
+        self._req_id = req_id
+        self._post_fun = post_fun
+        self._reply = None  # type: Any
+        self._done = False
+        self._callbacks = []  # type: List[Callable[[SkillFuture], None]]
+
+    @property
+    def req_id(self):
+        # type: () -> int
+        """Returns the request ID."""
+        return self._req_id
+
+    def done(self):
+        # type: () -> bool
+        """Returns True if the reply of this request has been received."""
+        return self._done
+
+    def add_done_callback(self, fn):
+        # type: (Callable[[SkillFuture], None]) -> None
+        """Call the given function with this future when the reply is received.
+
+        If the reply has already been received, the function is called immediately.
+        """
+        if self._done:
+            fn(self)
+        else:
+            self._callbacks.append(fn)
+
+    def set_reply(self, reply):
+        # type: (Any) -> None
+        """Set the reply of this request.  Should only be called by SkillInterface."""
+        self._reply = reply
+        self._done = True
+        for fn in self._callbacks:
+            fn(self)
+        self._callbacks = []
+
+    def result(self):
+        # type: () -> Any
+        """Wait for the reply of this request, then returns the result.
+
+        Returns
+        -------
+        result : Any
+            the request result.
+
+        Raises
+        ------
+        :class: `.VirtuosoException` :
+            if virtuoso encounters errors while evaluating the expression.
+        """
+        while not self._done:
+            self._db.recv_reply()
+        ans = _handle_reply(self._reply)
+        if self._post_fun is not None:
+            ans = self._post_fun(ans)
+        return ans
+
+
 class SkillInterface(DbAccess):
     """Skill interface between bag and Virtuoso.
 
@@ -141,13 +277,54 @@ class SkillInterface(DbAccess):
         """
         DbAccess.__init__(self, tmp_dir, db_config)
         self.handler = dealer
+        self._next_req_id = 0
+        self._pending = OrderedDict()  # type: Dict[int, SkillFuture]
+        self._layout_timing = []  # type: List[Tuple[List[str], float]]
 
     def close(self):
         """Terminate the database server gracefully.
         """
+        self.wait_all()
         self.handler.send_obj(dict(type='exit'))
         self.handler.close()
 
+    @property
+    def num_pending(self):
+        # type: () -> int
+        """Returns the number of requests sent whose replies are not received yet."""
+        return len(self._pending)
+
+    @property
+    def layout_timing(self):
+        # type: () -> List[Tuple[List[str], float]]
+        """Returns the cell names and creation time in seconds of each chunk of the last instantiate_layout()."""
+        return self._layout_timing
+
+    def recv_reply(self):
+        # type: () -> None
+        """Receive the next reply from the server and set the result of its request."""
+        if not self._pending:
+            raise Exception('No pending skill requests.')
+        reply = self.handler.recv_obj()
+        req_id = reply.pop('req_id', None) if isinstance(reply, dict) else None
+        if req_id is None:
+            # server does not support request IDs.  Replies are always in request order.
+            req_id = next(iter(self._pending))
+        try:
+            future = self._pending.pop(req_id)
+        except KeyError:
+            raise Exception('Received reply of unknown request %s: %s' % (req_id, reply))
+        future.set_reply(reply)
+
+    def wait_all(self):
+        # type: () -> None
+        """Receive replies of all pending requests.
+
+        Results and errors can still be obtained from the corresponding SkillFuture objects.
+        """
+        while self._pending:
+            self.recv_reply()
+
     def _eval_skill(self, expr, input_files=None, out_file=None):
         # type: (str, Optional[Dict[str, Any]], Optional[str]) -> str
         """Send a request to evaluate the given skill expression.
@@ -190,16 +367,99 @@ class SkillInterface(DbAccess):
         :class: `.VirtuosoException` :
             if virtuoso encounters errors while evaluating the expression.
         """
+        return self.eval_skill_async(expr, input_files=input_files, out_file=out_file).result()
+
+    def eval_skill_async(self, expr, input_files=None, out_file=None, post_fun=None):
+        # type: (str, Optional[Dict[str, Any]], Optional[str], Optional[Callable[[Any], Any]]) -> SkillFuture
+        """Send a request to evaluate the given skill expression without waiting for the result.
+
+        Multiple requests can be in flight at the same time; Virtuoso evaluates them in the
+        order sent.  If the number of pending requests reaches the socket pipeline size, this
+        method waits for the oldest reply first.  See _eval_skill() for a description of the
+        input_files and out_file parameters.
+
+        Parameters
+        ----------
+        expr : str
+            the skill expression to evaluate.
+        input_files : Optional[Dict[str, Any]]
+            A dictionary of input files content.
+        out_file : Optional[str]
+            the output file name argument in expr.
+        post_fun : Optional[Callable[[Any], Any]]
+            if not None, this function is applied to the reply data to compute the result.
+
+        Returns
+        -------
+        future : SkillFuture
+            the SkillFuture object used to obtain the result.
+        """
+        while len(self._pending) >= self.handler.pipeline:
+            self.recv_reply()
+
+        req_id = self._next_req_id
+        self._next_req_id += 1
         request = dict(
             type='skill',
             expr=expr,
             input_files=input_files,
             out_file=out_file,
+            req_id=req_id,
         )
 
         self.handler.send_obj(request)
-        reply = self.handler.recv_obj()
-        return _handle_reply(reply)
+        future = SkillFuture(self, req_id, post_fun=post_fun)
+        self._pending[req_id] = future
+        return future
+
+    def eval_skill_batch_async(self, expr_list):
+        # type: (List[str]) -> SkillFuture
+        """Send a request to evaluate all given skill expressions in one Virtuoso evaluation.
+
+        The expressions are evaluated in order.  An error in one expression does not stop
+        evaluation of the others.  The result of the returned SkillFuture is the list of
+        string representations of the results, and a VirtuosoException is raised if any
+        expression failed.
+
+        Parameters
+        ----------
+        expr_list : List[str]
+            list of single-line skill expressions.
+
+        Returns
+        -------
+        future : SkillFuture
+            the SkillFuture object used to obtain the results.
+        """
+        for expr in expr_list:
+            if '\n' in expr:
+                raise ValueError('Batch skill expressions cannot contain newlines: %s' % expr)
+        return self.eval_skill_async('eval_skill_batch( {expr_list} {result_file} )',
+                                     input_files={'expr_list': list(expr_list)},
+                                     out_file='result_file', post_fun=_parse_batch_result)
+
+    def eval_skill_batch(self, expr_list):
+        # type: (List[str]) -> List[str]
+        """Evaluate all given skill expressions in one Virtuoso evaluation.
+
+        See eval_skill_batch_async() for details.
+
+        Parameters
+        ----------
+        expr_list : List[str]
+            list of single-line skill expressions.
+
+        Returns
+        -------
+        results : List[str]
+            string representations of the results.
+
+        Raises
+        ------
+        :class: `.VirtuosoException` :
+            if virtuoso encounters errors while evaluating any expression.
+        """
+        return self.eval_skill_batch_async(expr_list).result()
 
     def parse_schematic_template(self, lib_name, cell_name):
         """Parse the given schematic template.
@@ -457,9 +717,17 @@ class SkillInterface(DbAccess):
         in_files = {'params': param_list, 'pin_mapping': list(pin_mapping.items())}
         return self._eval_skill(cmd, input_files=in_files)
 
-    def instantiate_layout(self, lib_name, view_name, via_tech, layout_list):
+    def instantiate_layout(self, lib_name, view_name, via_tech, layout_list, chunk_size=1,
+                           max_pending=2, debug=False):
+        # type: (str, str, str, Iterable[List[Any]], int, int, bool) -> Optional[str]
         """Create a batch of layouts.
 
+        Layouts are sent to Virtuoso in chunks of chunk_size cells, in the given order.
+        Up to max_pending chunks are sent before waiting for results, so the next chunk is
+        converted and serialized while Virtuoso creates the current one.  layout_list can
+        be a generator, in which case only the pending chunks are kept in memory.  The
+        creation time of each chunk is available from the layout_timing property afterwards.
+
         Parameters
         ----------
         lib_name : str
@@ -468,29 +736,71 @@ class SkillInterface(DbAccess):
             layout view name.
         via_tech : str
             via technology library name.
-        layout_list : list[any]
-            a list of layouts to create
+        layout_list : Iterable[List[Any]]
+            an iterable of layouts to create.  Children must come before parents.
+        chunk_size : int
+            number of cells to create per skill request.
+        max_pending : int
+            maximum number of chunks sent to Virtuoso but not yet created.
+        debug : bool
+            True to print progress and timing of each chunk.
+
+        Returns
+        -------
+        result : Optional[str]
+            a string representation of the result of the last skill request, or None if
+            layout_list is empty.
         """
+        if chunk_size < 1 or max_pending < 1:
+            raise ValueError('chunk_size and max_pending must be positive.')
+
         # create library in case it doesn't exist
         self.create_library(lib_name)
 
-        # convert parameter dictionary to pcell params list format
-        new_layout_list = []
-        for info_list in layout_list:
-            new_inst_list = []
-            for inst in info_list[1]:
-                if 'params' in inst:
-                    inst = inst.copy()
-                    inst['params'] = _dict_to_pcell_params(inst['params'])
-                new_inst_list.append(inst)
-
-            new_info_list = info_list[:]
-            new_info_list[1] = new_inst_list
-            new_layout_list.append(new_info_list)
-
         cmd = 'create_layout( "%s" "%s" "%s" {layout_list} )' % (lib_name, view_name, via_tech)
-        in_files = {'layout_list': new_layout_list}
-        return self._eval_skill(cmd, input_files=in_files)
+        pending = deque()  # type: Deque[Tuple[List[str], SkillFuture]]
+        timing_list = self._layout_timing = []  # type: List[Tuple[List[str], float]]
+        future = None  # type: Optional[SkillFuture]
+        num_done = 0
+        last_time = time.time()
+        error = None
+        for chunk in _chunk_iter(layout_list, chunk_size):
+            future = self.eval_skill_async(cmd, input_files={'layout_list': _format_layout_list(chunk)})
+            pending.append(([info_list[0] for info_list in chunk], future))
+            # stop sending new chunks if an error occurred
+            while pending and (len(pending) >= max_pending or error is not None):
+                num_done, last_time, error = self._recv_layout_reply(pending, timing_list, num_done,
+                                                                     last_time, error, debug)
+            if error is not None:
+                break
+
+        while pending:
+            num_done, last_time, error = self._recv_layout_reply(pending, timing_list, num_done,
+                                                                 last_time, error, debug)
+        if error is not None:
+            raise error
+        return None if future is None else future.result()
+
+    def _recv_layout_reply(self, pending, timing_list, num_done, last_time, error, debug):
+        # type: (Deque[Tuple[List[str], SkillFuture]], List[Tuple[List[str], float]], int, float, Optional[Exception], bool) -> Tuple[int, float, Optional[Exception]]
+        """Wait for the result of the oldest pending layout chunk and record its timing.
+
+        All pending chunks are waited on even if an error occurred, so the first error
+        is returned instead of raised.
+        """
+        cell_names, future = pending.popleft()
+        try:
+            future.result()
+        except VirtuosoException as ex:
+            if error is None:
+                error = ex
+        cur_time = time.time()
+        timing_list.append((cell_names, cur_time - last_time))
+        num_done += len(cell_names)
+        if debug:
+            print('created layout %s (%d cells done) in %.4g seconds' %
+                  (', '.join(cell_names), num_done, cur_time - last_time))
+        return num_done, cur_time, error
 
     def release_write_locks(self, lib_name, cell_view_list):
         """Release write locks from all the given cells.
@@ -29,14 +29,196 @@ from __future__ import (absolute_import, division,
 from builtins import *
 
 import os
+import sys
 import zlib
 import pprint
+import pickle
+import io
+from typing import Any, Optional, List, Tuple, Dict
 
+import numpy as np
 import yaml
 import zmq
 
 import bag.io
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# message header flag indicating the payload is compressed.
+_COMPRESS_FLAG = 0x80
+
+# YAML loader of received messages.  FullLoader also handles python/tuple tags, and is required
+# by PyYAML 6.  Older PyYAML versions do not have it.
+_YamlLoader = getattr(yaml, 'FullLoader', yaml.Loader)
+
+
+class MessageDecodeError(ValueError):
+    """Raised when a received message cannot be decoded."""
+    pass
+
+
+class _YamlCodec(object):
+    """The YAML message codec.  Slow, but works with any object YAML can represent."""
+    name = 'yaml'
+    codec_id = 1
+
+    @staticmethod
+    def encode(obj):
+        # type: (Any) -> bytes
+        return bag.io.to_bytes(yaml.dump(obj))
+
+    @staticmethod
+    def decode(data):
+        # type: (bytes) -> Any
+        return yaml.load(bag.io.fix_string(data), Loader=_YamlLoader)
+
+
+class _RestrictedUnpickler(pickle.Unpickler):
+    """An Unpickler that only allows a whitelist of plain data classes."""
+
+    whitelist = {
+        ('builtins', 'set'), ('builtins', 'frozenset'), ('builtins', 'complex'),
+        ('__builtin__', 'set'), ('__builtin__', 'frozenset'), ('__builtin__', 'complex'),
+        ('copy_reg', '_reconstructor'), ('copyreg', '_reconstructor'),
+        ('__builtin__', 'object'), ('__builtin__', 'unicode'), ('__builtin__', 'str'),
+        ('__builtin__', 'long'), ('__builtin__', 'list'), ('__builtin__', 'dict'),
+        ('future.types.newstr', 'newstr'), ('future.types.newbytes', 'newbytes'),
+        ('future.types.newint', 'newint'), ('future.types.newlist', 'newlist'),
+        ('future.types.newdict', 'newdict'),
+    }
+
+    def find_class(self, module, name):
+        if (module, name) in self.whitelist:
+            return pickle.Unpickler.find_class(self, module, name)
+        raise pickle.UnpicklingError('class %s.%s is not allowed in messages.' % (module, name))
+
+
+def _to_builtin(obj):
+    # type: (Any) -> Any
+    """Convert numpy scalars and arrays in the given object to built-in Python types."""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, dict):
+        return {_to_builtin(key): _to_builtin(val) for key, val in obj.items()}
+    if isinstance(obj, list):
+        return [_to_builtin(val) for val in obj]
+    if isinstance(obj, tuple):
+        return tuple((_to_builtin(val) for val in obj))
+    if isinstance(obj, (set, frozenset)):
+        return obj.__class__((_to_builtin(val) for val in obj))
+    return obj
+
+
+class _PickleCodec(object):
+    """The pickle message codec.  Only plain data types can be unpickled.
+
+    numpy scalars and arrays are sent as built-in Python types, as the receiver does not
+    unpickle numpy objects.
+    """
+    name = 'pickle'
+    codec_id = 2
+
+    @staticmethod
+    def encode(obj):
+        # type: (Any) -> bytes
+        # protocol 2 is supported by both Python 2 and 3
+        return pickle.dumps(_to_builtin(obj), 2)
+
+    @staticmethod
+    def decode(data):
+        # type: (bytes) -> Any
+        return _RestrictedUnpickler(io.BytesIO(data)).load()
+
+
+class _MsgpackCodec(object):
+    """The msgpack message codec.  Tuples are received as lists."""
+    name = 'msgpack'
+    codec_id = 3
+
+    @staticmethod
+    def encode(obj):
+        # type: (Any) -> bytes
+        return msgpack.packb(obj, use_bin_type=True)
+
+    @staticmethod
+    def decode(data):
+        # type: (bytes) -> Any
+        return msgpack.unpackb(data, raw=False)
+
+
+_codec_list = [_MsgpackCodec, _PickleCodec, _YamlCodec]
+_codec_id_table = {codec.codec_id: codec for codec in _codec_list}
+_codec_name_table = {codec.name: codec for codec in _codec_list}
+
+
+def get_available_codecs():
+    # type: () -> List[str]
+    """Returns the names of all message codecs available in this Python environment, fastest first.
+
+    Returns
+    -------
+    codec_list : List[str]
+        list of available codec names.
+    """
+    return [codec.name for codec in _codec_list if codec is not _MsgpackCodec or msgpack is not None]
+
+
+def _encode_msg(obj, codec, compress_threshold):
+    # type: (Any, Any, int) -> bytes
+    """Serialize the given object into a message.
+
+    if codec is None, the legacy message format (compressed YAML with no header) is used.  Otherwise,
+    the message starts with a one byte header containing the codec ID and the compression flag.
+    Objects the given codec cannot represent are sent with YAML instead.
+    """
+    if codec is None:
+        return zlib.compress(_YamlCodec.encode(obj))
+
+    try:
+        data = codec.encode(obj)
+    except Exception:
+        if codec is _YamlCodec:
+            raise
+        codec = _YamlCodec
+        data = codec.encode(obj)
+
+    header = codec.codec_id
+    if len(data) > compress_threshold:
+        header |= _COMPRESS_FLAG
+        data = zlib.compress(data)
+    return bytes(bytearray([header])) + data
+
+
+def _get_msg_codec(data):
+    # type: (bytes) -> Any
+    """Returns the codec of the given message, None for legacy messages."""
+    if not data:
+        return None
+    # zlib streams of legacy messages never start with a valid header.
+    return _codec_id_table.get(bytearray(data[:1])[0] & ~_COMPRESS_FLAG, None)
+
+
+def _decode_msg(data):
+    # type: (bytes) -> Tuple[Any, Any]
+    """Deserialize the given message.
+
+    Returns the received object and its codec.  The codec is None for legacy messages.
+    """
+    codec = _get_msg_codec(data)
+    if codec is None:
+        return _YamlCodec.decode(zlib.decompress(data)), None
+
+    header = bytearray(data[:1])[0]
+    data = data[1:]
+    if header & _COMPRESS_FLAG:
+        data = zlib.decompress(data)
+    return codec.decode(data), codec
+
 
 class ZMQDealer(object):
     """A class that interacts with a ZMQ dealer socket.
@@ -56,20 +238,40 @@ class ZMQDealer(object):
         the host to connect to.
     log_file : str or None
         the log file.  None to disable logging.
+    codecs : Optional[List[str]]
+        message codec names in order of preference.  The codec is negotiated with the
+        server before the first message is sent, so creating a dealer never waits for
+        the server.  If None, use all available codecs, fastest first.  YAML is always
+        used as the fallback.
+    compress_threshold : int
+        messages larger than this many bytes are compressed.
+    codec_timeout : int
+        time in milliseconds to wait for the reply of the codec negotiation.  If reached, the
+        legacy message format is used.
     """
 
-    def __init__(self, port, pipeline=100, host='localhost', log_file=None):
+    def __init__(self, port, pipeline=100, host='localhost', log_file=None, codecs=None,
+                 compress_threshold=4096, codec_timeout=10000):
         """Create a new ZMQDealer object.
         """
         context = zmq.Context.instance()
         # noinspection PyUnresolvedReferences
         self.socket = context.socket(zmq.DEALER)
         self.socket.hwm = pipeline
+        self.pipeline = pipeline
         self.socket.connect('tcp://%s:%d' % (host, port))
         self._log_file = log_file
         self.poller = zmq.Poller()
         # noinspection PyUnresolvedReferences
         self.poller.register(self.socket, zmq.POLLIN)
+        self._compress_threshold = compress_threshold
+        # use legacy message format until a codec is negotiated
+        self._codec = None
+        self._codec_pref = codecs
+        self._codec_timeout = codec_timeout
+        self._negotiated = False
+        # True if the codec negotiation timed out, so its late reply must be discarded.
+        self._discard_codec_reply = False
 
         if self._log_file is not None:
             self._log_file = os.path.abspath(self._log_file)
@@ -81,6 +283,52 @@ class ZMQDealer(object):
             if os.path.exists(self._log_file):
                 os.remove(self._log_file)
 
+    @property
+    def codec(self):
+        # type: () -> str
+        """Returns the name of the message codec in use.  'yaml' before negotiation."""
+        return 'yaml' if self._codec is None else self._codec.name
+
+    def negotiate_codec(self, codecs=None):
+        # type: (Optional[List[str]]) -> str
+        """Negotiate the message codec with the server.
+
+        The codec request is sent in the legacy message format, so servers that do not support
+        codec negotiation reply with an error, and the legacy format is kept.  The legacy format
+        is also kept if the server does not reply within the codec timeout.  This method must
+        be called when no other requests are pending.
+
+        Parameters
+        ----------
+        codecs : Optional[List[str]]
+            codec names in order of preference.  If None, use all available codecs.
+
+        Returns
+        -------
+        codec : str
+            the name of the codec in use.
+        """
+        avail_codecs = get_available_codecs()
+        if codecs is None:
+            codecs = avail_codecs
+        else:
+            for name in codecs:
+                if name not in _codec_name_table:
+                    raise ValueError('Unknown message codec: %s' % name)
+            codecs = [name for name in codecs if name in avail_codecs]
+
+        self._negotiated = True
+        self._codec = None
+        if codecs and codecs != ['yaml']:
+            self.send_obj(dict(type='codec', codecs=codecs, py_version=sys.version_info[0]))
+            reply = self.recv_obj(timeout=self._codec_timeout)
+            if reply is None:
+                self._discard_codec_reply = True
+            elif isinstance(reply, dict) and reply.get('type') == 'codec':
+                self._codec = _codec_name_table[reply['data']]
+        self.log_msg('using message codec: %s' % self.codec)
+        return self.codec
+
     def log_msg(self, msg):
         """Log the given message"""
         if self._log_file is not None:
@@ -97,20 +345,21 @@ class ZMQDealer(object):
         self.socket.close()
 
     def send_obj(self, obj):
-        """Sends a python object using pickle serialization and zlib compression.
+        """Sends a python object using the negotiated codec.
 
         Parameters
         ----------
         obj : any
             the object to send.
         """
-        p = bag.io.to_bytes(yaml.dump(obj))
-        z = zlib.compress(p)
+        if not self._negotiated:
+            self.negotiate_codec(self._codec_pref)
+        z = _encode_msg(obj, self._codec, self._compress_threshold)
         self.log_obj('sending data:', obj)
         self.socket.send(z)
 
     def recv_obj(self, timeout=None, enable_cancel=False):
-        """Receive a python object, serialized with pickle and compressed with zlib.
+        """Receive a python object.
 
         Parameters
         ----------
@@ -140,9 +389,13 @@ class ZMQDealer(object):
 
         if events:
             data = self.socket.recv()
-            z = bag.io.fix_string(zlib.decompress(data))
-            obj = yaml.load(z)
+            obj, _ = _decode_msg(data)
             self.log_obj('received data:', obj)
+            if self._discard_codec_reply:
+                # the server replies in request order, so this is the late reply of the timed out
+                # codec negotiation.
+                self._discard_codec_reply = False
+                return self.recv_obj(timeout=timeout, enable_cancel=enable_cancel)
             return obj
         else:
             self.log_msg('timeout with %d ms reached.' % timeout)
@@ -182,9 +435,15 @@ class ZMQRouter(object):
         transfer performance.
     log_file : str or None
         the log file.  None to disable logging.
+    codecs : Optional[List[str]]
+        message codec names this router accepts during codec negotiation.  If None, accept
+        all available codecs.
+    compress_threshold : int
+        messages larger than this many bytes are compressed.
     """
 
-    def __init__(self, port=None, min_port=5000, max_port=9999, pipeline=100, log_file=None):
+    def __init__(self, port=None, min_port=5000, max_port=9999, pipeline=100, log_file=None,
+                 codecs=None, compress_threshold=4096):
         """Create a new ZMQDealer object.
         """
         context = zmq.Context.instance()
@@ -198,6 +457,11 @@ class ZMQRouter(object):
             self.port = self.socket.bind_to_random_port('tcp://*', min_port=min_port, max_port=max_port)
         self.addr = None
         self._log_file = log_file
+        avail_codecs = get_available_codecs()
+        self._codecs = avail_codecs if codecs is None else [name for name in codecs if name in avail_codecs]
+        self._compress_threshold = compress_threshold
+        # replies to each address use the codec of its last message.
+        self._addr_codec = {}  # type: Dict[bytes, Any]
 
         if self._log_file is not None:
             self._log_file = os.path.abspath(self._log_file)
@@ -250,8 +514,8 @@ class ZMQRouter(object):
             self.log_msg('sending message:\n%s' % msg)
             self.socket.send_multipart([addr, msg])
 
-    def send_obj(self, obj, addr=None):
-        """Sends a python object using pickle serialization and zlib compression.
+    def send_obj(self, obj, addr=None, codec_name=None):
+        """Sends a python object using the codec of the receiver's last message.
 
         Parameters
         ----------
@@ -259,17 +523,50 @@ class ZMQRouter(object):
             the object to send.
         addr : str or None
             the address to send the object to.  If None, send to last sender.
+        codec_name : str or None
+            the codec name, as returned by get_last_sender_codec().  If None, use the codec of
+            the receiver's last message.
         """
         addr = addr or self.addr
         if addr is None:
             warn_msg = '*WARNING* No receiver address specified.  Message not sent:'
             self.log_obj(warn_msg, obj)
         else:
-            p = bag.io.to_bytes(yaml.dump(obj))
-            z = zlib.compress(p)
+            if codec_name is None:
+                codec = self._addr_codec.get(addr, None)
+            else:
+                codec = _codec_name_table.get(codec_name, None)
+            z = _encode_msg(obj, codec, self._compress_threshold)
             self.log_obj('sending data:', obj)
             self.socket.send_multipart([addr, z])
 
+    def negotiate_codec(self, request, addr=None, codec_name=None):
+        # type: (Dict[str, Any], Optional[bytes], Optional[str]) -> None
+        """Reply to the given codec negotiation request.
+
+        The first codec in the request supported by this router is chosen.  YAML is chosen if
+        no codecs match.  Pickle is only chosen if both ends run the same major Python version.
+
+        Parameters
+        ----------
+        request : Dict[str, Any]
+            the codec negotiation request.
+        addr : Optional[bytes]
+            the address of the sender of the request.  If None, reply to the last sender.
+        codec_name : Optional[str]
+            the codec of the request, as returned by get_last_sender_codec().  If None, use the
+            codec of the sender's last message.
+        """
+        reply_codec = codec_name
+        same_py = request.get('py_version', None) == sys.version_info[0]
+        codec_name = 'yaml'
+        for name in request.get('codecs', []):
+            if name in self._codecs and (same_py or name != 'pickle'):
+                codec_name = name
+                break
+        self.log_msg('using message codec: %s' % codec_name)
+        self.send_obj(dict(type='codec', data=codec_name), addr=addr, codec_name=reply_codec)
+
     def poll_for_read(self, timeout):
         """Poll this socket for given timeout for read event.
 
@@ -286,17 +583,29 @@ class ZMQRouter(object):
         return self.socket.poll(timeout=timeout)
 
     def recv_obj(self):
-        """Receive a python object, serialized with pickle and compressed with zlib.
+        """Receive a python object.
+
+        If the message cannot be decoded, the sender address is still updated, so an error
+        reply can be sent.
 
         Returns
         -------
         obj : any
             the received object.
+
+        Raises
+        ------
+        MessageDecodeError
+            if the message cannot be decoded.
         """
         self.addr, data = self.socket.recv_multipart()
 
-        z = bag.io.fix_string(zlib.decompress(data))
-        obj = yaml.load(z)
+        try:
+            obj, self._addr_codec[self.addr] = _decode_msg(data)
+        except Exception as ex:
+            self._addr_codec[self.addr] = _get_msg_codec(data)
+            self.log_msg('cannot decode message: %s' % ex)
+            raise MessageDecodeError('cannot decode message: %s' % ex)
         self.log_obj('received data:', obj)
         return obj
 
@@ -309,3 +618,15 @@ class ZMQRouter(object):
             the last sender address
         """
         return self.addr
+
+    def get_last_sender_codec(self):
+        # type: () -> str
+        """Returns the codec name of the last received message.
+
+        Returns
+        -------
+        codec_name : str
+            the codec name, 'legacy' for the legacy message format.
+        """
+        codec = self._addr_codec.get(self.addr, None)
+        return 'legacy' if codec is None else codec.name
@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+########################################################################################################################
+#
+# Copyright (c) 2014, Regents of the University of California
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+#   disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+#    following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+########################################################################################################################
+
+
+"""This module defines TemplateCache, a persistent on-disk cache of finalized layout templates.
+"""
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+# noinspection PyUnresolvedReferences,PyCompatibility
+from builtins import *
+
+import os
+import io
+import inspect
+import pickle
+import tempfile
+from typing import Any, Dict, Optional, Callable, Tuple, Type, List
+
+from bag.util.digest import compute_digest
+from .routing import RoutingGrid
+
+
+def to_stable_str(val):
+    # type: (Any) -> str
+    """Returns a string representation of the given object that does not depend on dictionary/set ordering.
+
+    Parameters
+    ----------
+    val : Any
+        the object to convert.
+
+    Returns
+    -------
+    ans : str
+        the string representation.
+    """
+    if isinstance(val, dict):
+        items = sorted(((to_stable_str(k), to_stable_str(v)) for k, v in val.items()))
+        return '{%s}' % ','.join(('%s:%s' % item for item in items))
+    elif isinstance(val, list) or isinstance(val, tuple):
+        return '[%s]' % ','.join((to_stable_str(item) for item in val))
+    elif isinstance(val, set) or isinstance(val, frozenset):
+        return '{%s}' % ','.join(sorted((to_stable_str(item) for item in val)))
+    elif hasattr(val, 'tolist'):
+        # numpy arrays and scalars
+        return to_stable_str(val.tolist())
+    return repr(val)
+
+
+class _HookPickler(pickle.Pickler):
+    """A Pickler that delegates persistent ID computation to the given function."""
+
+    def __init__(self, f, pid_fun):
+        # type: (Any, Callable[[Any], Any]) -> None
+        pickle.Pickler.__init__(self, f, pickle.HIGHEST_PROTOCOL)
+        self._pid_fun = pid_fun
+
+    def persistent_id(self, obj):
+        return self._pid_fun(obj)
+
+
+class _HookUnpickler(pickle.Unpickler):
+    """An Unpickler that delegates persistent object lookup to the given function."""
+
+    def __init__(self, f, load_fun):
+        # type: (Any, Callable[[Any], Any]) -> None
+        pickle.Unpickler.__init__(self, f)
+        self._load_fun = load_fun
+
+    def persistent_load(self, pid):
+        return self._load_fun(pid)
+
+
+def pickle_dumps(obj, pid_fun):
+    # type: (Any, Callable[[Any], Any]) -> bytes
+    """Serialize the given object to bytes with the given persistent ID function.
+
+    Parameters
+    ----------
+    obj : Any
+        the object to serialize.
+    pid_fun : Callable[[Any], Any]
+        the persistent ID function.
+
+    Returns
+    -------
+    data : bytes
+        the serialized data.
+    """
+    buf = io.BytesIO()
+    _HookPickler(buf, pid_fun).dump(obj)
+    return buf.getvalue()
+
+
+def pickle_loads(data, load_fun):
+    # type: (bytes, Callable[[Any], Any]) -> Any
+    """Deserialize an object from bytes with the given persistent object lookup function.
+
+    Parameters
+    ----------
+    data : bytes
+        the serialized data.
+    load_fun : Callable[[Any], Any]
+        the persistent object lookup function.
+
+    Returns
+    -------
+    obj : Any
+        the deserialized object.
+    """
+    return _HookUnpickler(io.BytesIO(data), load_fun).load()
+
+
+class TemplateCache(object):
+    """A persistent on-disk cache of finalized layout templates.
+
+    Each cache entry is stored in its own file, named by a cache key computed from the template
+    unique key, the source code of the template class hierarchy, and the routing grid/technology
+    configuration.  Changing any of these results in a different cache key, so stale entries are
+    never loaded.  Note that changes to code outside of the template class hierarchy (such as
+    helper functions) are not detected; call clear() if such code changes.
+
+    Each entry file contains two pickled objects: a header object used to reconstruct the template
+    instance, followed by the template state.  Both are pickled with persistent ID hooks so that
+    references to shared objects (template database, technology information, other templates) are
+    stored by name instead of by value.
+
+    Parameters
+    ----------
+    cache_dir : str
+        the cache directory.  Will be created if it does not exist.
+    """
+
+    ext = '.pickle'
+    # extension of partially written entries, so they are never listed as cache entries.
+    tmp_ext = '.tmp'
+
+    def __init__(self, cache_dir):
+        # type: (str) -> None
+        cache_dir = os.path.abspath(os.path.expandvars(cache_dir))
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+        self._cache_dir = cache_dir
+        self._cls_digest = {}  # type: Dict[Type, str]
+        self._tech_digest = {}  # type: Dict[int, Tuple[Any, str]]
+
+    @property
+    def cache_dir(self):
+        # type: () -> str
+        """Returns the cache directory."""
+        return self._cache_dir
+
+    def get_class_digest(self, temp_cls):
+        # type: (Type) -> str
+        """Returns the digest of the source code of the given class and all its base classes.
+
+        Parameters
+        ----------
+        temp_cls : Type
+            the class object.
+
+        Returns
+        -------
+        digest : str
+            the source code digest.
+        """
+        if temp_cls not in self._cls_digest:
+            src_list = []
+            for cls in temp_cls.__mro__:
+                if cls.__module__ in ('builtins', '__builtin__', 'future.types.newobject'):
+                    continue
+                try:
+                    src_list.append(inspect.getsource(cls))
+                except (IOError, TypeError):
+                    # source not available, fall back to qualified name
+                    src_list.append('%s.%s' % (cls.__module__, cls.__name__))
+            self._cls_digest[temp_cls] = compute_digest(src_list)
+
+        return self._cls_digest[temp_cls]
+
+    def get_grid_digest(self, grid):
+        # type: (RoutingGrid) -> str
+        """Returns the digest of the given routing grid and its technology configuration.
+
+        Parameters
+        ----------
+        grid : RoutingGrid
+            the RoutingGrid object.
+
+        Returns
+        -------
+        digest : str
+            the routing grid configuration digest.
+        """
+        tech_info = grid.tech_info
+        tech_id = id(tech_info)
+        # keep a reference to tech_info so its id cannot be reused
+        if tech_id not in self._tech_digest or self._tech_digest[tech_id][0] is not tech_info:
+            tech_config = [self.get_class_digest(tech_info.__class__),
+                           tech_info.resolution,
+                           tech_info.layout_unit,
+                           tech_info.via_tech_name,
+                           # technology parameters may contain arbitrary objects
+                           to_stable_str(tech_info.tech_params),
+                           ]
+            self._tech_digest[tech_id] = (tech_info, compute_digest(tech_config))
+
+        grid_config = [self._tech_digest[tech_id][1],
+                       grid.layers,
+                       grid.sp_tracks,
+                       grid.w_tracks,
+                       grid.offset_tracks,
+                       grid.dir_tracks,
+                       grid.max_num_tr_tracks,
+                       grid.block_pitch,
+                       grid.get_flip_parity(),
+                       ]
+        return compute_digest(grid_config)
+
+    def compute_cache_key(self, temp_key, temp_cls, grid, config):
+        # type: (Any, Type, RoutingGrid, Any) -> str
+        """Compute the cache key of a template.
+
+        Parameters
+        ----------
+        temp_key : Any
+            the template unique key.
+        temp_cls : Type
+            the template class.
+        grid : RoutingGrid
+            the template routing grid.
+        config : Any
+            any additional configuration that affects the template layout.
+
+        Returns
+        -------
+        cache_key : str
+            the cache key.
+        """
+        return compute_digest([temp_key, self.get_class_digest(temp_cls), self.get_grid_digest(grid), config])
+
+    def get_file_name(self, cache_key):
+        # type: (str) -> str
+        """Returns the cache entry file name."""
+        return os.path.join(self._cache_dir, cache_key + self.ext)
+
+    def has_entry(self, cache_key):
+        # type: (str) -> bool
+        """Returns True if the given cache entry exists."""
+        return os.path.isfile(self.get_file_name(cache_key))
+
+    def load_header(self, cache_key, load_fun):
+        # type: (str, Callable[[Any], Any]) -> Optional[Any]
+        """Load the header of the given cache entry.
+
+        Parameters
+        ----------
+        cache_key : str
+            the cache key.
+        load_fun : Callable[[Any], Any]
+            the persistent object lookup function.
+
+        Returns
+        -------
+        header : Optional[Any]
+            the header object, None if the entry does not exist.
+        """
+        fname = self.get_file_name(cache_key)
+        if not os.path.isfile(fname):
+            return None
+        with open(fname, 'rb') as f:
+            return _HookUnpickler(f, load_fun).load()
+
+    def load(self, cache_key, load_fun):
+        # type: (str, Callable[[Any], Any]) -> Optional[Any]
+        """Load the state object of the given cache entry.
+
+        Parameters
+        ----------
+        cache_key : str
+            the cache key.
+        load_fun : Callable[[Any], Any]
+            the persistent object lookup function.
+
+        Returns
+        -------
+        state : Optional[Any]
+            the state object, None if the entry does not exist.
+        """
+        fname = self.get_file_name(cache_key)
+        if not os.path.isfile(fname):
+            return None
+        with open(fname, 'rb') as f:
+            # skip header
+            _HookUnpickler(f, lambda pid: None).load()
+            return _HookUnpickler(f, load_fun).load()
+
+    def save(self, cache_key, header, state, pid_fun):
+        # type: (str, Any, Any, Callable[[Any], Any]) -> None
+        """Save the given cache entry.
+
+        The entry is first written to a temporary file with the tmp_ext extension, then renamed,
+        so concurrent readers, get_cache_keys(), and clear() never see a partially written entry.
+
+        Parameters
+        ----------
+        cache_key : str
+            the cache key.
+        header : Any
+            the header object.
+        state : Any
+            the state object.
+        pid_fun : Callable[[Any], Any]
+            the persistent ID function.
+        """
+        fd, tmp_fname = tempfile.mkstemp(suffix=self.tmp_ext, dir=self._cache_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                _HookPickler(f, pid_fun).dump(header)
+                _HookPickler(f, pid_fun).dump(state)
+            os.rename(tmp_fname, self.get_file_name(cache_key))
+        except Exception:
+            os.remove(tmp_fname)
+            raise
+
+    def remove(self, cache_key):
+        # type: (str) -> None
+        """Remove the given cache entry if it exists."""
+        fname = self.get_file_name(cache_key)
+        if os.path.isfile(fname):
+            os.remove(fname)
+
+    def clear(self):
+        # type: () -> None
+        """Remove all cache entries."""
+        for cache_key in self.get_cache_keys():
+            self.remove(cache_key)
+
+    def get_cache_keys(self):
+        # type: () -> List[str]
+        """Returns a list of all cache keys in this cache."""
+        stop = -len(self.ext)
+        return [fname[:stop] for fname in os.listdir(self._cache_dir) if fname.endswith(self.ext)]
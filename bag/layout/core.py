@@ -32,7 +32,11 @@ from builtins import *
 from future.utils import with_metaclass
 
 import abc
-from typing import List, Iterator, Tuple
+import heapq
+from collections import OrderedDict
+from typing import List, Iterator, Tuple, Dict, Any, Optional
+
+import numpy as np
 from itertools import chain
 
 import bag
@@ -40,6 +44,7 @@ import bag.io
 from .util import BBox
 from .objects import Rect, Via, ViaInfo, Instance, InstanceInfo, PinInfo
 from .objects import Path, Blockage, Boundary
+from .geometry import RectStore, ViaStore, FlatGeometry, ContentView
 from bag.util.search import BinaryIterator
 
 # try to import cybagoa module
@@ -49,12 +54,53 @@ except ImportError:
     cybagoa = None
 
 
+def _via_nxy_iter(nx_max, ny_max):
+    # type: (int, int) -> Iterator[Tuple[int, int, int]]
+    """Iterates over all via array configurations in decreasing number of vias.
+
+    Yields (nx * ny, nx, ny) in the same order as sorting all configurations in reverse
+    order, without creating the full list.
+
+    Parameters
+    ----------
+    nx_max : int
+        maximum number of vias per row.
+    ny_max : int
+        maximum number of vias per column.
+
+    Yields
+    ------
+    num : int
+        number of vias.
+    nx : int
+        number of vias per row.
+    ny : int
+        number of vias per column.
+    """
+    if nx_max < 1 or ny_max < 1:
+        return
+    # each heap entry is the next configuration with the given nx.
+    heap = [(-nx * ny_max, -nx, -ny_max) for nx in range(1, nx_max + 1)]
+    heapq.heapify(heap)
+    while heap:
+        num, nx, ny = heap[0]
+        yield -num, -nx, -ny
+        if ny < -1:
+            heapq.heapreplace(heap, (num - nx, nx, ny + 1))
+        else:
+            heapq.heappop(heap)
+
+
 class TechInfo(with_metaclass(abc.ABCMeta, object)):
     """A base class that create vias.
 
     This class provides the API for making vias.  Each process should subclass this class and
     implement the make_via method.
 
+    Results of get_best_via_array() are stored in a least-recently-used cache with at most
+    via_cache_size entries, which can be set in the process parameters.  Set it to 0 to
+    disable caching.
+
     Parameters
     ----------
     res : float
@@ -75,6 +121,10 @@ class TechInfo(with_metaclass(abc.ABCMeta, object)):
         self._layout_unit = layout_unit
         self._via_tech = via_tech
         self.tech_params = process_params
+        self._via_cache = OrderedDict()  # type: Dict[Tuple[Any, ...], Optional[Tuple[Any, ...]]]
+        self._via_cache_size = process_params.get('via_cache_size', 10000)
+        self._via_cache_hits = 0
+        self._via_cache_misses = 0
 
     @classmethod
     @abc.abstractmethod
@@ -468,9 +518,34 @@ class TechInfo(with_metaclass(abc.ABCMeta, object)):
         """
         return None
 
+    def get_via_cache_info(self):
+        # type: () -> Dict[str, int]
+        """Returns statistics of the get_best_via_array() cache.
+
+        Returns
+        -------
+        info : Dict[str, int]
+            a dictionary with the number of cache hits and misses, the current number of entries,
+            and the maximum number of entries.
+        """
+        return dict(hits=self._via_cache_hits,
+                    misses=self._via_cache_misses,
+                    size=len(self._via_cache),
+                    max_size=self._via_cache_size,
+                    )
+
+    def clear_via_cache(self):
+        # type: () -> None
+        """Clear the get_best_via_array() cache and reset its statistics."""
+        self._via_cache.clear()
+        self._via_cache_hits = 0
+        self._via_cache_misses = 0
+
     def get_best_via_array(self, vname, bmtype, tmtype, bot_dir, w, h):
         """Maximize the number of vias in the given area.
 
+        Results are cached based on the given via parameters and dimensions in resolution units.
+
         Parameters
         ----------
         vname : string
@@ -505,6 +580,30 @@ class TechInfo(with_metaclass(abc.ABCMeta, object)):
         w = int(round(w / res))
         h = int(round(h / res))
 
+        key = (vname, bmtype, tmtype, bot_dir, w, h)
+        try:
+            result = self._via_cache.pop(key)
+        except KeyError:
+            self._via_cache_misses += 1
+            result = self._get_best_via_array_unit(vname, bmtype, tmtype, bot_dir, w, h)
+            if self._via_cache_size <= 0:
+                return result
+            if len(self._via_cache) >= self._via_cache_size:
+                # remove least recently used entry
+                self._via_cache.popitem(last=False)
+        else:
+            self._via_cache_hits += 1
+
+        # move entry to the end to mark it most recently used
+        self._via_cache[key] = result
+        if result is None:
+            return None
+        # return a copy of the mutable metal dimension list
+        nxy, mdim_list, vtype, vdim, sp, adim = result
+        return nxy, [list(mdim) for mdim in mdim_list], vtype, vdim, sp, adim
+
+    def _get_best_via_array_unit(self, vname, bmtype, tmtype, bot_dir, w, h):
+        """Implementation of get_best_via_array(), with dimensions in resolution units."""
         if bot_dir == 'x':
             top_dir = 'y'
             bw = h
@@ -541,16 +640,16 @@ class TechInfo(with_metaclass(abc.ABCMeta, object)):
 
             # print nx_max, ny_max, dim, w, h, spx_min, spy_min
 
-            # generate list of possible nx/ny configuration
-            nxy_list = [(a * b, a, b) for a in range(1, nx_max + 1) for b in range(1, ny_max + 1)]
-            nxy_list = sorted(nxy_list, reverse=True)
-
-            # find best nx/ny configuration
+            # find best nx/ny configuration, trying configurations with more vias first.
             opt_nxy = None
             opt_mdim_list = None
             opt_adim = None
             opt_sp = None
-            for num, nx, ny in nxy_list:
+            for num, nx, ny in _via_nxy_iter(nx_max, ny_max):
+                if best_num is not None and weight * num < best_num:
+                    # cannot beat the best via type found so far
+                    break
+
                 # check if we need to use sp3
                 if sp3 is not None and nx > 1 and ny > 1 and max(nx, ny) > 2:
                     spx, spy = sp3
@@ -656,6 +755,37 @@ class TechInfo(with_metaclass(abc.ABCMeta, object)):
         """
         return '%s_%s' % (top_layer, bot_layer)
 
+    def get_via_layers(self, via_id):
+        """Returns the bottom layer, cut layer, and top layer names of the given via.
+
+        The default implementation inverts get_via_id(), and uses get_via_name() as the
+        cut layer name.  Override this method if via IDs or cut layer names are defined
+        differently in this technology.
+
+        Parameters
+        ----------
+        via_id : string
+            the via ID string.
+
+        Returns
+        -------
+        bot_layer : string
+            the bottom layer name.
+        cut_layer : string
+            the via cut layer name.
+        top_layer : string
+            the top layer name.
+        """
+        idx = via_id.find('_')
+        while idx >= 0:
+            top_layer, bot_layer = via_id[:idx], via_id[idx + 1:]
+            bot_id = self.get_layer_id(bot_layer)
+            if bot_id is not None and bot_id + 1 == self.get_layer_id(top_layer):
+                return bot_layer, self.get_via_name(bot_id), top_layer
+            idx = via_id.find('_', idx + 1)
+
+        raise ValueError('Cannot determine layers of via %s' % via_id)
+
     def get_via_info(self, bbox, bot_layer, top_layer, bot_dir, bot_len=-1, top_len=-1, **kwargs):
         """Create a via on the routing grid given the bounding box.
 
@@ -980,14 +1110,15 @@ class BagLayout(object):
         self._path_list = []  # type: List[Path]
         self._blockage_list = []  # type: List[Blockage]
         self._boundary_list = []  # type: List[Boundary]
+        # columnar storage of rectangles and vias.  Rect/Via objects are moved here on finalize.
+        self._rect_store = RectStore(self._res)
+        self._via_store = ViaStore(self._res)
         self._used_inst_names = set()
         self._used_pin_names = set()
         self._content = None
         self._finalized = False
-        self._flat_inst_list = None
-        self._flat_rect_list = None
-        self._flat_via_list = None
-        self._flat_path_list = None
+        self._flat_geometry = None  # type: FlatGeometry
+        self._flat_geometry_cache = {}  # type: Dict[str, FlatGeometry]
         self._flat_blockage_list = None
         self._flat_boundary_list = None
         if use_cybagoa and cybagoa is not None:
@@ -1008,82 +1139,61 @@ class BagLayout(object):
         return iter(self._inst_list)
 
     def flatten(self):
-        self._flat_rect_list = []
-        self._flat_path_list = []
+        flat_geo = FlatGeometry(self._res)
         self._flat_blockage_list = []
         self._flat_boundary_list = []
-        self._flat_via_list = []  # type: List[ViaInfo]
-        self._flat_inst_list = []  # type: List[InstanceInfo]
 
         # get rectangles
-        for obj in self._rect_list:
-            if obj.valid:
-                obj_content = obj.content
-                self._flat_rect_list.append(obj_content)
-                if self._flat_oa_layout is not None:
-                    self._flat_oa_layout.add_rect(**obj_content)
+        flat_geo.rect_store.extend(self._rect_store)
 
         for obj in self._path_list:
             if obj.valid:
-                obj_content = obj.content
-                self._flat_path_list.append(obj_content)
-                if self._flat_oa_layout is not None:
-                    self._flat_oa_layout.add_path(**obj_content)
+                flat_geo.path_store.add_path(obj.layer, obj.width_unit, obj.points_array,
+                                             end_style=obj.end_style, join_style=obj.join_style)
 
         for obj in self._blockage_list:
             if obj.valid:
-                obj_content = obj.content
-                self._flat_blockage_list.append(obj_content)
-                if self._flat_oa_layout is not None:
-                    self._flat_oa_layout.add_blockage(**obj_content)
+                self._flat_blockage_list.append(obj.content)
 
         for obj in self._boundary_list:
             if obj.valid:
-                obj_content = obj.content
-                self._flat_boundary_list.append(obj_content)
-                if self._flat_oa_layout is not None:
-                    self._flat_oa_layout.add_boundary(**obj_content)
-
-        # get vias
-        for obj in self._via_list:
-            if obj.valid:
-                obj_content = obj.content
-                self._flat_via_list.append(obj_content)
-                if self._flat_oa_layout is not None:
-                    self._flat_oa_layout.add_via(**obj_content)
-
-        # get via primitives
-        self._flat_via_list.extend(self._via_primitives)
-        if self._flat_oa_layout is not None:
-            for via in self._via_primitives:
-                self._flat_oa_layout.add_via(**via)
+                self._flat_boundary_list.append(obj.content)
+
+        # get vias and via primitives
+        flat_geo.via_store.extend(self._via_store)
+        for via in self._via_primitives:
+            if 'arr_nx' in via:
+                flat_geo.via_store.add_via(via, nx=via['arr_nx'], ny=via['arr_ny'],
+                                           spx=int(round(via['arr_spx'] / self._res)),
+                                           spy=int(round(via['arr_spy'] / self._res)))
+            else:
+                flat_geo.via_store.add_via(via)
 
         # get instances
         for obj in self._inst_list:
             if obj.valid:
                 # TODO: add support for flatten blockage/boundary
-                finst_list, frect_list, fvia_list, fpath_list = obj.flatten()
-                self._flat_inst_list.extend(finst_list)
-                self._flat_rect_list.extend(frect_list)
-                self._flat_via_list.extend(fvia_list)
-                self._flat_path_list.extend(fpath_list)
-                if self._flat_oa_layout is not None:
-                    for fobj in finst_list:
-                        self._flat_oa_layout.add_inst(**fobj)
-                    for fobj in frect_list:
-                        self._flat_oa_layout.add_rect(**fobj)
-                    for fobj in fvia_list:
-                        self._flat_oa_layout.add_via(**fobj)
-                    for fobj in fpath_list:
-                        self._flat_oa_layout.add_path(**fobj)
+                flat_geo.extend(obj.get_flat_geometry())
         # get instance primitives
-        self._flat_inst_list.extend(self._inst_primitives)
-        if self._flat_oa_layout is not None:
-            for obj in self._inst_primitives:
-                self._flat_oa_layout.add_inst(**obj)
+        for obj in self._inst_primitives:
+            flat_geo.inst_store.add_inst(obj)
+
+        self._flat_geometry = flat_geo
+        self._flat_geometry_cache = {}
 
-        # add pins to oa layout
         if self._flat_oa_layout is not None:
+            for obj_content in flat_geo.inst_store.content_iter():
+                self._flat_oa_layout.add_inst(**obj_content)
+            for obj_content in flat_geo.rect_store.content_iter():
+                self._flat_oa_layout.add_rect(**obj_content)
+            for obj_content in flat_geo.via_store.content_iter():
+                self._flat_oa_layout.add_via(**obj_content)
+            for obj_content in flat_geo.path_store.content_iter():
+                self._flat_oa_layout.add_path(**obj_content)
+            for obj_content in self._flat_blockage_list:
+                self._flat_oa_layout.add_blockage(**obj_content)
+            for obj_content in self._flat_boundary_list:
+                self._flat_oa_layout.add_boundary(**obj_content)
             for pin in self._pin_list:
                 self._flat_oa_layout.add_pin(**pin)
 
@@ -1098,16 +1208,18 @@ class BagLayout(object):
         """
         self._finalized = True
 
-        # get rectangles
-        rect_list = []
+        # move rectangles to columnar storage
         for obj in self._rect_list:
             if obj.valid:
-                if not obj.bbox.is_physical():
+                bbox = obj.bbox
+                if not bbox.is_physical():
                     raise ValueError('rectangle with non-physical bounding box found.')
-                obj_content = obj.content
-                rect_list.append(obj_content)
-                if self._oa_layout is not None:
-                    self._oa_layout.add_rect(**obj_content)
+                self._rect_store.add_rect(obj.layer, bbox.left_unit, bbox.bottom_unit, bbox.right_unit,
+                                          bbox.top_unit, nx=obj.nx, ny=obj.ny, spx=obj.spx_unit, spy=obj.spy_unit)
+        self._rect_list = []
+        if self._oa_layout is not None:
+            for obj_content in self._rect_store.content_iter():
+                self._oa_layout.add_rect(**obj_content)
 
         path_list = []
         for obj in self._path_list:
@@ -1133,17 +1245,14 @@ class BagLayout(object):
                 if self._oa_layout is not None:
                     self._oa_layout.add_boundary(**obj_content)
 
-        # get vias
-        via_list = []  # type: List[ViaInfo]
+        # move vias to columnar storage
         for obj in self._via_list:
             if obj.valid:
-                obj_content = obj.content
-                via_list.append(obj_content)
-                if self._oa_layout is not None:
-                    self._oa_layout.add_via(**obj_content)
-        # get via primitives
-        via_list.extend(self._via_primitives)
+                self._via_store.add_via(obj.content, nx=obj.nx, ny=obj.ny, spx=obj.spx_unit, spy=obj.spy_unit)
+        self._via_list = []
         if self._oa_layout is not None:
+            for obj_content in self._via_store.content_iter():
+                self._oa_layout.add_via(**obj_content)
             for via in self._via_primitives:
                 self._oa_layout.add_via(**via)
 
@@ -1167,9 +1276,10 @@ class BagLayout(object):
                 self._oa_layout.add_pin(**pin)
 
         # TODO: add blockage/boundary support
+        # rectangles and vias are converted to dictionaries lazily.
         self._content = [inst_list,
-                         rect_list,
-                         via_list,
+                         ContentView([self._rect_store]),
+                         ContentView([self._via_store, self._via_primitives]),
                          self._pin_list,
                          path_list,
                          ]
@@ -1177,10 +1287,61 @@ class BagLayout(object):
         if flatten:
             self.flatten()
 
+    def get_flat_geometry(self, orient='R0'):
+        # type: (str) -> FlatGeometry
+        """Returns the flattened geometries of this layout under the given orientation.
+
+        The results are cached, so every orientation of this layout is only computed once.
+        The returned object should not be modified.
+
+        Parameters
+        ----------
+        orient : str
+            the orientation.
+
+        Returns
+        -------
+        flat_geo : FlatGeometry
+            the flattened geometries.
+        """
+        if self._flat_geometry is None:
+            raise Exception('Layout is not flattened.')
+        if orient == 'R0':
+            return self._flat_geometry
+        flat_geo = self._flat_geometry_cache.get(orient, None)
+        if flat_geo is None:
+            flat_geo = self._flat_geometry.transform(orient=orient)
+            self._flat_geometry_cache[orient] = flat_geo
+        return flat_geo
+
     def get_flat_geometries(self):
         """Returns flattened geometries in this layout."""
         # TODO: add blockage/boundary support
-        return self._flat_inst_list, self._flat_rect_list, self._flat_via_list, self._flat_path_list
+        flat_geo = self.get_flat_geometry()
+        return (list(flat_geo.inst_store.content_iter()), list(flat_geo.rect_store.content_iter()),
+                list(flat_geo.via_store.content_iter()), list(flat_geo.path_store.content_iter()))
+
+    def update_master_cell_names(self):
+        # type: () -> None
+        """Update instance master cell names in the finalized layout content.
+
+        This method is used when the layout is restored from a persistent cache, as the
+        cell names of the instance masters may be different.
+        """
+        if self._content is not None:
+            inst_iter = (inst for inst in self._inst_list if inst.valid)
+            for inst, inst_info in zip(inst_iter, self._content[0]):
+                inst_info['cell'] = inst.master.cell_name
+
+    def get_rect_store(self):
+        # type: () -> RectStore
+        """Returns the columnar rectangle storage.  Contains all rectangles after finalize."""
+        return self._rect_store
+
+    def get_via_store(self):
+        # type: () -> ViaStore
+        """Returns the columnar via storage.  Contains all non-primitive vias after finalize."""
+        return self._via_store
 
     def get_masters_set(self):
         """Returns a set of all template master keys used in this layout."""
@@ -1228,13 +1389,13 @@ class BagLayout(object):
             # TODO: add blockage/boundary support
             if self._flat_oa_layout is not None:
                 return cell_name, self._flat_oa_layout
-            return [cell_name, self._flat_inst_list, self._flat_rect_list,
-                    self._flat_via_list, self._pin_list, self._flat_path_list]
+            inst_list, rect_list, via_list, path_list = self.get_flat_geometries()
+            return [cell_name, inst_list, rect_list, via_list, self._pin_list, path_list]
         else:
             if self._oa_layout is not None:
                 return cell_name, self._oa_layout
             ans = [cell_name]
-            ans.extend(self._content)
+            ans.extend((val.to_list() if isinstance(val, ContentView) else val for val in self._content))
             return ans
 
     def add_instance(self, instance):
@@ -1271,6 +1432,7 @@ class BagLayout(object):
                          self._via_primitives, self._via_list, self._pin_list,
                          self._path_list, self._blockage_list, self._boundary_list):
             obj.move_by(dx=dx, dy=dy)
+        self._rect_store.move_by(int(round(dx / self._res)), int(round(dy / self._res)))
 
     def add_instance_primitive(self, lib_name, cell_name, loc,
                                view_name='layout', inst_name=None, orient="R0",
@@ -1351,6 +1513,23 @@ class BagLayout(object):
 
         self._rect_list.append(rect)
 
+    def add_rect_arrays(self, layer, box_arr):
+        # type: (Tuple[str, str], np.ndarray) -> None
+        """Add many rectangles on the same layer without creating Rect objects.
+
+        Parameters
+        ----------
+        layer : Tuple[str, str]
+            the (layer, purpose) pair.
+        box_arr : np.ndarray
+            an integer array of rectangles, in resolution units.  Must have either 4 columns
+            (xl, yb, xr, yt) or 8 columns (xl, yb, xr, yt, nx, ny, spx, spy).
+        """
+        if self._finalized:
+            raise Exception('Layout is already finalized.')
+
+        self._rect_store.add_rect_arrays(layer, box_arr)
+
     def add_path(self, path):
         # type: (Path) -> None
         """Add a new path.
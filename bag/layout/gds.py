@@ -0,0 +1,474 @@
+# -*- coding: utf-8 -*-
+########################################################################################################################
+#
+# Copyright (c) 2014, Regents of the University of California
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+#   disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+#    following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+########################################################################################################################
+
+
+"""This module defines GDSWriter, a streaming GDSII writer for layout content.
+"""
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+# noinspection PyUnresolvedReferences,PyCompatibility
+from builtins import *
+
+import io
+import math
+import time
+import struct
+from typing import Dict, Tuple, List, Any, Optional, Iterable
+
+import numpy as np
+
+from ..io import readlines_iter
+from .core import TechInfo
+
+Layer = Tuple[str, str]
+
+# record type/data type codes
+_HEADER = 0x0002
+_BGNLIB = 0x0102
+_LIBNAME = 0x0206
+_UNITS = 0x0305
+_ENDLIB = 0x0400
+_BGNSTR = 0x0502
+_STRNAME = 0x0606
+_ENDSTR = 0x0700
+_BOUNDARY = 0x0800
+_PATH = 0x0900
+_SREF = 0x0A00
+_AREF = 0x0B00
+_TEXT = 0x0C00
+_LAYER = 0x0D02
+_DATATYPE = 0x0E02
+_WIDTH = 0x0F03
+_XY = 0x1003
+_ENDEL = 0x1100
+_SNAME = 0x1206
+_COLROW = 0x1302
+_TEXTTYPE = 0x1602
+_STRING = 0x1906
+_STRANS = 0x1A01
+_ANGLE = 0x1C05
+_PATHTYPE = 0x2102
+
+# maximum number of points in a XY record
+_MAX_POINTS = 8191
+
+# STRANS reflection flag and rotation angle of each orientation.
+# reflection is about the x axis, and is applied before rotation.
+_orient_trans = {'R0': (False, 0.0),
+                 'MX': (True, 0.0),
+                 'MY': (True, 180.0),
+                 'R180': (False, 180.0),
+                 'R90': (False, 90.0),
+                 'MXR90': (True, 90.0),
+                 'MYR90': (True, 270.0),
+                 'R270': (False, 270.0),
+                 }
+
+# x/y pitch multipliers of instance arrays.  Layout content stores array pitches before rotation.
+_orient_signs = {'R0': (1, 1), 'MX': (1, -1), 'MY': (-1, 1), 'R180': (-1, -1)}
+
+_path_type = {'truncate': 0, 'round': 1, 'extend': 2}
+
+# a boundary element with 5 points, written as one numpy record
+_boundary_dtype = np.dtype([('head', '>u2', (2,)),
+                            ('layer', '>u2', (3,)),
+                            ('datatype', '>u2', (3,)),
+                            ('xy_head', '>u2', (2,)),
+                            ('xy', '>i4', (10,)),
+                            ('endel', '>u2', (2,)),
+                            ])
+
+
+def read_layer_map(fname):
+    # type: (str) -> Dict[Layer, Tuple[int, int]]
+    """Read a stream layer map file.
+
+    Each line of the file has the format "<layer> <purpose> <GDS layer> <GDS datatype>".
+    Empty lines and lines starting with '#' are ignored.
+
+    Parameters
+    ----------
+    fname : str
+        the layer map file name.
+
+    Returns
+    -------
+    layer_map : Dict[Layer, Tuple[int, int]]
+        dictionary from (layer, purpose) pair to GDS (layer, datatype) pair.
+    """
+    layer_map = {}
+    for line in readlines_iter(fname):
+        line = line.strip()
+        if line and not line.startswith('#'):
+            parts = line.split()
+            if len(parts) < 4:
+                raise ValueError('Invalid layer map line: %s' % line)
+            layer_map[(parts[0], parts[1])] = (int(parts[2]), int(parts[3]))
+    return layer_map
+
+
+def _to_real8(val):
+    # type: (float) -> bytes
+    """Convert the given value to GDSII 8-byte real format."""
+    if val == 0:
+        return b'\x00' * 8
+    sign = 0x80 if val < 0 else 0
+    val = abs(val)
+    exp = int(math.ceil(math.log(val, 16)))
+    mant = val / 16.0 ** exp
+    # correct for floating point errors in log
+    if mant >= 1.0:
+        mant /= 16.0
+        exp += 1
+    elif mant < 1.0 / 16:
+        mant *= 16.0
+        exp -= 1
+    mant_int = int(round(mant * 2 ** 56))
+    if mant_int >= 2 ** 56:
+        mant_int >>= 4
+        exp += 1
+    return struct.pack('>B', sign | (exp + 64)) + struct.pack('>Q', mant_int)[1:]
+
+
+def _to_string(val):
+    # type: (str) -> bytes
+    """Convert the given string to GDSII string format, padded to even length."""
+    data = val.encode('ascii')
+    if len(data) % 2 == 1:
+        data += b'\x00'
+    return data
+
+
+class GDSWriter(object):
+    """A streaming GDSII writer.
+
+    Structures are written to the output file as they are added, so memory usage is
+    bounded by the size of a single structure.  Rectangles are converted to boundary
+    elements with vectorized numpy operations, instance arrays are written as AREFs,
+    and each unique via is written once as a structure, using the via layers from
+    TechInfo, and referenced with SREFs/AREFs.
+
+    The layout content format is the same as the one sent to Virtuoso: a list of cell name,
+    instance list, rectangle list, via list, pin list, and path list.  Instances of cells
+    that are not written to this file, such as primitive instances, are written as
+    references to external structures with the same cell name.
+
+    Parameters
+    ----------
+    fname : str
+        the output file name.
+    lib_name : str
+        the GDS library name.
+    tech_info : TechInfo
+        the TechInfo object.
+    layer_map : Dict[Layer, Tuple[int, int]]
+        dictionary from (layer, purpose) pair to GDS (layer, datatype) pair.
+    buffer_size : int
+        the output buffer size, in bytes.
+    timestamp : Optional[Tuple[int, int, int, int, int, int]]
+        the modification time stamp (year, month, day, hour, minute, second) written to the
+        file.  Defaults to the current time.  Set this to get reproducible output.
+    """
+
+    def __init__(self, fname, lib_name, tech_info, layer_map, buffer_size=1 << 20, timestamp=None):
+        # type: (str, str, TechInfo, Dict[Layer, Tuple[int, int]], int, Optional[Tuple[int, ...]]) -> None
+        self._fname = fname
+        self._lib_name = lib_name
+        self._tech_info = tech_info
+        self._layer_map = layer_map
+        self._buffer_size = buffer_size
+        self._res = tech_info.resolution
+        if timestamp is None:
+            timestamp = time.localtime()[:6]
+        self._timestamp = list(timestamp) * 2
+        self._via_lookup = {}  # type: Dict[Tuple[Any, ...], str]
+        self._via_list = []  # type: List[Tuple[str, Tuple[Any, ...]]]
+        self._cell_names = set()
+        self._f = None
+
+    def __enter__(self):
+        # type: () -> GDSWriter
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def open(self):
+        # type: () -> None
+        """Open the output file and write the library header."""
+        self._f = io.open(self._fname, 'wb', buffering=self._buffer_size)
+        self._write_record(_HEADER, struct.pack('>h', 600))
+        self._write_record(_BGNLIB, struct.pack('>12h', *self._timestamp))
+        self._write_record(_LIBNAME, _to_string(self._lib_name))
+        # user unit in layout units, then database unit in meters
+        self._write_record(_UNITS, _to_real8(self._res) + _to_real8(self._res * self._tech_info.layout_unit))
+
+    def close(self):
+        # type: () -> None
+        """Write via structures and the library trailer, then close the output file."""
+        if self._f is not None:
+            try:
+                for via_name, via_key in self._via_list:
+                    self._write_via_structure(via_name, via_key)
+                self._write_record(_ENDLIB)
+            finally:
+                self._f.close()
+                self._f = None
+
+    def _write_record(self, code, data=b''):
+        # type: (int, bytes) -> None
+        self._f.write(struct.pack('>HH', len(data) + 4, code))
+        if data:
+            self._f.write(data)
+
+    def _write_xy(self, xy_arr):
+        # type: (np.ndarray) -> None
+        num_pts = xy_arr.size // 2
+        if num_pts > _MAX_POINTS:
+            raise ValueError('Cannot write more than %d points in one element.' % _MAX_POINTS)
+        self._write_record(_XY, np.asarray(xy_arr, dtype='>i4').tobytes())
+
+    def _get_gds_layer(self, layer):
+        # type: (Iterable[str]) -> Tuple[int, int]
+        layer = tuple(layer)
+        if len(layer) == 1:
+            layer = (layer[0], 'drawing')
+        try:
+            return self._layer_map[layer]
+        except KeyError:
+            raise ValueError('Layer %s not found in layer map.' % (layer, ))
+
+    def _to_unit(self, val):
+        # type: (float) -> int
+        return int(round(val / self._res))
+
+    def _write_boundaries(self, gds_layer, box_arr):
+        # type: (Tuple[int, int], np.ndarray) -> None
+        """Write boundary elements of the given (N, 4) rectangle array."""
+        num = box_arr.shape[0]
+        if num == 0:
+            return
+        rec = np.empty(num, dtype=_boundary_dtype)
+        rec['head'] = (4, _BOUNDARY)
+        rec['layer'] = (6, _LAYER, gds_layer[0])
+        rec['datatype'] = (6, _DATATYPE, gds_layer[1])
+        rec['xy_head'] = (44, _XY)
+        xl, yb, xr, yt = box_arr[:, 0], box_arr[:, 1], box_arr[:, 2], box_arr[:, 3]
+        rec['xy'] = np.stack((xl, yb, xr, yb, xr, yt, xl, yt, xl, yb), axis=1)
+        rec['endel'] = (4, _ENDEL)
+        self._f.write(rec.tobytes())
+
+    def _write_ref(self, name, orient, x, y, nx=1, ny=1, spx=0, spy=0):
+        # type: (str, str, int, int, int, int, int, int) -> None
+        """Write a SREF or AREF element.
+
+        AREF lattice vectors are given in parent coordinates, so pitches are after rotation.
+        """
+        try:
+            reflect, angle = _orient_trans[orient]
+        except KeyError:
+            raise ValueError('Unsupported orientation: %s' % orient)
+
+        is_array = nx > 1 or ny > 1
+        self._write_record(_AREF if is_array else _SREF)
+        self._write_record(_SNAME, _to_string(name))
+        if reflect or angle != 0:
+            self._write_record(_STRANS, struct.pack('>H', 0x8000 if reflect else 0))
+            if angle != 0:
+                self._write_record(_ANGLE, _to_real8(angle))
+        if is_array:
+            self._write_record(_COLROW, struct.pack('>hh', nx, ny))
+            self._write_xy(np.array([x, y, x + nx * spx, y, x, y + ny * spy]))
+        else:
+            self._write_xy(np.array([x, y]))
+        self._write_record(_ENDEL)
+
+    def add_cell(self, content):
+        # type: (List[Any]) -> None
+        """Write the given layout content as a structure.
+
+        Parameters
+        ----------
+        content : List[Any]
+            the layout content list.
+        """
+        cell_name, inst_list, rect_list, via_list, pin_list, path_list = content[:6]
+        if cell_name in self._cell_names:
+            raise ValueError('Structure %s is already written.' % cell_name)
+        self._cell_names.add(cell_name)
+
+        self._write_record(_BGNSTR, struct.pack('>12h', *self._timestamp))
+        self._write_record(_STRNAME, _to_string(cell_name))
+
+        for inst in inst_list:
+            self._write_inst(inst)
+        self._write_rects(rect_list)
+        for path in path_list:
+            self._write_path(path)
+        for via in via_list:
+            self._write_via(via)
+        for pin in pin_list:
+            self._write_pin(pin)
+
+        self._write_record(_ENDSTR)
+
+    def _write_inst(self, inst):
+        # type: (Dict[str, Any]) -> None
+        orient = inst['orient']
+        nx, ny = inst['num_cols'], inst['num_rows']
+        spx = self._to_unit(inst['sp_cols'])
+        spy = self._to_unit(inst['sp_rows'])
+        if nx > 1 or ny > 1:
+            # undo the pitch correction for skill/OA arrays.
+            sx, sy = _orient_signs.get(orient, (1, 1))
+            spx *= sx
+            spy *= sy
+        loc = inst['loc']
+        self._write_ref(inst['cell'], orient, self._to_unit(loc[0]), self._to_unit(loc[1]),
+                        nx=nx, ny=ny, spx=spx, spy=spy)
+
+    def _write_rects(self, rect_list):
+        # type: (Iterable[Dict[str, Any]]) -> None
+        # group rectangles by layer
+        rect_data = {}  # type: Dict[Layer, List[Tuple[float, ...]]]
+        for rect in rect_list:
+            layer = tuple(rect['layer'])
+            (xl, yb), (xr, yt) = rect['bbox']
+            if 'arr_nx' in rect:
+                row = (xl, yb, xr, yt, rect['arr_nx'], rect['arr_ny'], rect['arr_spx'], rect['arr_spy'])
+            else:
+                row = (xl, yb, xr, yt, 1, 1, 0.0, 0.0)
+            if layer not in rect_data:
+                rect_data[layer] = [row]
+            else:
+                rect_data[layer].append(row)
+
+        res = self._res
+        for layer, row_list in rect_data.items():
+            gds_layer = self._get_gds_layer(layer)
+            arr = np.array(row_list, dtype=float)
+            box_arr = np.round(arr[:, :4] / res).astype(np.int64)
+            nx = arr[:, 4].astype(np.int64)
+            ny = arr[:, 5].astype(np.int64)
+            sp_arr = np.round(arr[:, 6:] / res).astype(np.int64)
+            counts = nx * ny
+            if np.any(counts > 1):
+                # expand rectangle arrays
+                box_arr = np.repeat(box_arr, counts, axis=0)
+                starts = np.cumsum(counts) - counts
+                idx_list = np.arange(box_arr.shape[0], dtype=np.int64) - np.repeat(starts, counts)
+                nx = np.repeat(nx, counts)
+                sp_arr = np.repeat(sp_arr, counts, axis=0)
+                dx = (idx_list % nx) * sp_arr[:, 0]
+                dy = (idx_list // nx) * sp_arr[:, 1]
+                box_arr[:, 0] += dx
+                box_arr[:, 2] += dx
+                box_arr[:, 1] += dy
+                box_arr[:, 3] += dy
+            self._write_boundaries(gds_layer, box_arr)
+
+    def _write_path(self, path):
+        # type: (Dict[str, Any]) -> None
+        gds_layer = self._get_gds_layer(path['layer'])
+        self._write_record(_PATH)
+        self._write_record(_LAYER, struct.pack('>h', gds_layer[0]))
+        self._write_record(_DATATYPE, struct.pack('>h', gds_layer[1]))
+        self._write_record(_PATHTYPE, struct.pack('>h', _path_type.get(path['end_style'], 0)))
+        self._write_record(_WIDTH, struct.pack('>i', self._to_unit(path['width'])))
+        pts = np.round(np.array(path['points'], dtype=float) / self._res).astype(np.int64)
+        self._write_xy(pts.ravel())
+        self._write_record(_ENDEL)
+
+    def _get_via_name(self, via):
+        # type: (Dict[str, Any]) -> str
+        """Returns the name of the structure containing the given via, creating it if necessary."""
+        to_unit = self._to_unit
+        if 'cut_width' not in via or 'cut_height' not in via:
+            raise ValueError('Via %s must specify cut width and height for GDS output.' % via['id'])
+        via_key = (via['id'], via['num_rows'], via['num_cols'], to_unit(via['sp_rows']), to_unit(via['sp_cols']),
+                   tuple((to_unit(val) for val in via['enc1'])), tuple((to_unit(val) for val in via['enc2'])),
+                   to_unit(via['cut_width']), to_unit(via['cut_height']))
+        via_name = self._via_lookup.get(via_key, None)
+        if via_name is None:
+            via_name = '%s_VIA%d' % (self._lib_name, len(self._via_list))
+            self._via_lookup[via_key] = via_name
+            self._via_list.append((via_name, via_key))
+        return via_name
+
+    def _write_via(self, via):
+        # type: (Dict[str, Any]) -> None
+        via_name = self._get_via_name(via)
+        loc = via['loc']
+        if 'arr_nx' in via:
+            nx, ny = via['arr_nx'], via['arr_ny']
+            spx, spy = self._to_unit(via['arr_spx']), self._to_unit(via['arr_spy'])
+        else:
+            nx = ny = 1
+            spx = spy = 0
+        self._write_ref(via_name, via['orient'], self._to_unit(loc[0]), self._to_unit(loc[1]),
+                        nx=nx, ny=ny, spx=spx, spy=spy)
+
+    def _write_via_structure(self, via_name, via_key):
+        # type: (str, Tuple[Any, ...]) -> None
+        """Write the via structure.  The via origin is at the center of the cut array."""
+        via_id, nrow, ncol, sp_rows, sp_cols, enc1, enc2, cut_w, cut_h = via_key
+        bot_layer, cut_layer, top_layer = self._tech_info.get_via_layers(via_id)
+
+        arr_w = ncol * cut_w + (ncol - 1) * sp_cols
+        arr_h = nrow * cut_h + (nrow - 1) * sp_rows
+        xl = -(arr_w // 2)
+        yb = -(arr_h // 2)
+        xr = xl + arr_w
+        yt = yb + arr_h
+
+        self._write_record(_BGNSTR, struct.pack('>12h', *self._timestamp))
+        self._write_record(_STRNAME, _to_string(via_name))
+        # enclosures are given as [left, right, top, bottom]
+        for lay, enc in ((bot_layer, enc1), (top_layer, enc2)):
+            box_arr = np.array([[xl - enc[0], yb - enc[3], xr + enc[1], yt + enc[2]]], dtype=np.int64)
+            self._write_boundaries(self._get_gds_layer((lay, 'drawing')), box_arr)
+        xcut = xl + np.arange(ncol, dtype=np.int64) * (cut_w + sp_cols)
+        ycut = yb + np.arange(nrow, dtype=np.int64) * (cut_h + sp_rows)
+        xcut, ycut = np.meshgrid(xcut, ycut, indexing='ij')
+        xcut = xcut.ravel()
+        ycut = ycut.ravel()
+        box_arr = np.stack((xcut, ycut, xcut + cut_w, ycut + cut_h), axis=1)
+        self._write_boundaries(self._get_gds_layer((cut_layer, 'drawing')), box_arr)
+        self._write_record(_ENDSTR)
+
+    def _write_pin(self, pin):
+        # type: (Dict[str, Any]) -> None
+        gds_layer = self._get_gds_layer(pin['layer'])
+        (xl, yb), (xr, yt) = pin['bbox']
+        box_arr = np.array([[self._to_unit(xl), self._to_unit(yb), self._to_unit(xr), self._to_unit(yt)]],
+                           dtype=np.int64)
+        if pin.get('make_rect', True):
+            self._write_boundaries(gds_layer, box_arr)
+        self._write_record(_TEXT)
+        self._write_record(_LAYER, struct.pack('>h', gds_layer[0]))
+        self._write_record(_TEXTTYPE, struct.pack('>h', gds_layer[1]))
+        self._write_xy(np.array([(box_arr[0, 0] + box_arr[0, 2]) // 2, (box_arr[0, 1] + box_arr[0, 3]) // 2]))
+        self._write_record(_STRING, _to_string(pin['label']))
+        self._write_record(_ENDEL)
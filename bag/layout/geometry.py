@@ -0,0 +1,983 @@
+# -*- coding: utf-8 -*-
+########################################################################################################################
+#
+# Copyright (c) 2014, Regents of the University of California
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+#   disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+#    following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+########################################################################################################################
+
+
+
+"""This module defines columnar storage classes for layout geometries.
+
+Instead of one Python object per shape, geometries are stored as integer numpy arrays in
+resolution units, grouped by layer (for rectangles) or via type (for vias).  Dictionary
+representations used by the layout content API are only created on demand.
+"""
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+# noinspection PyUnresolvedReferences,PyCompatibility
+from builtins import *
+
+from typing import Tuple, List, Dict, Any, Iterator, Iterable, Union, Optional
+
+import numpy as np
+
+from .objects import ViaInfo, InstanceInfo, Path
+
+Layer = Tuple[str, str]
+
+# column indices of rectangle arrays
+RECT_XL, RECT_YB, RECT_XR, RECT_YT, RECT_NX, RECT_NY, RECT_SPX, RECT_SPY = range(8)
+RECT_NCOL = 8
+
+# column indices of via arrays
+VIA_X, VIA_Y, VIA_ORIENT, VIA_NUM_ROWS, VIA_NUM_COLS, VIA_SP_ROWS, VIA_SP_COLS = range(7)
+# enclosures take 4 columns each
+VIA_ENC1, VIA_ENC2 = 7, 11
+VIA_CUT_W, VIA_CUT_H, VIA_NX, VIA_NY, VIA_SPX, VIA_SPY = range(15, 21)
+VIA_NCOL = 21
+
+# column indices of instance arrays.  Array pitches are stored after rotation.
+INST_X, INST_Y, INST_ORIENT, INST_NX, INST_NY, INST_SPX, INST_SPY, INST_PROTO = range(8)
+INST_NCOL = 8
+
+# column indices of path arrays
+PATH_NPTS, PATH_WIDTH, PATH_PROTO = range(3)
+PATH_NCOL = 3
+
+# the first 4 orientation indices are consistent with bag.layout.util.orient_code, so
+# orientations can be composed with XOR.
+orient_list = ['R0', 'MX', 'MY', 'R180', 'R90', 'MXR90', 'MYR90', 'R270']
+orient_index = {val: idx for idx, val in enumerate(orient_list)}
+# x/y coordinate multipliers of each supported orientation
+orient_signs = {'R0': (1, 1), 'MX': (1, -1), 'MY': (-1, 1), 'R180': (-1, -1)}
+
+
+def _get_orient_signs(orient):
+    # type: (str) -> Tuple[int, int]
+    try:
+        return orient_signs[orient]
+    except KeyError:
+        raise ValueError('Unsupported orientation: %s' % orient)
+
+
+def _transform_axis(arr, lo_col, hi_col, n_col, sp_col, sgn, shift):
+    # type: (np.ndarray, int, Optional[int], int, int, int, int) -> None
+    """Mirror (if sgn is negative) and shift the given array along one axis, in place.
+
+    The array pitch is kept unchanged, so the first element of a mirrored array is the
+    mirrored image of the last element of the original array.
+
+    Parameters
+    ----------
+    arr : np.ndarray
+        the geometry array.
+    lo_col : int
+        the lower coordinate column, or the point coordinate column.
+    hi_col : Optional[int]
+        the upper coordinate column.  None for point-like objects.
+    n_col : int
+        the array count column.
+    sp_col : int
+        the array pitch column.
+    sgn : int
+        1 to keep the orientation, -1 to mirror.
+    shift : int
+        the shift amount.
+    """
+    if sgn < 0:
+        span = (arr[:, n_col] - 1) * arr[:, sp_col]
+        if hi_col is None:
+            arr[:, lo_col] = -(arr[:, lo_col] + span)
+        else:
+            lo = arr[:, lo_col].copy()
+            arr[:, lo_col] = -(arr[:, hi_col] + span)
+            arr[:, hi_col] = -(lo + span)
+    if shift != 0:
+        arr[:, lo_col] += shift
+        if hi_col is not None:
+            arr[:, hi_col] += shift
+
+
+def _array_axis(arr, pos_cols, n_col, sp_col, n, sp):
+    # type: (np.ndarray, Tuple[int, ...], int, int, int, int) -> np.ndarray
+    """Returns arrayed copies of the given geometry array along one axis.
+
+    This is the vectorized version of BBoxArray.arrayed_copies().  Whenever possible, the
+    copies are merged with the existing array.  Otherwise, the array with more elements is
+    kept and the other is expanded into separate rows.
+
+    Parameters
+    ----------
+    arr : np.ndarray
+        the geometry array.
+    pos_cols : Tuple[int, ...]
+        the coordinate columns along this axis.
+    n_col : int
+        the array count column.
+    sp_col : int
+        the array pitch column.
+    n : int
+        number of copies.
+    sp : int
+        the copy pitch.
+
+    Returns
+    -------
+    ans : np.ndarray
+        the new geometry array.
+    """
+    if n == 1 or arr.shape[0] == 0:
+        return arr
+
+    cn = arr[:, n_col]
+    csp = arr[:, sp_col]
+    pos_cols = list(pos_cols)
+
+    single = cn == 1
+    merge1 = ~single & (csp * cn == sp)
+    merge2 = ~single & ~merge1 & (csp == sp * n)
+    merged = single | merge1 | merge2
+    keep_child = ~merged & ((n < cn) | ((n == cn) & (csp < sp)))
+    keep_parent = ~merged & ~keep_child
+
+    arr_list = []
+    if np.any(merged):
+        new_arr = arr[merged]
+        new_sp = np.where(single[merged] | merge2[merged], sp, csp[merged])
+        new_arr[:, n_col] *= n
+        new_arr[:, sp_col] = new_sp
+        arr_list.append(new_arr)
+    if np.any(keep_child):
+        # replicate each row n times with offset sp
+        sub_arr = arr[keep_child]
+        new_arr = np.repeat(sub_arr, n, axis=0)
+        offset = np.tile(np.arange(n, dtype=np.int64) * sp, sub_arr.shape[0])
+        new_arr[:, pos_cols] += offset[:, np.newaxis]
+        arr_list.append(new_arr)
+    if np.any(keep_parent):
+        # replicate each row by its own count with its own pitch, then use the copy array.
+        sub_arr = arr[keep_parent]
+        counts = sub_arr[:, n_col]
+        new_arr = np.repeat(sub_arr, counts, axis=0)
+        starts = np.cumsum(counts) - counts
+        idx_list = np.arange(new_arr.shape[0], dtype=np.int64) - np.repeat(starts, counts)
+        new_arr[:, pos_cols] += (idx_list * new_arr[:, sp_col])[:, np.newaxis]
+        new_arr[:, n_col] = n
+        new_arr[:, sp_col] = sp
+        arr_list.append(new_arr)
+
+    return np.concatenate(arr_list, axis=0)
+
+
+class _ChunkedArray(object):
+    """A growable 2D integer array.
+
+    Rows can be added one at a time or in bulk.  Single rows are buffered in a list and
+    converted to numpy array when the data is requested.
+
+    Parameters
+    ----------
+    ncol : int
+        number of columns.
+    """
+
+    def __init__(self, ncol):
+        # type: (int) -> None
+        self._ncol = ncol
+        self._chunks = []  # type: List[np.ndarray]
+        self._rows = []  # type: List[Tuple[int, ...]]
+        self._size = 0
+
+    def __len__(self):
+        # type: () -> int
+        return self._size
+
+    def append(self, row):
+        # type: (Tuple[int, ...]) -> None
+        self._rows.append(row)
+        self._size += 1
+
+    def _flush_rows(self):
+        # type: () -> None
+        if self._rows:
+            self._chunks.append(np.array(self._rows, dtype=np.int64).reshape(-1, self._ncol))
+            self._rows = []
+
+    def extend(self, arr):
+        # type: (np.ndarray) -> None
+        if arr.shape[0] > 0:
+            # keep rows in insertion order
+            self._flush_rows()
+            self._chunks.append(arr)
+            self._size += arr.shape[0]
+
+    def get_array(self):
+        # type: () -> np.ndarray
+        """Returns all rows as one array, compacting internal storage."""
+        self._flush_rows()
+        if not self._chunks:
+            return np.empty((0, self._ncol), dtype=np.int64)
+        if len(self._chunks) > 1:
+            self._chunks = [np.concatenate(self._chunks, axis=0)]
+        return self._chunks[0]
+
+
+class RectStore(object):
+    """Columnar storage of (arrayed) rectangles.
+
+    Rectangles are grouped by layer.  Each layer stores an integer array with columns
+    xl, yb, xr, yt, nx, ny, spx, spy, all in resolution units.
+
+    Parameters
+    ----------
+    resolution : float
+        the layout resolution.
+    """
+
+    def __init__(self, resolution):
+        # type: (float) -> None
+        self._res = resolution
+        self._data = {}  # type: Dict[Layer, _ChunkedArray]
+
+    def __len__(self):
+        # type: () -> int
+        return sum((len(val) for val in self._data.values()))
+
+    @property
+    def resolution(self):
+        # type: () -> float
+        """The layout resolution."""
+        return self._res
+
+    def _get_chunked_array(self, layer):
+        # type: (Layer) -> _ChunkedArray
+        if layer not in self._data:
+            self._data[layer] = _ChunkedArray(RECT_NCOL)
+        return self._data[layer]
+
+    def add_rect(self, layer, xl, yb, xr, yt, nx=1, ny=1, spx=0, spy=0):
+        # type: (Layer, int, int, int, int, int, int, int, int) -> None
+        """Add a new (arrayed) rectangle.  All dimensions are in resolution units.
+
+        Parameters
+        ----------
+        layer : Layer
+            the (layer, purpose) pair.
+        xl : int
+            left coordinate.
+        yb : int
+            bottom coordinate.
+        xr : int
+            right coordinate.
+        yt : int
+            top coordinate.
+        nx : int
+            number of columns.
+        ny : int
+            number of rows.
+        spx : int
+            column pitch.
+        spy : int
+            row pitch.
+        """
+        self._get_chunked_array(layer).append((xl, yb, xr, yt, nx, ny, spx, spy))
+
+    def add_rect_arrays(self, layer, arr):
+        # type: (Layer, np.ndarray) -> None
+        """Add many rectangles on the same layer.
+
+        Parameters
+        ----------
+        layer : Layer
+            the (layer, purpose) pair.
+        arr : np.ndarray
+            an integer array of rectangles, in resolution units.  Must have either 4 columns
+            (xl, yb, xr, yt) or 8 columns (xl, yb, xr, yt, nx, ny, spx, spy).
+        """
+        # copy, so stored data does not alias the given array
+        arr = np.array(arr, dtype=np.int64)
+        if arr.ndim != 2 or (arr.shape[1] != 4 and arr.shape[1] != RECT_NCOL):
+            raise ValueError('Rectangle array must have shape (N, 4) or (N, %d).' % RECT_NCOL)
+        if np.any(arr[:, RECT_XR] <= arr[:, RECT_XL]) or np.any(arr[:, RECT_YT] <= arr[:, RECT_YB]):
+            raise ValueError('rectangle with non-physical bounding box found.')
+        if arr.shape[1] == 4:
+            full_arr = np.empty((arr.shape[0], RECT_NCOL), dtype=np.int64)
+            full_arr[:, :4] = arr
+            full_arr[:, RECT_NX:RECT_NY + 1] = 1
+            full_arr[:, RECT_SPX:RECT_SPY + 1] = 0
+            arr = full_arr
+        self._get_chunked_array(layer).extend(arr)
+
+    def move_by(self, dx, dy):
+        # type: (int, int) -> None
+        """Move all rectangles by the given amount, in resolution units."""
+        if dx != 0 or dy != 0:
+            for layer in self.layers():
+                arr = self._data[layer].get_array()
+                arr[:, RECT_XL] += dx
+                arr[:, RECT_XR] += dx
+                arr[:, RECT_YB] += dy
+                arr[:, RECT_YT] += dy
+
+    def extend(self, store):
+        # type: (RectStore) -> None
+        """Add all rectangles in the given store to this store."""
+        for layer, arr in store.items():
+            self._get_chunked_array(layer).extend(arr)
+
+    def transform(self, loc=(0, 0), orient='R0', nx=1, ny=1, spx=0, spy=0):
+        # type: (Tuple[int, int], str, int, int, int, int) -> RectStore
+        """Returns a new store with transformed and arrayed copies of all rectangles.
+
+        rotates first before shift, then creates arrayed copies.  All dimensions are in
+        resolution units.
+
+        Parameters
+        ----------
+        loc : Tuple[int, int]
+            location of the anchor.
+        orient : str
+            the orientation.
+        nx : int
+            number of columns.
+        ny : int
+            number of rows.
+        spx : int
+            column pitch.
+        spy : int
+            row pitch.
+
+        Returns
+        -------
+        store : RectStore
+            the new rectangle store.
+        """
+        sx, sy = _get_orient_signs(orient)
+        ans = RectStore(self._res)
+        for layer, arr in self.items():
+            arr = arr.copy()
+            _transform_axis(arr, RECT_XL, RECT_XR, RECT_NX, RECT_SPX, sx, loc[0])
+            _transform_axis(arr, RECT_YB, RECT_YT, RECT_NY, RECT_SPY, sy, loc[1])
+            arr = _array_axis(arr, (RECT_XL, RECT_XR), RECT_NX, RECT_SPX, nx, spx)
+            arr = _array_axis(arr, (RECT_YB, RECT_YT), RECT_NY, RECT_SPY, ny, spy)
+            ans._get_chunked_array(layer).extend(arr)
+        return ans
+
+    def layers(self):
+        # type: () -> List[Layer]
+        """Returns a list of layers in this store."""
+        return [layer for layer, val in self._data.items() if len(val) > 0]
+
+    def get_array(self, layer):
+        # type: (Layer) -> np.ndarray
+        """Returns the rectangle array on the given layer."""
+        if layer not in self._data:
+            return np.empty((0, RECT_NCOL), dtype=np.int64)
+        return self._data[layer].get_array()
+
+    def items(self):
+        # type: () -> Iterator[Tuple[Layer, np.ndarray]]
+        """Iterates over (layer, rectangle array) pairs."""
+        for layer in self.layers():
+            yield layer, self._data[layer].get_array()
+
+    def content_iter(self):
+        # type: () -> Iterator[Dict[str, Any]]
+        """Iterates over dictionary representations of all rectangles."""
+        res = self._res
+        for layer, arr in self.items():
+            lay_list = list(layer)
+            box_list = (arr[:, :4] * res).tolist()
+            arr_list = arr[:, RECT_NX:].tolist()
+            for (xl, yb, xr, yt), (nx, ny, spx, spy) in zip(box_list, arr_list):
+                content = dict(layer=list(lay_list),
+                               bbox=[[xl, yb], [xr, yt]],
+                               )
+                if nx > 1 or ny > 1:
+                    content['arr_nx'] = nx
+                    content['arr_ny'] = ny
+                    content['arr_spx'] = spx * res
+                    content['arr_spy'] = spy * res
+                yield content
+
+
+class ViaStore(object):
+    """Columnar storage of (arrayed) vias.
+
+    Vias are grouped by via ID.  Each via ID stores an integer array with columns
+    x, y, orientation index, num_rows, num_cols, sp_rows, sp_cols, enc1 (4 columns),
+    enc2 (4 columns), cut_width, cut_height, nx, ny, spx, spy.  All dimensions are in
+    resolution units.  A negative cut width/height means it is not specified.
+
+    Parameters
+    ----------
+    resolution : float
+        the layout resolution.
+    """
+
+    def __init__(self, resolution):
+        # type: (float) -> None
+        self._res = resolution
+        self._data = {}  # type: Dict[str, _ChunkedArray]
+
+    def __len__(self):
+        # type: () -> int
+        return sum((len(val) for val in self._data.values()))
+
+    @property
+    def resolution(self):
+        # type: () -> float
+        """The layout resolution."""
+        return self._res
+
+    def _get_chunked_array(self, via_id):
+        # type: (str) -> _ChunkedArray
+        if via_id not in self._data:
+            self._data[via_id] = _ChunkedArray(VIA_NCOL)
+        return self._data[via_id]
+
+    def add_via(self, params, nx=1, ny=1, spx=0, spy=0):
+        # type: (Dict[str, Any], int, int, int, int) -> None
+        """Add a new (arrayed) via.
+
+        Parameters
+        ----------
+        params : Dict[str, Any]
+            the via parameters dictionary, with dimensions in layout units.
+        nx : int
+            number of columns.
+        ny : int
+            number of rows.
+        spx : int
+            column pitch, in resolution units.
+        spy : int
+            row pitch, in resolution units.
+        """
+        res = self._res
+        loc = params['loc']
+        row = [int(round(loc[0] / res)), int(round(loc[1] / res)), orient_index[params['orient']],
+               params['num_rows'], params['num_cols'],
+               int(round(params['sp_rows'] / res)), int(round(params['sp_cols'] / res))]
+        row.extend((int(round(val / res)) for val in params['enc1']))
+        row.extend((int(round(val / res)) for val in params['enc2']))
+        row.append(int(round(params['cut_width'] / res)) if 'cut_width' in params else -1)
+        row.append(int(round(params['cut_height'] / res)) if 'cut_height' in params else -1)
+        row.extend((nx, ny, spx, spy))
+        self._get_chunked_array(params['id']).append(tuple(row))
+
+    def add_via_arrays(self, via_id, arr):
+        # type: (str, np.ndarray) -> None
+        """Add many vias with the same via ID.
+
+        Parameters
+        ----------
+        via_id : str
+            the via ID.
+        arr : np.ndarray
+            an integer array of vias with VIA_NCOL columns.
+        """
+        arr = np.asarray(arr, dtype=np.int64)
+        if arr.ndim != 2 or arr.shape[1] != VIA_NCOL:
+            raise ValueError('Via array must have shape (N, %d).' % VIA_NCOL)
+        self._get_chunked_array(via_id).extend(arr)
+
+    def extend(self, store):
+        # type: (ViaStore) -> None
+        """Add all vias in the given store to this store."""
+        for via_id, arr in store.items():
+            self._get_chunked_array(via_id).extend(arr)
+
+    def transform(self, loc=(0, 0), orient='R0', nx=1, ny=1, spx=0, spy=0):
+        # type: (Tuple[int, int], str, int, int, int, int) -> ViaStore
+        """Returns a new store with transformed and arrayed copies of all vias.
+
+        rotates first before shift, then creates arrayed copies.  All dimensions are in
+        resolution units.
+
+        Parameters
+        ----------
+        loc : Tuple[int, int]
+            location of the anchor.
+        orient : str
+            the orientation.
+        nx : int
+            number of columns.
+        ny : int
+            number of rows.
+        spx : int
+            column pitch.
+        spy : int
+            row pitch.
+
+        Returns
+        -------
+        store : ViaStore
+            the new via store.
+        """
+        sx, sy = _get_orient_signs(orient)
+        code = orient_index[orient]
+        ans = ViaStore(self._res)
+        for via_id, arr in self.items():
+            if np.any(arr[:, VIA_ORIENT] >= 4):
+                raise ValueError('Cannot transform vias with 90 degree rotations.')
+            arr = arr.copy()
+            # assume no 90-degree-ish turns; num rows and num cols stay the same.
+            arr[:, VIA_ORIENT] ^= code
+            _transform_axis(arr, VIA_X, None, VIA_NX, VIA_SPX, sx, loc[0])
+            _transform_axis(arr, VIA_Y, None, VIA_NY, VIA_SPY, sy, loc[1])
+            arr = _array_axis(arr, (VIA_X,), VIA_NX, VIA_SPX, nx, spx)
+            arr = _array_axis(arr, (VIA_Y,), VIA_NY, VIA_SPY, ny, spy)
+            ans._get_chunked_array(via_id).extend(arr)
+        return ans
+
+    def via_ids(self):
+        # type: () -> List[str]
+        """Returns a list of via IDs in this store."""
+        return [via_id for via_id, val in self._data.items() if len(val) > 0]
+
+    def get_array(self, via_id):
+        # type: (str) -> np.ndarray
+        """Returns the via array of the given via ID."""
+        if via_id not in self._data:
+            return np.empty((0, VIA_NCOL), dtype=np.int64)
+        return self._data[via_id].get_array()
+
+    def items(self):
+        # type: () -> Iterator[Tuple[str, np.ndarray]]
+        """Iterates over (via ID, via array) pairs."""
+        for via_id in self.via_ids():
+            yield via_id, self._data[via_id].get_array()
+
+    def content_iter(self):
+        # type: () -> Iterator[ViaInfo]
+        """Iterates over dictionary representations of all vias."""
+        res = self._res
+        for via_id, arr in self.items():
+            int_list = arr.tolist()
+            float_list = (arr * res).tolist()
+            for irow, frow in zip(int_list, float_list):
+                content = ViaInfo(res,
+                                  id=via_id,
+                                  loc=[frow[VIA_X], frow[VIA_Y]],
+                                  orient=orient_list[irow[VIA_ORIENT]],
+                                  num_rows=irow[VIA_NUM_ROWS],
+                                  num_cols=irow[VIA_NUM_COLS],
+                                  sp_rows=frow[VIA_SP_ROWS],
+                                  sp_cols=frow[VIA_SP_COLS],
+                                  enc1=frow[VIA_ENC1:VIA_ENC1 + 4],
+                                  enc2=frow[VIA_ENC2:VIA_ENC2 + 4],
+                                  )
+                if irow[VIA_CUT_W] >= 0:
+                    content['cut_width'] = frow[VIA_CUT_W]
+                if irow[VIA_CUT_H] >= 0:
+                    content['cut_height'] = frow[VIA_CUT_H]
+                if irow[VIA_NX] > 1 or irow[VIA_NY] > 1:
+                    content['arr_nx'] = irow[VIA_NX]
+                    content['arr_ny'] = irow[VIA_NY]
+                    content['arr_spx'] = frow[VIA_SPX]
+                    content['arr_spy'] = frow[VIA_SPY]
+                yield content
+
+
+class InstStore(object):
+    """Columnar storage of (arrayed) primitive instances.
+
+    Each instance is stored as a row of an integer array with columns x, y, orientation
+    index, nx, ny, spx, spy, and prototype index, all in resolution units.  Array pitches
+    are stored after rotation, as used by layout templates.  The prototype index refers to
+    a dictionary containing the library, cell, view, name, and parameters of the instance.
+
+    Parameters
+    ----------
+    resolution : float
+        the layout resolution.
+    """
+
+    def __init__(self, resolution):
+        # type: (float) -> None
+        self._res = resolution
+        self._proto_list = []  # type: List[Dict[str, Any]]
+        self._data = _ChunkedArray(INST_NCOL)
+
+    def __len__(self):
+        # type: () -> int
+        return len(self._data)
+
+    @property
+    def resolution(self):
+        # type: () -> float
+        """The layout resolution."""
+        return self._res
+
+    def add_inst(self, inst_info):
+        # type: (InstanceInfo) -> None
+        """Add a primitive instance.
+
+        Parameters
+        ----------
+        inst_info : InstanceInfo
+            the instance information dictionary.
+        """
+        res = self._res
+        orient = inst_info.orient
+        # undo the array pitch correction of InstanceInfo
+        sx, sy = _get_orient_signs(orient)
+        proto = dict(lib=inst_info.lib, cell=inst_info.cell, view=inst_info.view, name=inst_info.name)
+        if 'params' in inst_info:
+            proto['params'] = inst_info.params
+        loc = inst_info.loc
+        self._data.append((int(round(loc[0] / res)), int(round(loc[1] / res)), orient_index[orient],
+                           inst_info.num_cols, inst_info.num_rows,
+                           sx * int(round(inst_info.sp_cols / res)), sy * int(round(inst_info.sp_rows / res)),
+                           len(self._proto_list)))
+        self._proto_list.append(proto)
+
+    def extend(self, store):
+        # type: (InstStore) -> None
+        """Add all instances in the given store to this store."""
+        arr = store._data.get_array()
+        if arr.shape[0] > 0:
+            arr = arr.copy()
+            arr[:, INST_PROTO] += len(self._proto_list)
+            self._proto_list.extend(store._proto_list)
+            self._data.extend(arr)
+
+    def transform(self, loc=(0, 0), orient='R0', nx=1, ny=1, spx=0, spy=0):
+        # type: (Tuple[int, int], str, int, int, int, int) -> InstStore
+        """Returns a new store with transformed and arrayed copies of all instances.
+
+        rotates first before shift, then creates arrayed copies.  All dimensions are in
+        resolution units.
+
+        Parameters
+        ----------
+        loc : Tuple[int, int]
+            location of the anchor.
+        orient : str
+            the orientation.
+        nx : int
+            number of columns.
+        ny : int
+            number of rows.
+        spx : int
+            column pitch.
+        spy : int
+            row pitch.
+
+        Returns
+        -------
+        store : InstStore
+            the new instance store.
+        """
+        sx, sy = _get_orient_signs(orient)
+        ans = InstStore(self._res)
+        ans._proto_list = list(self._proto_list)
+        arr = self._data.get_array()
+        if arr.shape[0] > 0:
+            arr = arr.copy()
+            arr[:, INST_ORIENT] ^= orient_index[orient]
+            _transform_axis(arr, INST_X, None, INST_NX, INST_SPX, sx, loc[0])
+            _transform_axis(arr, INST_Y, None, INST_NY, INST_SPY, sy, loc[1])
+            arr = _array_axis(arr, (INST_X,), INST_NX, INST_SPX, nx, spx)
+            arr = _array_axis(arr, (INST_Y,), INST_NY, INST_SPY, ny, spy)
+            ans._data.extend(arr)
+        return ans
+
+    def get_array(self):
+        # type: () -> np.ndarray
+        """Returns the instance array."""
+        return self._data.get_array()
+
+    def get_prototype(self, idx):
+        # type: (int) -> Dict[str, Any]
+        """Returns the instance prototype dictionary with the given index."""
+        return self._proto_list[idx]
+
+    def content_iter(self):
+        # type: () -> Iterator[InstanceInfo]
+        """Iterates over dictionary representations of all instances."""
+        res = self._res
+        arr = self._data.get_array()
+        for row in arr.tolist():
+            proto = self._proto_list[row[INST_PROTO]]
+            yield InstanceInfo(res,
+                               loc=[row[INST_X] * res, row[INST_Y] * res],
+                               orient=orient_list[row[INST_ORIENT]],
+                               num_rows=row[INST_NY],
+                               num_cols=row[INST_NX],
+                               sp_rows=row[INST_SPY] * res,
+                               sp_cols=row[INST_SPX] * res,
+                               **proto)
+
+
+class PathStore(object):
+    """Columnar storage of paths.
+
+    Points of all paths are stored in one integer array with columns x and y.  Each path is
+    stored as a row of another integer array with columns number of points, width, and
+    prototype index, all in resolution units.  The prototype index refers to a tuple of
+    (layer, end style, join style).
+
+    Parameters
+    ----------
+    resolution : float
+        the layout resolution.
+    """
+
+    def __init__(self, resolution):
+        # type: (float) -> None
+        self._res = resolution
+        self._proto_list = []  # type: List[Tuple[Layer, str, str]]
+        self._proto_lookup = {}  # type: Dict[Tuple[Layer, str, str], int]
+        self._points = _ChunkedArray(2)
+        self._data = _ChunkedArray(PATH_NCOL)
+
+    def __len__(self):
+        # type: () -> int
+        return len(self._data)
+
+    @property
+    def resolution(self):
+        # type: () -> float
+        """The layout resolution."""
+        return self._res
+
+    def _get_proto_index(self, proto):
+        # type: (Tuple[Layer, str, str]) -> int
+        idx = self._proto_lookup.get(proto, None)
+        if idx is None:
+            idx = len(self._proto_list)
+            self._proto_list.append(proto)
+            self._proto_lookup[proto] = idx
+        return idx
+
+    def add_path(self, layer, width, points, end_style='truncate', join_style='extend'):
+        # type: (Layer, int, np.ndarray, str, str) -> None
+        """Add a path.  All dimensions are in resolution units.
+
+        Parameters
+        ----------
+        layer : Layer
+            the (layer, purpose) pair.
+        width : int
+            the path width.
+        points : np.ndarray
+            the path points as an (N, 2) integer array.  Collinear/duplicate points are removed.
+        end_style : str
+            the path end style.
+        join_style : str
+            the path join style.
+        """
+        points = Path.compress_points(points)
+        proto_idx = self._get_proto_index((tuple(layer), end_style, join_style))
+        self._points.extend(points.astype(np.int64))
+        self._data.append((points.shape[0], width, proto_idx))
+
+    def extend(self, store):
+        # type: (PathStore) -> None
+        """Add all paths in the given store to this store."""
+        arr = store._data.get_array()
+        if arr.shape[0] > 0:
+            arr = arr.copy()
+            idx_map = np.array([self._get_proto_index(proto) for proto in store._proto_list], dtype=np.int64)
+            arr[:, PATH_PROTO] = idx_map[arr[:, PATH_PROTO]]
+            self._data.extend(arr)
+            self._points.extend(store._points.get_array())
+
+    def transform(self, loc=(0, 0), orient='R0', nx=1, ny=1, spx=0, spy=0):
+        # type: (Tuple[int, int], str, int, int, int, int) -> PathStore
+        """Returns a new store with transformed and arrayed copies of all paths.
+
+        rotates first before shift, then creates arrayed copies.  All dimensions are in
+        resolution units.  Mirroring and shifting preserves collinearity, so the points do
+        not need to be compressed again.
+
+        Parameters
+        ----------
+        loc : Tuple[int, int]
+            location of the anchor.
+        orient : str
+            the orientation.
+        nx : int
+            number of columns.
+        ny : int
+            number of rows.
+        spx : int
+            column pitch.
+        spy : int
+            row pitch.
+
+        Returns
+        -------
+        store : PathStore
+            the new path store.
+        """
+        sx, sy = _get_orient_signs(orient)
+        ans = PathStore(self._res)
+        ans._proto_list = list(self._proto_list)
+        ans._proto_lookup = dict(self._proto_lookup)
+        arr = self._data.get_array()
+        if arr.shape[0] > 0:
+            pts = self._points.get_array() * np.array([sx, sy], dtype=np.int64) + np.array(loc, dtype=np.int64)
+            if nx > 1 or ny > 1:
+                # one copy of all paths per array element
+                xoff, yoff = np.meshgrid(np.arange(nx, dtype=np.int64) * spx,
+                                         np.arange(ny, dtype=np.int64) * spy, indexing='ij')
+                offsets = np.stack((xoff.ravel(), yoff.ravel()), axis=1)
+                pts = (pts[np.newaxis, :, :] + offsets[:, np.newaxis, :]).reshape(-1, 2)
+                arr = np.tile(arr, (nx * ny, 1))
+            ans._points.extend(pts)
+            ans._data.extend(arr)
+        return ans
+
+    def content_iter(self):
+        # type: () -> Iterator[Dict[str, Any]]
+        """Iterates over dictionary representations of all paths."""
+        res = self._res
+        arr = self._data.get_array()
+        pts_list = (self._points.get_array() * res).tolist()
+        start = 0
+        for npts, width, proto_idx in arr.tolist():
+            layer, end_style, join_style = self._proto_list[proto_idx]
+            stop = start + npts
+            yield dict(layer=list(layer),
+                       width=width * res,
+                       points=[(x, y) for x, y in pts_list[start:stop]],
+                       end_style=end_style,
+                       join_style=join_style,
+                       )
+            start = stop
+
+
+class FlatGeometry(object):
+    """The flattened geometries of a layout, stored in columnar format.
+
+    Parameters
+    ----------
+    resolution : float
+        the layout resolution.
+    """
+
+    def __init__(self, resolution):
+        # type: (float) -> None
+        self._res = resolution
+        self.rect_store = RectStore(resolution)
+        self.via_store = ViaStore(resolution)
+        self.inst_store = InstStore(resolution)
+        self.path_store = PathStore(resolution)
+
+    @property
+    def resolution(self):
+        # type: () -> float
+        """The layout resolution."""
+        return self._res
+
+    def extend(self, geo):
+        # type: (FlatGeometry) -> None
+        """Add all geometries in the given FlatGeometry to this object."""
+        self.rect_store.extend(geo.rect_store)
+        self.via_store.extend(geo.via_store)
+        self.inst_store.extend(geo.inst_store)
+        self.path_store.extend(geo.path_store)
+
+    def transform(self, loc=(0, 0), orient='R0', nx=1, ny=1, spx=0, spy=0):
+        # type: (Tuple[int, int], str, int, int, int, int) -> FlatGeometry
+        """Returns transformed and arrayed copies of all geometries.
+
+        rotates first before shift, then creates arrayed copies.  All dimensions are in
+        resolution units.
+
+        Parameters
+        ----------
+        loc : Tuple[int, int]
+            location of the anchor.
+        orient : str
+            the orientation.
+        nx : int
+            number of columns.
+        ny : int
+            number of rows.
+        spx : int
+            column pitch.
+        spy : int
+            row pitch.
+
+        Returns
+        -------
+        geo : FlatGeometry
+            the transformed geometries.
+        """
+        ans = FlatGeometry(self._res)
+        ans.rect_store = self.rect_store.transform(loc=loc, orient=orient, nx=nx, ny=ny, spx=spx, spy=spy)
+        ans.via_store = self.via_store.transform(loc=loc, orient=orient, nx=nx, ny=ny, spx=spx, spy=spy)
+        ans.inst_store = self.inst_store.transform(loc=loc, orient=orient, nx=nx, ny=ny, spx=spx, spy=spy)
+        ans.path_store = self.path_store.transform(loc=loc, orient=orient, nx=nx, ny=ny, spx=spx, spy=spy)
+        return ans
+
+
+class ContentView(object):
+    """A lazy, read-only sequence view of layout content dictionaries.
+
+    Dictionaries are created on demand from the underlying columnar stores and
+    plain lists, and are not kept in memory.
+
+    Parameters
+    ----------
+    sources : Iterable[Union[RectStore, ViaStore, InstStore, PathStore, List[Dict[str, Any]]]]
+        the content sources, in iteration order.
+    """
+
+    def __init__(self, sources):
+        # type: (Iterable[Union[RectStore, ViaStore, InstStore, PathStore, List[Dict[str, Any]]]]) -> None
+        self._sources = list(sources)
+
+    def __len__(self):
+        # type: () -> int
+        return sum((len(src) for src in self._sources))
+
+    def __iter__(self):
+        # type: () -> Iterator[Dict[str, Any]]
+        for src in self._sources:
+            if isinstance(src, RectStore) or isinstance(src, ViaStore) or isinstance(src, InstStore) or \
+                    isinstance(src, PathStore):
+                for content in src.content_iter():
+                    yield content
+            else:
+                for content in src:
+                    yield content
+
+    def __getitem__(self, idx):
+        # type: (int) -> Dict[str, Any]
+        """Returns the content dictionary at the given index.  Takes linear time."""
+        num = len(self)
+        if idx < 0:
+            idx += num
+        if idx < 0 or idx >= num:
+            raise IndexError('ContentView index out of range')
+        for content in self:
+            if idx == 0:
+                return content
+            idx -= 1
+
+    def to_list(self):
+        # type: () -> List[Dict[str, Any]]
+        """Returns all content dictionaries as a list."""
+        return list(self)
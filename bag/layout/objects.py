@@ -30,13 +30,13 @@ from __future__ import (absolute_import, division,
 from builtins import *
 from future.utils import with_metaclass
 
-from typing import Union, List, Tuple, Optional, Dict, Any
+from typing import Union, List, Tuple, Optional, Dict, Any, Iterable
 
 import abc
 import numpy as np
 from copy import deepcopy
 
-from .util import transform_table, BBox, BBoxArray, transform_point, transform_orient
+from .util import transform_table, BBox, BBoxArray, transform_point
 from .routing.base import Port, WireArray
 from .routing.fill import UsedTracks
 
@@ -626,6 +626,21 @@ class Instance(Arrayable):
         return self._master.grid.transform_track(layer_id, track_idx, dx=dx, dy=dy,
                                                  orient=self.orientation, unit_mode=True)
 
+    def get_flat_geometry(self):
+        """Flatten this instance and return the geometries in columnar format.
+
+        The master geometries under this instance's orientation are cached by the master,
+        so only the translation and arraying are computed here.
+
+        Returns
+        -------
+        flat_geo : bag.layout.geometry.FlatGeometry
+            the flattened geometries.
+        """
+        flat_geo = self._master.get_flat_geometry(orient=self._orient)
+        return flat_geo.transform(loc=self._loc_unit, nx=self.nx, ny=self.ny,
+                                  spx=self.spx_unit, spy=self.spy_unit)
+
     def flatten(self):
         """Flatten this instance and return the geometries.
 
@@ -640,96 +655,9 @@ class Instance(Arrayable):
         path_list :
             list of paths
         """
-        flat_inst_list, flat_rect_list, flat_via_list, flat_path_list = self.master.get_flat_geometries()
-
-        # add transformed/arrayed rectangles
-        inst_list = []
-        my_loc_unit = self._loc_unit
-        my_spx_unit = self.spx_unit
-        my_spy_unit = self.spy_unit
-        my_nx = self.nx
-        my_ny = self.ny
-        my_orient = self._orient
-        res = self.resolution
-        for obj in flat_inst_list:
-            nx = obj['num_cols']
-            ny = obj['num_rows']
-            spx = abs(obj['sp_cols'])  # TODO: figure out how to work around this hack
-            spy = abs(obj['sp_rows'])  # TODO: figure out how to work around this hack
-            xc, yc = obj['loc']
-            # use BBoxArray to calculate new inst arrays
-            barr = BBoxArray(BBox(xc - 1, yc - 1, xc + 1, yc + 1, res), nx=nx, ny=ny,
-                             spx=spx, spy=spy)
-            barr = barr.transform(loc=my_loc_unit, orient=my_orient, unit_mode=True)
-            bcol = barr.arrayed_copies(nx=my_nx, ny=my_ny, spx=my_spx_unit, spy=my_spy_unit, unit_mode=True)
-            # calculate new instance orientation
-            norient = transform_orient(obj['orient'], my_orient)
-            for box_arr in bcol:
-                # add arrayed copies of instances.
-                new_obj = obj.copy()
-                new_obj['orient'] = norient
-                new_obj['loc'] = box_arr.base.xc, box_arr.base.yc
-                new_obj['num_cols'] = box_arr.nx
-                new_obj['num_rows'] = box_arr.ny
-                new_obj['sp_cols'] = box_arr.spx
-                new_obj['sp_rows'] = box_arr.spy
-                inst_list.append(new_obj)
-
-        # add transformed/arrayed rectangles
-        rect_list = []
-        for rect in flat_rect_list:
-            # construct bbox array
-            (xl, yb), (xr, yt) = rect['bbox']
-            if 'arr_nx' in rect:
-                nx = rect['arr_nx']
-                ny = rect['arr_ny']
-                spx = rect['arr_spx']
-                spy = rect['arr_spy']
-            else:
-                nx = ny = 1
-                spx = spy = 0.0
-            barr = BBoxArray(BBox(xl, yb, xr, yt, res), nx=nx, ny=ny, spx=spx, spy=spy)
-            # transform and array bbox array
-            barr = barr.transform(loc=my_loc_unit, orient=my_orient, unit_mode=True)
-            bcol = barr.arrayed_copies(nx=my_nx, ny=my_ny, spx=my_spx_unit, spy=my_spy_unit, unit_mode=True)
-            rect_list.extend((Rect(rect['layer'], box_arr).content for box_arr in bcol))
-
-        # add transformed paths
-        # TODO: figure out how to transform path dictionary
-        # path_list = [path.transform(loc=my_loc_unit, orient=my_orient, unit_mode=True, copy=True)
-        #              for path in flat_path_list]
-        path_list = []
-
-        # add transformed/arrayed vias
-        via_list = []
-        for via in flat_via_list:
-            # assume no 90-degree-ish turns; num rows and num cols stay the same.
-            norient = transform_orient(via['orient'], my_orient)
-            if 'arr_nx' in via:
-                nx = via['arr_nx']
-                ny = via['arr_ny']
-                spx = via['arr_spx']
-                spy = via['arr_spy']
-            else:
-                nx = ny = 1
-                spx = spy = 0.0
-            via_x, via_y = via['loc']
-            # use BBoxArray to calculate new via arrays
-            barr = BBoxArray(BBox(via_x - 1, via_y - 1, via_x + 1, via_y + 1, res), nx=nx, ny=ny, spx=spx,
-                             spy=spy)
-            barr = barr.transform(loc=my_loc_unit, orient=my_orient, unit_mode=True)
-            bcol = barr.arrayed_copies(nx=my_nx, ny=my_ny, spx=my_spx_unit, spy=my_spy_unit, unit_mode=True)
-            for box_arr in bcol:
-                new_via = via.copy()
-                new_via['orient'] = norient
-                new_via['loc'] = box_arr.base.xc, box_arr.base.yc
-                new_via['arr_nx'] = box_arr.nx
-                new_via['arr_ny'] = box_arr.ny
-                new_via['arr_spx'] = box_arr.spx
-                new_via['arr_spy'] = box_arr.spy
-                via_list.append(new_via)
-
-        return inst_list, rect_list, via_list, path_list
+        flat_geo = self.get_flat_geometry()
+        return (list(flat_geo.inst_store.content_iter()), list(flat_geo.rect_store.content_iter()),
+                list(flat_geo.via_store.content_iter()), list(flat_geo.path_store.content_iter()))
 
     def get_port(self, name='', row=0, col=0):
         # type: (Optional[str], int, int) -> Port
@@ -994,33 +922,53 @@ class Path(Figure):
 
     @classmethod
     def compress_points(cls, pts_unit):
-        # remove collinear/duplicate points, and make sure all segments are 45 degrees.
-        cur_len = 0
-        pt_list = []
-        for x, y in pts_unit:
-            if cur_len == 0:
-                pt_list.append((x, y))
-                cur_len += 1
-            else:
-                lastx, lasty = pt_list[-1]
-                # make sure we don't have duplicate points
-                if x != lastx or y != lasty:
-                    dx, dy = x - lastx, y - lasty
-                    if dx != 0 and dy != 0 and abs(dx) != abs(dy):
-                        # we don't have 45 degree wires
-                        raise ValueError('Cannot have line segment (%d, %d)->(%d, %d) in path'
-                                         % (lastx, lasty, x, y))
-                    if cur_len >= 2:
-                        # check for collinearity
-                        dx0, dy0 = lastx - pt_list[-2][0], lasty - pt_list[-2][1]
-                        if (dx == 0 and dx0 == 0) or (dx != 0 and dx0 != 0 and dy / dx == dy0 / dx0):
-                            # collinear, remove middle point
-                            del pt_list[-1]
-                            cur_len -= 1
-                    pt_list.append((x, y))
-                    cur_len += 1
-
-        return pt_list
+        # type: (Union[np.ndarray, Iterable[Tuple[int, int]]]) -> np.ndarray
+        """Remove collinear/duplicate points, and make sure all segments are 45 degrees.
+
+        Parameters
+        ----------
+        pts_unit : Union[np.ndarray, Iterable[Tuple[int, int]]]
+            the path points in resolution units.
+
+        Returns
+        -------
+        pts_arr : np.ndarray
+            an (N, 2) integer array of compressed path points.
+        """
+        if not isinstance(pts_unit, np.ndarray):
+            pts_unit = list(pts_unit)
+        pts_arr = np.array(pts_unit, dtype=int).reshape(-1, 2)
+        checked = False
+        while pts_arr.shape[0] >= 2:
+            # remove duplicate points
+            keep = np.ones(pts_arr.shape[0], dtype=bool)
+            keep[1:] = np.any(pts_arr[1:] != pts_arr[:-1], axis=1)
+            pts_arr = pts_arr[keep]
+
+            delta = np.diff(pts_arr, axis=0)
+            dx, dy = delta[:, 0], delta[:, 1]
+            if not checked:
+                bad_idx = np.flatnonzero((dx != 0) & (dy != 0) & (np.abs(dx) != np.abs(dy)))
+                if bad_idx.size > 0:
+                    # we don't have 45 degree wires
+                    idx = bad_idx[0]
+                    raise ValueError('Cannot have line segment (%d, %d)->(%d, %d) in path'
+                                     % (pts_arr[idx, 0], pts_arr[idx, 1], pts_arr[idx + 1, 0], pts_arr[idx + 1, 1]))
+                checked = True
+            if pts_arr.shape[0] < 3:
+                break
+
+            # check for collinearity: segments are collinear if they have the same slope.
+            # slope code is 0 for vertical segments, 2 + dy / dx otherwise.
+            slope = np.where(dx == 0, 0, 2 + np.sign(dx) * np.sign(dy))
+            keep = np.ones(pts_arr.shape[0], dtype=bool)
+            keep[1:-1] = slope[1:] != slope[:-1]
+            if np.all(keep):
+                break
+            # removing points of reversed segments may create new duplicate points
+            pts_arr = pts_arr[keep]
+
+        return pts_arr
 
     @property
     def layer(self):
@@ -1038,6 +986,27 @@ class Path(Figure):
     def width(self):
         return self._width * self._res
 
+    @property
+    def width_unit(self):
+        # type: () -> int
+        return self._width
+
+    @property
+    def end_style(self):
+        # type: () -> str
+        return self._end_style
+
+    @property
+    def join_style(self):
+        # type: () -> str
+        return self._join_style
+
+    @property
+    def points_array(self):
+        # type: () -> np.ndarray
+        """The path points as an (N, 2) integer array in resolution units.  Should not be modified."""
+        return self._points
+
     @property
     def points(self):
         return [(self._points[idx][0] * self._res, self._points[idx][1] * self._res)
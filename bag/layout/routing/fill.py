@@ -30,7 +30,11 @@ from __future__ import (absolute_import, division,
 # noinspection PyUnresolvedReferences,PyCompatibility
 from builtins import *
 
-from typing import Optional, Union, List, Tuple, Generator, Any, Dict
+import math
+import time
+import bisect
+from itertools import chain
+from typing import Optional, Union, List, Tuple, Generator, Any, Dict, Iterable
 
 import numpy as np
 
@@ -39,24 +43,88 @@ from .base import WireArray, TrackID
 from .grid import RoutingGrid
 
 
+def _get_track_transform(grid, layer_id, dx, dy, orient):
+    # type: (RoutingGrid, int, int, int, str) -> Tuple[int, int, int, int]
+    """Returns the transformation of half track indices and intervals on the given layer.
+
+    Parameters
+    ----------
+    grid : RoutingGrid
+        the RoutingGrid object.
+    layer_id : int
+        the layer ID.
+    dx : int
+        the X shift in resolution units.
+    dy : int
+        the Y shift in resolution units.
+    orient : str
+        the orientation.
+
+    Returns
+    -------
+    hidx_scale : int
+        the half track index scale, either 1 or -1.
+    hidx_shift : int
+        the half track index shift, applied after scaling.
+    intv_scale : int
+        the interval scale, either 1 or -1.
+    intv_shift : int
+        the interval shift, applied after scaling.
+    """
+    is_x = grid.get_direction(layer_id) == 'x'
+    if is_x:
+        hidx_shift = int(2 * grid.coord_to_track(layer_id, dy, unit_mode=True)) + 1
+        intv_shift = dx
+    else:
+        hidx_shift = int(2 * grid.coord_to_track(layer_id, dx, unit_mode=True)) + 1
+        intv_shift = dy
+
+    hidx_scale = intv_scale = 1
+    if orient == 'R180':
+        hidx_scale = -1
+        intv_scale = -1
+    elif orient == 'MX':
+        if is_x:
+            hidx_scale = -1
+        else:
+            intv_scale = -1
+    elif orient == 'MY':
+        if is_x:
+            intv_scale = -1
+        else:
+            hidx_scale = -1
+
+    return hidx_scale, hidx_shift, intv_scale, intv_shift
+
+
 class TrackSet(object):
     """A data structure that stored tracks on the same layer.
 
+    Besides the interval sets of each track, this class keeps a sorted list of half track
+    indices and upper bounds on the stored track width and margin, so region queries
+    only need to visit tracks near the given region.
+
     Parameters
     ----------
     min_length : int
         Make sure all stored track has at least min_length.
     init_tracks : Optional[Dict[int, IntervalSet]]
         Dictionary of initial tracks.
+    max_margin : int
+        upper bound on margins of the initial tracks.
     """
-    def __init__(self, min_length=0, init_tracks=None):
-        # type: (float, Optional[Dict[int, IntervalSet]]) -> None
+    def __init__(self, min_length=0, init_tracks=None, max_margin=0):
+        # type: (float, Optional[Dict[int, IntervalSet]], int) -> None
         if init_tracks is None:
             init_tracks = {}  # type: Dict[int, IntervalSet]
         else:
             pass
         self._tracks = init_tracks
         self._min_len = min_length
+        self._hidx_list = sorted(init_tracks.keys())
+        self._max_width = max(chain([0], (val[0] for intv_set in init_tracks.values()
+                                           for val in intv_set.values())))
+        self._max_margin = max_margin
 
     def __contains__(self, item):
         # type: (int) -> bool
@@ -80,6 +148,46 @@ class TrackSet(object):
         # type: () -> Generator[Tuple[int, IntervalSet]]
         return self._tracks.items()
 
+    @property
+    def max_width(self):
+        # type: () -> int
+        """Upper bound on the width of all stored tracks."""
+        return self._max_width
+
+    @property
+    def max_margin(self):
+        # type: () -> int
+        """Upper bound on the margin of all stored tracks."""
+        return self._max_margin
+
+    def overlap_items(self, hidx_lower, hidx_upper, intv):
+        # type: (int, int, Tuple[int, int]) -> Generator[Tuple[int, Tuple[int, int], Any]]
+        """Iterates over stored intervals in the given half track range that overlap the given interval.
+
+        Parameters
+        ----------
+        hidx_lower : int
+            the lowest half track index, inclusive.
+        hidx_upper : int
+            the highest half track index, inclusive.
+        intv : Tuple[int, int]
+            the interval.
+
+        Yields
+        ------
+        hidx : int
+            the half track index.
+        ovl_intv : Tuple[int, int]
+            the overlapping interval.
+        val : Any
+            value associated with ovl_intv.
+        """
+        start = bisect.bisect_left(self._hidx_list, hidx_lower)
+        stop = bisect.bisect_right(self._hidx_list, hidx_upper)
+        for hidx in self._hidx_list[start:stop]:
+            for ovl_intv, val in self._tracks[hidx].overlap_items(intv):
+                yield hidx, ovl_intv, val
+
     def subtract(self, hidx, intv):
         # type: (int, Tuple[int, int]) -> None
         """Subtract the given intervals from this TrackSet."""
@@ -92,9 +200,10 @@ class TrackSet(object):
                     intv_set.remove(intv)
             if not intv_set:
                 del self._tracks[hidx]
+                del self._hidx_list[bisect.bisect_left(self._hidx_list, hidx)]
 
-    def add_track(self, hidx, intv, width, value=None):
-        # type: (int, Tuple[int, int], int, Any) -> None
+    def add_track(self, hidx, intv, width, value=None, margin=0):
+        # type: (int, Tuple[int, int], int, Any, int) -> None
         """Add tracks to this data structure.
 
         Parameters
@@ -107,14 +216,20 @@ class TrackSet(object):
             the track width.
         value : Any
             value associated with this track.
+        margin : int
+            the margin around this track.  Only used to bound region queries.
         """
         if intv[1] - intv[0] >= self._min_len:
             if hidx not in self._tracks:
                 intv_set = IntervalSet()
                 self._tracks[hidx] = intv_set
+                bisect.insort(self._hidx_list, hidx)
             else:
                 intv_set = self._tracks[hidx]
 
+            self._max_width = max(self._max_width, width)
+            self._max_margin = max(self._max_margin, margin)
+
             # TODO: add more robust checking?
             intv_set.add(intv, val=[width, value], merge=True)
 
@@ -140,42 +255,44 @@ class TrackSet(object):
         result : TrackSet
             the new TrackSet.
         """
-        is_x = grid.get_direction(layer_id) == 'x'
-        if is_x:
-            hidx_shift = int(2 * grid.coord_to_track(layer_id, dy, unit_mode=True)) + 1
-            intv_shift = dx
-        else:
-            hidx_shift = int(2 * grid.coord_to_track(layer_id, dx, unit_mode=True)) + 1
-            intv_shift = dy
+        return self.transform_by(*_get_track_transform(grid, layer_id, dx, dy, orient))
 
-        hidx_scale = intv_scale = 1
-        if orient == 'R180':
-            hidx_scale = -1
-            intv_scale = -1
-        elif orient == 'MX':
-            if is_x:
-                hidx_scale = -1
-            else:
-                intv_scale = -1
-        elif orient == 'MY':
-            if is_x:
-                intv_scale = -1
-            else:
-                hidx_scale = -1
+    def transform_by(self, hidx_scale, hidx_shift, intv_scale, intv_shift):
+        # type: (int, int, int, int) -> TrackSet
+        """Return a new TrackSet with the given track transformation.
+
+        Parameters
+        ----------
+        hidx_scale : int
+            the half track index scale, either 1 or -1.
+        hidx_shift : int
+            the half track index shift, applied after scaling.
+        intv_scale : int
+            the interval scale, either 1 or -1.
+        intv_shift : int
+            the interval shift, applied after scaling.
 
+        Returns
+        -------
+        result : TrackSet
+            the new TrackSet.
+        """
         new_tracks = {}
         for hidx, intv_set in self._tracks.items():
             new_tracks[hidx * hidx_scale + hidx_shift] = intv_set.transform(intv_scale, intv_shift)
 
-        return TrackSet(min_length=self._min_len, init_tracks=new_tracks)
+        return TrackSet(min_length=self._min_len, init_tracks=new_tracks, max_margin=self._max_margin)
 
     def merge(self, track_set):
         # type: (TrackSet) -> None
         """Merge the given TrackSet to this one."""
+        self._max_width = max(self._max_width, track_set._max_width)
+        self._max_margin = max(self._max_margin, track_set._max_margin)
         for hidx, new_intv_set in track_set._tracks.items():
             if hidx not in self._tracks:
                 intv_set = IntervalSet()
                 self._tracks[hidx] = intv_set
+                bisect.insort(self._hidx_list, hidx)
             else:
                 intv_set = self._tracks[hidx]
 
@@ -183,9 +300,295 @@ class TrackSet(object):
                 intv_set.add(intv, val, merge=True)
 
 
+class TrackOccupancy(object):
+    """A coarse occupancy map of used tracks on a layer.
+
+    Half track indices and coordinates are divided into bins, and each bin records whether any
+    used track may touch it.  A summed-area table makes region checks constant time, so callers
+    can skip empty regions before doing exact interval checks.
+
+    Parameters
+    ----------
+    bounds : Optional[Tuple[int, int, int, int]]
+        the lower/upper half track index and the lower/upper coordinate of all used tracks.
+        None if there are no used tracks.
+    hidx0 : np.ndarray
+        the lower half track index of each used track rectangle, inclusive.
+    hidx1 : np.ndarray
+        the upper half track index of each used track rectangle, inclusive.
+    intv0 : np.ndarray
+        the lower coordinate of each used track rectangle.
+    intv1 : np.ndarray
+        the upper coordinate of each used track rectangle.
+    num_bins : int
+        maximum number of bins in each dimension.
+    """
+
+    def __init__(self, bounds, hidx0, hidx1, intv0, intv1, num_bins=32):
+        # type: (Optional[Tuple[int, int, int, int]], np.ndarray, np.ndarray, np.ndarray, np.ndarray, int) -> None
+        self._bounds = bounds
+        if bounds is None:
+            self._hidx_bin = self._intv_bin = 1
+            self._sat = np.zeros((1, 1), dtype=np.int64)
+            return
+
+        hidx_lower, hidx_upper, intv_lower, intv_upper = bounds
+        self._hidx_bin = max(1, -(-(hidx_upper - hidx_lower + 1) // num_bins))
+        self._intv_bin = max(1, -(-(intv_upper - intv_lower) // num_bins))
+        num_hbin = (hidx_upper - hidx_lower) // self._hidx_bin + 1
+        num_ibin = max(1, -(-(intv_upper - intv_lower) // self._intv_bin))
+
+        # mark all bins touched by each rectangle with a 2D difference array
+        hb0, hb1 = self._get_hidx_bins(hidx0, hidx1)
+        ib0, ib1 = self._get_intv_bins(intv0, intv1)
+        valid = (hb0 <= hb1) & (ib0 <= ib1)
+        hb0, hb1, ib0, ib1 = hb0[valid], hb1[valid] + 1, ib0[valid], ib1[valid] + 1
+        diff = np.zeros((num_hbin + 1, num_ibin + 1), dtype=np.int64)
+        np.add.at(diff, (hb0, ib0), 1)
+        np.add.at(diff, (hb0, ib1), -1)
+        np.add.at(diff, (hb1, ib0), -1)
+        np.add.at(diff, (hb1, ib1), 1)
+        bitmap = (diff.cumsum(axis=0).cumsum(axis=1)[:num_hbin, :num_ibin] > 0)
+
+        self._bitmap = bitmap
+        self._sat = np.zeros((num_hbin + 1, num_ibin + 1), dtype=np.int64)
+        self._sat[1:, 1:] = bitmap.cumsum(axis=0).cumsum(axis=1)
+
+    def _get_hidx_bins(self, hidx0, hidx1):
+        # type: (Any, Any) -> Tuple[Any, Any]
+        """Returns the bins of the given half track index ranges."""
+        return (hidx0 - self._bounds[0]) // self._hidx_bin, (hidx1 - self._bounds[0]) // self._hidx_bin
+
+    def _get_intv_bins(self, intv0, intv1):
+        # type: (Any, Any) -> Tuple[Any, Any]
+        """Returns the bins that overlap the given intervals."""
+        return (intv0 - self._bounds[2]) // self._intv_bin, -((self._bounds[2] - intv1) // self._intv_bin) - 1
+
+    @property
+    def bounds(self):
+        # type: () -> Optional[Tuple[int, int, int, int]]
+        """The lower/upper half track index and the lower/upper coordinate of all used tracks."""
+        return self._bounds
+
+    def may_overlap(self, hidx_lower, hidx_upper, intv):
+        # type: (int, int, Tuple[int, int]) -> bool
+        """Returns True if a used track may overlap the given region.
+
+        This method takes constant time.  If False is returned, no used track in the given
+        half track range overlaps the given interval.
+
+        Parameters
+        ----------
+        hidx_lower : int
+            the lowest half track index, inclusive.
+        hidx_upper : int
+            the highest half track index, inclusive.
+        intv : Tuple[int, int]
+            the interval.
+
+        Returns
+        -------
+        may_overlap : bool
+            True if a used track may overlap the given region.
+        """
+        if self._bounds is None:
+            return False
+        hidx_lower = max(hidx_lower, self._bounds[0])
+        hidx_upper = min(hidx_upper, self._bounds[1])
+        intv0 = max(intv[0], self._bounds[2])
+        intv1 = min(intv[1], self._bounds[3])
+        if hidx_lower > hidx_upper or intv0 > intv1 or intv0 >= self._bounds[3] or intv1 <= self._bounds[2]:
+            return False
+
+        hb0, hb1 = self._get_hidx_bins(hidx_lower, hidx_upper)
+        ib0, ib1 = self._get_intv_bins(intv0, intv1)
+        # zero length intervals still overlap intervals that contain them
+        ib1 = max(ib0, ib1)
+        sat = self._sat
+        return sat[hb1 + 1, ib1 + 1] - sat[hb0, ib1 + 1] - sat[hb1 + 1, ib0] + sat[hb0, ib0] > 0
+
+    def get_bin_rects(self):
+        # type: () -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+        """Returns the occupied bins as rectangles.
+
+        Returns
+        -------
+        hidx0 : np.ndarray
+            the lower half track index of each bin, inclusive.
+        hidx1 : np.ndarray
+            the upper half track index of each bin, inclusive.
+        intv0 : np.ndarray
+            the lower coordinate of each bin.
+        intv1 : np.ndarray
+            the upper coordinate of each bin.
+        """
+        if self._bounds is None:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty, empty
+
+        hidx_lower, hidx_upper, intv_lower, intv_upper = self._bounds
+        hb, ib = np.nonzero(self._bitmap)
+        hidx0 = hidx_lower + hb * self._hidx_bin
+        hidx1 = np.minimum(hidx0 + self._hidx_bin - 1, hidx_upper)
+        intv0 = intv_lower + ib * self._intv_bin
+        intv1 = np.minimum(intv0 + self._intv_bin, intv_upper)
+        return hidx0, hidx1, intv0, intv1
+
+
+class TrackSetView(object):
+    """A read-only view of the used tracks on a layer, including tracks of instances.
+
+    Instance tracks are not copied.  Instead, queries are transformed to the coordinates of
+    each instance master, so only tracks near the queried region are visited.
+
+    Parameters
+    ----------
+    track_set : Optional[TrackSet]
+        the tracks that are not in any instances.
+    inst_list : List[Tuple[TrackSetView, List[Tuple[int, int, int, int]]]]
+        list of instance track views, and the track transformations of each instance
+        in the array.  See _get_track_transform() for the transformation format.
+    """
+
+    def __init__(self, track_set, inst_list):
+        # type: (Optional[TrackSet], List[Tuple[TrackSetView, List[Tuple[int, int, int, int]]]]) -> None
+        self._track_set = track_set
+        self._inst_list = [(view, xform_list) for view, xform_list in inst_list
+                           if view.bounds is not None and xform_list]
+
+        # compute bounds of all tracks
+        if track_set is None:
+            self._max_width = self._max_margin = 0
+            bnd_list = []
+        else:
+            self._max_width = track_set.max_width
+            self._max_margin = track_set.max_margin
+            bnd_list = [(hidx, hidx, intv_set.get_start(), intv_set.get_end())
+                        for hidx, intv_set in track_set.items() if intv_set]
+        for view, xform_list in self._inst_list:
+            self._max_width = max(self._max_width, view.max_width)
+            self._max_margin = max(self._max_margin, view.max_margin)
+            hidx_lower, hidx_upper, intv_lower, intv_upper = view.bounds
+            for hidx_scale, hidx_shift, intv_scale, intv_shift in xform_list:
+                hidx0, hidx1 = sorted((hidx_lower * hidx_scale + hidx_shift, hidx_upper * hidx_scale + hidx_shift))
+                intv0, intv1 = sorted((intv_lower * intv_scale + intv_shift, intv_upper * intv_scale + intv_shift))
+                bnd_list.append((hidx0, hidx1, intv0, intv1))
+
+        if bnd_list:
+            self._bounds = (min((bnd[0] for bnd in bnd_list)), max((bnd[1] for bnd in bnd_list)),
+                            min((bnd[2] for bnd in bnd_list)), max((bnd[3] for bnd in bnd_list)))
+        else:
+            self._bounds = None
+        self._occupancy = None  # type: Optional[TrackOccupancy]
+
+    @property
+    def max_width(self):
+        # type: () -> int
+        """Upper bound on the width of all tracks."""
+        return self._max_width
+
+    @property
+    def max_margin(self):
+        # type: () -> int
+        """Upper bound on the margin of all tracks."""
+        return self._max_margin
+
+    @property
+    def bounds(self):
+        # type: () -> Optional[Tuple[int, int, int, int]]
+        """The lower/upper half track index and the lower/upper coordinate of all tracks.
+
+        None if there are no tracks.
+        """
+        return self._bounds
+
+    @property
+    def occupancy(self):
+        # type: () -> TrackOccupancy
+        """The coarse occupancy map of all tracks.
+
+        Computed on first access from the tracks of this view and the occupancy maps of
+        all instances.
+        """
+        if self._occupancy is None:
+            rect_list = []
+            if self._track_set is not None:
+                hidx_list, intv_list = [], []
+                for hidx, intv_set in self._track_set.items():
+                    for intv in intv_set:
+                        hidx_list.append(hidx)
+                        intv_list.append(intv)
+                hidx_arr = np.array(hidx_list, dtype=np.int64)
+                intv_arr = np.array(intv_list, dtype=np.int64).reshape(-1, 2)
+                rect_list.append((hidx_arr, hidx_arr, intv_arr[:, 0], intv_arr[:, 1]))
+            for view, xform_list in self._inst_list:
+                # transform occupied bins of the instance master to this view
+                hidx0, hidx1, intv0, intv1 = view.occupancy.get_bin_rects()
+                xform_arr = np.array(xform_list, dtype=np.int64)
+                hidx_scale, hidx_shift, intv_scale, intv_shift = (xform_arr[:, idx:idx + 1] for idx in range(4))
+                hidx0 = hidx0 * hidx_scale + hidx_shift
+                hidx1 = hidx1 * hidx_scale + hidx_shift
+                intv0 = intv0 * intv_scale + intv_shift
+                intv1 = intv1 * intv_scale + intv_shift
+                rect_list.append((np.minimum(hidx0, hidx1).ravel(), np.maximum(hidx0, hidx1).ravel(),
+                                  np.minimum(intv0, intv1).ravel(), np.maximum(intv0, intv1).ravel()))
+
+            if rect_list:
+                self._occupancy = TrackOccupancy(self._bounds, *(np.concatenate(arr_list)
+                                                                 for arr_list in zip(*rect_list)))
+            else:
+                empty = np.empty(0, dtype=np.int64)
+                self._occupancy = TrackOccupancy(self._bounds, empty, empty, empty, empty)
+        return self._occupancy
+
+    def overlap_items(self, hidx_lower, hidx_upper, intv):
+        # type: (int, int, Tuple[int, int]) -> Generator[Tuple[int, Tuple[int, int], Any]]
+        """Iterates over intervals in the given half track range that overlap the given interval.
+
+        Intervals from different instances are not merged, so they may overlap each other.
+
+        Parameters
+        ----------
+        hidx_lower : int
+            the lowest half track index, inclusive.
+        hidx_upper : int
+            the highest half track index, inclusive.
+        intv : Tuple[int, int]
+            the interval.
+
+        Yields
+        ------
+        hidx : int
+            the half track index.
+        ovl_intv : Tuple[int, int]
+            the overlapping interval.
+        val : Any
+            value associated with ovl_intv.
+        """
+        if self._track_set is not None:
+            for item in self._track_set.overlap_items(hidx_lower, hidx_upper, intv):
+                yield item
+
+        for view, xform_list in self._inst_list:
+            occupancy = view.occupancy
+            for hidx_scale, hidx_shift, intv_scale, intv_shift in xform_list:
+                # transform query to instance master coordinates
+                hidx0, hidx1 = sorted(((hidx_lower - hidx_shift) * hidx_scale,
+                                       (hidx_upper - hidx_shift) * hidx_scale))
+                intv0, intv1 = sorted(((intv[0] - intv_shift) * intv_scale, (intv[1] - intv_shift) * intv_scale))
+                if occupancy.may_overlap(hidx0, hidx1, (intv0, intv1)):
+                    for hidx, (start, stop), val in view.overlap_items(hidx0, hidx1, (intv0, intv1)):
+                        start, stop = sorted((start * intv_scale + intv_shift, stop * intv_scale + intv_shift))
+                        yield hidx * hidx_scale + hidx_shift, (start, stop), val
+
+
 class UsedTracks(object):
     """A data structure that stores used tracks on the routing grid.
 
+    Used tracks of instances are stored as references to the instance masters.  They are
+    only copied into this object when all used tracks on a layer are requested with
+    get_tracks_info().  Region queries should use get_tracks_view() instead.
+
     Parameters
     ----------
     resolution : float
@@ -202,11 +605,70 @@ class UsedTracks(object):
             pass
         self._track_sets = init_track_sets
         self._res = resolution
+        self._inst_list = []  # type: List[Tuple[Any, Dict[int, List[Tuple[int, int, int, int]]]]]
+        self._num_merged = {}  # type: Dict[int, int]
+        self._view_cache = {}  # type: Dict[int, TrackSetView]
+
+    def __getstate__(self):
+        # views are derived data that reference other UsedTracks objects
+        state = self.__dict__.copy()
+        state['_view_cache'] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # objects pickled before instance references were added
+        self.__dict__.setdefault('_inst_list', [])
+        self.__dict__.setdefault('_num_merged', {})
+        self.__dict__.setdefault('_view_cache', {})
+
+    def add_instance(self, master, loc_list, orient, layers):
+        # type: (Any, List[Tuple[int, int]], str, Iterable[int]) -> None
+        """Adds the used tracks of an instance (array) to this data structure.
+
+        The track transformations of all instances in the array are computed here.  If the
+        instance tracks are not on the routing grid on any of the given layers, a warning is
+        printed and the instance is ignored.
+
+        Parameters
+        ----------
+        master : Any
+            the instance master.  Must have get_used_tracks() method and grid attribute.
+        loc_list : List[Tuple[int, int]]
+            locations of all instances in the array, in resolution units.
+        orient : str
+            the instance orientation.
+        layers : Iterable[int]
+            the layers to add used tracks on.
+        """
+        xform_table = {}  # type: Dict[int, List[Tuple[int, int, int, int]]]
+        try:
+            for layer_id in layers:
+                xform_table[layer_id] = [_get_track_transform(master.grid, layer_id, loc[0], loc[1], orient)
+                                         for loc in loc_list]
+        except ValueError:
+            print('WARNING: detect tracks not on grid.  ignoring instance')
+            return
+
+        self._inst_list.append((master, xform_table))
+        self._view_cache.clear()
+
+    def _get_inst_transforms(self, layer_id):
+        # type: (int) -> Generator[Tuple[UsedTracks, List[Tuple[int, int, int, int]]]]
+        """Iterates over instances not yet merged on the given layer.
+
+        Yields the used tracks of each instance master and the track transformations of each
+        instance in the array.
+        """
+        for master, xform_table in self._inst_list[self._num_merged.get(layer_id, 0):]:
+            yield master.get_used_tracks(), xform_table.get(layer_id, [])
 
     def get_tracks_info(self, layer_id):
         # type: (int) -> TrackSet
         """Returns used tracks information on the given layer.
 
+        Used tracks of instances on this layer are merged into the returned TrackSet.
+
         Parameters
         ----------
         layer_id : int
@@ -219,7 +681,58 @@ class UsedTracks(object):
         """
         if layer_id not in self._track_sets:
             self._track_sets[layer_id] = TrackSet()
-        return self._track_sets[layer_id]
+        track_set = self._track_sets[layer_id]
+        if self._num_merged.get(layer_id, 0) < len(self._inst_list):
+            for inst_used_tracks, xform_list in self._get_inst_transforms(layer_id):
+                inst_track_set = inst_used_tracks.get_tracks_info(layer_id)
+                if inst_track_set:
+                    for xform in xform_list:
+                        track_set.merge(inst_track_set.transform_by(*xform))
+            self._num_merged[layer_id] = len(self._inst_list)
+            self._view_cache.pop(layer_id, None)
+        return track_set
+
+    def get_tracks_view(self, layer_id):
+        # type: (int) -> TrackSetView
+        """Returns a view of used tracks on the given layer for region queries.
+
+        Used tracks of instances are not copied into this object.
+
+        Parameters
+        ----------
+        layer_id : int
+            the layer ID.
+
+        Returns
+        -------
+        tracks_view : TrackSetView
+            the used tracks view on the given layer.
+        """
+        if layer_id not in self._view_cache:
+            track_set = self._track_sets.get(layer_id, None)
+            inst_list = [(inst_used_tracks.get_tracks_view(layer_id), xform_list)
+                         for inst_used_tracks, xform_list in self._get_inst_transforms(layer_id)]
+            self._view_cache[layer_id] = TrackSetView(track_set, inst_list)
+        return self._view_cache[layer_id]
+
+    def get_occupancy(self, layer_id):
+        # type: (int) -> TrackOccupancy
+        """Returns the coarse occupancy map of used tracks on the given layer.
+
+        The occupancy map can rule out conflicts with a region in constant time.  It is
+        computed once and reused after the owning template is finalized.
+
+        Parameters
+        ----------
+        layer_id : int
+            the layer ID.
+
+        Returns
+        -------
+        occupancy : TrackOccupancy
+            the occupancy map on the given layer.
+        """
+        return self.get_tracks_view(layer_id).occupancy
 
     def add_wire_arrays(self, warr_list, fill_margin=0, fill_type='VSS', unit_mode=False):
         # type: (Union[WireArray, List[WireArray]], Union[float, int], str, bool) -> None
@@ -244,6 +757,7 @@ class UsedTracks(object):
         if not unit_mode:
             fill_margin = int(round(fill_margin / self._res))
 
+        self._view_cache.clear()
         for warr in warr_list:
             warr_tid = warr.track_id
             layer_id = warr_tid.layer_id
@@ -259,7 +773,7 @@ class UsedTracks(object):
             step = int(round(warr_tid.pitch * 2))
             for idx in range(warr_tid.num):
                 hidx = base_hidx + idx * step
-                track_set.add_track(hidx, intv, width, value=(fill_margin, fill_type))
+                track_set.add_track(hidx, intv, width, value=(fill_margin, fill_type), margin=fill_margin)
 
     def transform(self, grid, loc=(0, 0), orient='R0', unit_mode=False):
         # type: (RoutingGrid, Tuple[Union[float, int], Union[float, int]], str, bool) -> UsedTracks
@@ -282,6 +796,10 @@ class UsedTracks(object):
         else:
             dx, dy = loc
 
+        if self._inst_list:
+            for layer_id in grid.layers:
+                self.get_tracks_info(layer_id)
+
         new_track_sets = {}
         for layer_id, track_set in self._track_sets.items():
             new_track_sets[layer_id] = track_set.transform(grid, layer_id, dx, dy, orient=orient)
@@ -291,6 +809,11 @@ class UsedTracks(object):
     def merge(self, used_tracks, layers):
         # type: (UsedTracks) -> None
         """Merge the given used tracks to this one."""
+        if used_tracks._inst_list:
+            for layer_id in layers:
+                used_tracks.get_tracks_info(layer_id)
+
+        self._view_cache.clear()
         for layer_id, new_track_set in used_tracks._track_sets.items():
             if layer_id in layers:
                 if layer_id not in self._track_sets:
@@ -309,43 +832,100 @@ def get_available_tracks(grid,  # type: RoutingGrid
                          upper,  # type: int
                          width,  # type: int
                          margin,  # type: int
-                         track_set,  # type: TrackSet
+                         track_set,  # type: Union[TrackSet, TrackSetView]
                          ):
     # type: () -> List[int]
-    """Fill unused tracks with supply tracks.
+    """Returns the tracks in the given list that can fit a wire in the given interval.
+
+    Only used tracks near the given tracks and interval are visited.
     """
-    avail_track_set = TrackSet(min_length=upper - lower)
-    for tidx in tr_idx_list:
-        avail_track_set.add_track(2 * tidx + 1, (lower, upper), width, value=False)
+    hidx_list = sorted(set(2 * tidx + 1 for tidx in tr_idx_list))
+    num_tracks = len(hidx_list)
+    if track_set.max_width == 0:
+        # no tracks were ever added
+        return [int((hidx - 1) // 2) for hidx in hidx_list]
 
     tech_info = grid.tech_info
-    res = grid.resolution
     layer_name = tech_info.get_layer_name(layer_id)
     if isinstance(layer_name, tuple) or isinstance(layer_name, list):
         layer_name = layer_name[0]
     layer_type = tech_info.get_layer_type(layer_name)
 
-    # subtract used tracks.
-    for hidx, intv_set in track_set.items():
-        for (wstart, wstop), (wwidth, (fmargin, fill_type)) in intv_set.items():
+    # compute bounds on wire half width and margin of used tracks
+    max_half_w = max_min_space = 0
+    for wwidth in range(1, track_set.max_width + 1):
+        cbeg, cend = grid.get_wire_bounds(layer_id, 0, width=wwidth, unit_mode=True)
+        max_half_w = max(max_half_w, (cend - cbeg) // 2)
+        max_min_space = max(max_min_space, tech_info.get_min_space(layer_type, cend - cbeg, unit_mode=True))
+    max_margin = max(margin, track_set.max_margin, max_min_space)
+
+    # compute half track index windows that contain all used tracks that can block the given tracks
+    wtr = grid.w_tracks[layer_id]
+    pitch = wtr + grid.sp_tracks[layer_id]
+    hpitch = pitch // 2
+    ext = max_half_w + max_margin + wtr + 1
+    win_list = []
+    for hidx in hidx_list:
+        win_lower = int(math.ceil(2 * (hpitch * (hidx - 1 - 2 * (width - 1)) - ext) / pitch))
+        win_upper = int(math.floor(2 * (hpitch * (hidx - 1 + 2 * (width - 1)) + ext) / pitch)) + 2
+        if win_list and win_lower <= win_list[-1][1]:
+            win_list[-1][1] = win_upper
+        else:
+            win_list.append([win_lower, win_upper])
+
+    # mark blocked tracks
+    avail_list = [True] * num_tracks
+    search_intv = (lower - max_margin, upper + max_margin)
+    for win_lower, win_upper in win_list:
+        for hidx, (wstart, wstop), (wwidth, (fmargin, fill_type)) in \
+                track_set.overlap_items(win_lower, win_upper, search_intv):
             cbeg, cend = grid.get_wire_bounds(layer_id, (hidx - 1) / 2, width=wwidth, unit_mode=True)
             min_space = tech_info.get_min_space(layer_type, cend - cbeg, unit_mode=True)
             fmargin = max(margin, fmargin, min_space)
+            if wstart - fmargin < upper and lower < wstop + fmargin:
+                idx0, idx1 = grid.get_overlap_tracks(layer_id, cbeg - fmargin, cend + fmargin,
+                                                     half_track=True, unit_mode=True)
+                hidx0 = int(round(2 * idx0 + 1)) - 2 * (width - 1)
+                hidx1 = int(round(2 * idx1 + 1)) + 2 * (width - 1)
+                for idx in range(bisect.bisect_left(hidx_list, hidx0), bisect.bisect_right(hidx_list, hidx1)):
+                    avail_list[idx] = False
 
-            sub_intv = (wstart - fmargin, wstop + fmargin)
-            idx0, idx1 = grid.get_overlap_tracks(layer_id, cbeg - fmargin, cend + fmargin,
-                                                 half_track=True, unit_mode=True)
-            hidx0 = int(round(2 * idx0 + 1)) - 2 * (width - 1)
-            hidx1 = int(round(2 * idx1 + 1)) + 2 * (width - 1)
+    return [int((hidx - 1) // 2) for hidx, avail in zip(hidx_list, avail_list) if avail]
 
-            # substract
-            for sub_idx in range(hidx0, hidx1 + 1):
-                avail_track_set.subtract(sub_idx, sub_intv)
 
-    # return available tracks
-    hidx_arr = np.array(sorted(avail_track_set.keys()), dtype=int)
-    ans = ((hidx_arr - 1) // 2).tolist()  # type: List[int]
-    return ans
+def _subtract_fill_intervals(lower, upper, starts, stops, min_length):
+    # type: (int, int, np.ndarray, np.ndarray, int) -> Tuple[np.ndarray, np.ndarray]
+    """Subtract blockages from a fill interval with a sorted sweep.
+
+    Parameters
+    ----------
+    lower : int
+        the fill interval lower coordinate.
+    upper : int
+        the fill interval upper coordinate.
+    starts : np.ndarray
+        the blockage lower coordinates.
+    stops : np.ndarray
+        the blockage upper coordinates.
+    min_length : int
+        remaining fill intervals shorter than this are discarded.
+
+    Returns
+    -------
+    fill_starts : np.ndarray
+        the remaining fill interval lower coordinates, in increasing order.
+    fill_stops : np.ndarray
+        the remaining fill interval upper coordinates.
+    """
+    order = np.argsort(starts, kind='mergesort')
+    starts = starts[order]
+    stops = np.maximum.accumulate(stops[order])
+    # gaps before, between, and after the merged blockages
+    gap_starts = np.maximum(np.append(lower, stops), lower)
+    gap_stops = np.minimum(np.append(starts, upper), upper)
+    gap_len = gap_stops - gap_starts
+    keep = (gap_len > 0) & (gap_len >= min_length)
+    return gap_starts[keep], gap_stops[keep]
 
 
 def get_power_fill_tracks(grid,  # type: RoutingGrid
@@ -361,6 +941,7 @@ def get_power_fill_tracks(grid,  # type: RoutingGrid
     # type: () -> Tuple[List[WireArray], List[WireArray]]
     """Fill unused tracks with supply tracks.
     """
+    start_time = time.time()
     # get block size and lower/upper coordinates.
     blk_width, blk_height = grid.get_size_dimension(size, unit_mode=True)
     lower = edge_margin
@@ -385,65 +966,111 @@ def get_power_fill_tracks(grid,  # type: RoutingGrid
 
     first_hidx = start_tidx * 2 + 1 + sup_width - 1
     last_hidx = end_tidx * 2 + 1 - (sup_width - 1)
-    fill_hidx_list = list(range(first_hidx, last_hidx + 1, 2 * (sup_width + num_space)))
+    fill_step = 2 * (sup_width + num_space)
+    fill_hidx_list = list(range(first_hidx, last_hidx + 1, fill_step))
 
     # add all fill tracks
     min_length = grid.get_min_length(layer_id, sup_width, unit_mode=True)
-    fill_track_set = TrackSet(min_length=min_length)
-    fill_intv = (lower, upper)
-    for hidx in fill_hidx_list:
-        fill_track_set.add_track(hidx, fill_intv, sup_width, value=False)
+    num_fill = len(fill_hidx_list)
+
+    # gather used tracks in the order they are processed
+    wire_info = [(hidx, wstart, wstop, wwidth, fmargin, fill_type)
+                 for hidx, intv_set in track_set.items()
+                 for (wstart, wstop), (wwidth, (fmargin, fill_type)) in intv_set.items()]
+    num_wires = len(wire_info)
+    if num_wires > 0:
+        w_hidx, w_start, w_stop, w_width, w_margin = (np.array(val) for val in list(zip(*wire_info))[:5])
+        w_margin = np.maximum(w_margin, fill_margin)
+        cbeg, cend = grid.get_wire_bounds_array(layer_id, (w_hidx - 1) / 2, width=w_width, unit_mode=True)
+        idx0, idx1 = grid.get_overlap_tracks_array(layer_id, cbeg - w_margin, cend + w_margin,
+                                                   half_track=True, unit_mode=True)
+        hidx0 = np.round(2 * idx0 + 1).astype(np.int64) - 2 * (sup_width - 1)
+        hidx1 = np.round(2 * idx1 + 1).astype(np.int64) + 2 * (sup_width - 1)
+        w_start = w_start - w_margin
+        w_stop = w_stop + w_margin
+    else:
+        hidx0 = hidx1 = w_start = w_stop = np.empty(0, dtype=np.int64)
+    w_is_sup = np.array([info[5] == 'VDD' or info[5] == 'VSS' for info in wire_info], dtype=bool)
+
+    if debug:
+        for widx, (hidx, wstart, wstop, _, _, fill_type) in enumerate(wire_info):
+            print('Found track: hidx = %d, intv = (%d, %d), fill_type = %s' % (hidx, wstart, wstop, fill_type))
+            print('deleting fill in hidx range (inclusive): (%d, %d)' % (hidx0[widx], hidx1[widx]))
+
+    # find the range of fill tracks blocked by each used track, [fidx0, fidx1)
+    fidx0 = np.clip(-((first_hidx - hidx0) // fill_step), 0, num_fill)
+    fidx1 = np.maximum(np.clip((hidx1 - first_hidx) // fill_step + 1, 0, num_fill), fidx0)
+    # build blockage table, one entry per used track/fill track pair, sorted by fill track then used track
+    blk_cnt = fidx1 - fidx0
+    blk_wire = np.repeat(np.arange(num_wires), blk_cnt)
+    blk_fill = np.arange(blk_wire.size) - np.repeat(np.cumsum(blk_cnt) - blk_cnt - fidx0, blk_cnt)
+    order = np.argsort(blk_fill, kind='mergesort')
+    blk_wire = blk_wire[order]
+    blk_fill = blk_fill[order]
+    blk_bnds = np.searchsorted(blk_fill, np.arange(num_fill + 1))
+
+    # subtract used tracks from fill.  A fill track is deleted as soon as no fill interval of at least
+    # min_length remains, so we also record the index of the used track that deletes it.
+    fill_intvs = {}
+    del_idx = np.full(num_fill, num_wires, dtype=np.int64)
+    if upper - lower < min_length:
+        del_idx[:] = -1
+    else:
+        for fidx in range(num_fill):
+            bidx, eidx = blk_bnds[fidx], blk_bnds[fidx + 1]
+            cur_wires = blk_wire[bidx:eidx]
+            fstart, fstop = _subtract_fill_intervals(lower, upper, w_start[cur_wires], w_stop[cur_wires],
+                                                     min_length)
+            if fstart.size > 0:
+                fill_intvs[fidx] = list(zip(fstart.tolist(), fstop.tolist()))
+            else:
+                # binary search for the shortest list of used tracks that deletes this fill track
+                lo, hi = 1, eidx - bidx
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    if _subtract_fill_intervals(lower, upper, w_start[cur_wires[:mid]], w_stop[cur_wires[:mid]],
+                                                min_length)[0].size > 0:
+                        lo = mid + 1
+                    else:
+                        hi = mid
+                del_idx[fidx] = cur_wires[lo - 1]
+
+    # assign supply types to fill tracks.  The first used track that blocks a fill track, or that has the
+    # fill track as its nearest remaining neighbor, sets the supply type.
+    sup_idx = np.full(num_fill, num_wires, dtype=np.int64)
+    blk_sup = w_is_sup[blk_wire]
+    np.minimum.at(sup_idx, blk_fill[blk_sup], blk_wire[blk_sup])
+    remain_list = np.flatnonzero(del_idx >= 0).tolist()
+    del_order = np.argsort(del_idx, kind='mergesort')
+    del_cnt = int(np.count_nonzero(del_idx < 0))
+    for widx in np.flatnonzero(w_is_sup).tolist():
+        while del_cnt < num_fill and del_idx[del_order[del_cnt]] <= widx:
+            fidx = del_order[del_cnt]
+            del remain_list[bisect.bisect_left(remain_list, fidx)]
+            del_cnt += 1
+        pos = bisect.bisect_left(remain_list, fidx0[widx])
+        if pos > 0:
+            fidx = remain_list[pos - 1]
+            if fill_hidx_list[fidx] >= 0:
+                sup_idx[fidx] = min(sup_idx[fidx], widx)
+        pos = bisect.bisect_left(remain_list, fidx1[widx])
+        if pos < len(remain_list):
+            fidx = remain_list[pos]
+            sup_idx[fidx] = min(sup_idx[fidx], widx)
 
-    max_fill_hidx = fill_hidx_list[-1]
-    # subtract used tracks from fill.
     sup_type = {}
-    for hidx, intv_set in track_set.items():
-        for (wstart, wstop), (wwidth, (fmargin, fill_type)) in intv_set.items():
-            fmargin = max(fill_margin, fmargin)
-            sub_intv = (wstart - fmargin, wstop + fmargin)
-            cbeg, cend = grid.get_wire_bounds(layer_id, (hidx - 1) / 2, width=wwidth, unit_mode=True)
-            idx0, idx1 = grid.get_overlap_tracks(layer_id, cbeg - fmargin, cend + fmargin,
-                                                 half_track=True, unit_mode=True)
-            hidx0 = int(round(2 * idx0 + 1)) - 2 * (sup_width - 1)
-            hidx1 = int(round(2 * idx1 + 1)) + 2 * (sup_width - 1)
-            if debug:
-                print('Found track: hidx = %d, intv = (%d, %d), fill_type = %s' % (hidx, wstart, wstop, fill_type))
-                print('deleting fill in hidx range (inclusive): (%d, %d)' % (hidx0, hidx1))
-
-            # substract fill
-            for sub_idx in range(hidx0, hidx1 + 1):
-                fill_track_set.subtract(sub_idx, sub_intv)
-                # TODO: more robust error/warning messages?
-                if sub_idx not in sup_type and (fill_type == 'VDD' or fill_type == 'VSS'):
-                    sup_type[sub_idx] = fill_type
-                    if debug:
-                        print('assigning hidx %d fill type %s' % (sub_idx, fill_type))
-            # assign adjacent fill tracks to fill_type
-            if fill_type == 'VDD' or fill_type == 'VSS':
-                for sub_idx in range(hidx0 - 1, -1, -1):
-                    if sub_idx in fill_track_set:
-                        if sub_idx not in sup_type:
-                            # TODO: more robust error/warning messages?
-                            sup_type[sub_idx] = fill_type
-                            if debug:
-                                print('assigning hidx %d fill type %s' % (sub_idx, fill_type))
-                        break
-                for sub_idx in range(hidx1 + 1, max_fill_hidx + 1):
-                    if sub_idx in fill_track_set:
-                        if sub_idx not in sup_type:
-                            # TODO: more robust error/warning messages?
-                            sup_type[sub_idx] = fill_type
-                            if debug:
-                                print('assigning hidx %d fill type %s' % (sub_idx, fill_type))
-                        break
+    for fidx in np.flatnonzero(sup_idx < num_wires).tolist():
+        sup_type[fill_hidx_list[fidx]] = wire_info[sup_idx[fidx]][5]
+        if debug:
+            print('assigning hidx %d fill type %s' % (fill_hidx_list[fidx], sup_type[fill_hidx_list[fidx]]))
 
     # count remaining fill tracks
-    fill_hidx_list = sorted(fill_track_set.keys())
-    tot_cnt = len(fill_hidx_list)
+    fill_idx_list = np.flatnonzero(del_idx == num_wires).tolist()
+    tot_cnt = len(fill_idx_list)
     vdd_cnt = 0
     vss_cnt = 0
-    for hidx in fill_hidx_list:
-        cur_type = sup_type.get(hidx, None)
+    for fidx in fill_idx_list:
+        cur_type = sup_type.get(fill_hidx_list[fidx], None)
         if cur_type == 'VDD':
             vdd_cnt += 1
         elif cur_type == 'VSS':
@@ -462,7 +1089,8 @@ def get_power_fill_tracks(grid,  # type: RoutingGrid
     res = grid.resolution
     vdd_warr_list = []
     vss_warr_list = []
-    for hidx in fill_hidx_list:
+    for fidx in fill_idx_list:
+        hidx = fill_hidx_list[fidx]
         if debug:
             print('creating fill at hidx %d' % hidx)
         # get supply type
@@ -483,7 +1111,9 @@ def get_power_fill_tracks(grid,  # type: RoutingGrid
 
         w_list = vdd_warr_list if cur_type == 'VDD' else vss_warr_list
         tid = TrackID(layer_id, (hidx - 1) / 2, width=sup_width)
-        w_list.extend(WireArray(tid, intv[0] * res, intv[1] * res)
-                      for intv in fill_track_set[hidx].intervals())
+        w_list.extend(WireArray(tid, intv[0] * res, intv[1] * res) for intv in fill_intvs[fidx])
 
+    if debug:
+        print('power fill on layer %d: %d used tracks, %d fill tracks, took %.4g seconds' %
+              (layer_id, num_wires, tot_cnt, time.time() - start_time))
     return vdd_warr_list, vss_warr_list
@@ -714,6 +714,41 @@ class RoutingGrid(object):
         else:
             return (center - w_half) * self._resolution, (center + w_half) * self._resolution
 
+    def get_wire_bounds_array(self, layer_id, tr_idx, width=1, unit_mode=False):
+        # type: (int, np.ndarray, Union[int, np.ndarray], bool) -> Tuple[np.ndarray, np.ndarray]
+        """Calculate wire bounds coordinates of an array of tracks.
+
+        This is the vectorized version of get_wire_bounds().
+
+        Parameters
+        ----------
+        layer_id : int
+            the layer ID.
+        tr_idx : np.ndarray
+            the center track indices.
+        width : Union[int, np.ndarray]
+            width of wires in number of tracks.  Either a single width or one width per track.
+        unit_mode : bool
+            True to return coordinates in resolution units.
+
+        Returns
+        -------
+        lower : np.ndarray
+            the lower bound coordinates perpendicular to wire direction.
+        upper : np.ndarray
+            the upper bound coordinates perpendicular to wire direction.
+        """
+        w = self.w_tracks[layer_id]
+        sp = self.sp_tracks[layer_id]
+        width = np.asarray(width, dtype=np.int64)
+        w_half = (width * w + (width - 1) * sp) // 2
+        center = np.trunc(np.asarray(tr_idx, dtype=float) * (w + sp)).astype(np.int64) + self.offset_tracks[layer_id]
+        lower = center - w_half
+        upper = center + w_half
+        if unit_mode:
+            return lower, upper
+        return lower * self._resolution, upper * self._resolution
+
     def get_bbox(self, layer_id, tr_idx, lower, upper, width=1):
         """Compute bounding box for the given wire.
 
@@ -968,6 +1003,47 @@ class RoutingGrid(object):
 
         return lower_tr, upper_tr
 
+    def get_overlap_tracks_array(self, layer_id, lower, upper, half_track=False, unit_mode=False):
+        # type: (int, np.ndarray, np.ndarray, bool, bool) -> Tuple[np.ndarray, np.ndarray]
+        """Returns the first and last track indices that overlap with arrays of ranges.
+
+        This is the vectorized version of get_overlap_tracks().
+
+        Parameters
+        ----------
+        layer_id : int
+            the layer ID.
+        lower : np.ndarray
+            the lower coordinates.
+        upper : np.ndarray
+            the upper coordinates.
+        half_track : bool
+            True to allow half-integer tracks.
+        unit_mode : bool
+            True if lower/upper are given in resolution units.
+
+        Returns
+        -------
+        start_track : np.ndarray
+            the first track indices.
+        end_track : np.ndarray
+            the last track indices.
+        """
+        if unit_mode:
+            lower = np.asarray(lower, dtype=np.int64)
+            upper = np.asarray(upper, dtype=np.int64)
+        else:
+            lower = np.round(np.asarray(lower) / self._resolution).astype(np.int64)
+            upper = np.round(np.asarray(upper) / self._resolution).astype(np.int64)
+
+        wtr = self.w_tracks[layer_id]
+        lower_tr = self.coord_to_nearest_track_array(layer_id, lower - wtr + wtr // 2, half_track=half_track,
+                                                     mode=1, unit_mode=True)
+        upper_tr = self.coord_to_nearest_track_array(layer_id, upper + wtr - wtr // 2, half_track=half_track,
+                                                     mode=-1, unit_mode=True)
+
+        return lower_tr, upper_tr
+
     def get_via_extensions_dim(self, bot_layer_id, bot_dim, top_dim, unit_mode=False):
         # type: (int, Union[float, int], Union[float, int], bool) -> Tuple[Union[float, int], Union[float, int]]
         """Returns the via extension.
@@ -1075,6 +1151,44 @@ class RoutingGrid(object):
         else:
             raise ValueError('coordinate %.4g is not on track.' % coord)
 
+    def coord_to_track_array(self, layer_id, coord, unit_mode=False):
+        # type: (int, np.ndarray, bool) -> np.ndarray
+        """Convert an array of coordinates to track numbers.
+
+        This is the vectorized version of coord_to_track().
+
+        Parameters
+        ----------
+        layer_id : int
+            the layer number.
+        coord : np.ndarray
+            the coordinates perpendicular to the track direction.
+        unit_mode : bool
+            True if coordinates are given in resolution units.
+
+        Returns
+        -------
+        track : np.ndarray
+            the track numbers, as a float array.
+
+        Raises
+        ------
+        ValueError :
+            if any coordinate is not on track.
+        """
+        if unit_mode:
+            coord = np.asarray(coord, dtype=np.int64)
+        else:
+            coord = np.round(np.asarray(coord) / self._resolution).astype(np.int64)
+        pitch = self.sp_tracks[layer_id] + self.w_tracks[layer_id]
+
+        q, r = np.divmod(coord - self.offset_tracks[layer_id], pitch)
+        half_mask = r == (pitch // 2)
+        bad_mask = (r != 0) & ~half_mask
+        if np.any(bad_mask):
+            raise ValueError('coordinate %.4g is not on track.' % coord[bad_mask].flat[0])
+        return q + 0.5 * half_mask
+
     def find_next_track(self, layer_id, coord, tr_width=1, half_track=False, mode=1, unit_mode=False):
         # type: (int, Union[float, int], int, bool, int, bool) -> Union[float, int]
         """Find the track such that its edges are on the same side w.r.t. the given coordinate.
@@ -1177,6 +1291,54 @@ class RoutingGrid(object):
         else:
             return q / 2
 
+    def coord_to_nearest_track_array(self, layer_id, coord, half_track=False, mode=0, unit_mode=False):
+        # type: (int, np.ndarray, bool, int, bool) -> np.ndarray
+        """Returns the track numbers closest to an array of coordinates.
+
+        This is the vectorized version of coord_to_nearest_track(), with the same rounding modes.
+
+        Parameters
+        ----------
+        layer_id : int
+            the layer number.
+        coord : np.ndarray
+            the coordinates perpendicular to the track direction.
+        half_track : bool
+            if True, allow half integer track numbers.
+        mode : int
+            the "rounding" mode.  See coord_to_nearest_track().
+        unit_mode : bool
+            True if the given coordinates are in resolution units.
+
+        Returns
+        -------
+        track : np.ndarray
+            the track numbers, as a float array.
+        """
+        if unit_mode:
+            coord = np.asarray(coord, dtype=np.int64)
+        else:
+            coord = np.round(np.asarray(coord) / self._resolution).astype(np.int64)
+
+        pitch = self.sp_tracks[layer_id] + self.w_tracks[layer_id]
+        if half_track:
+            pitch //= 2
+
+        q, r = np.divmod(coord - self.offset_tracks[layer_id], pitch)
+        on_track = r == 0
+        if mode == -2:
+            q -= on_track
+        elif mode == 2:
+            q += on_track
+        if mode > 0:
+            q += ~on_track
+        elif mode == 0:
+            q += ~on_track & (r >= pitch / 2)
+
+        if half_track:
+            return q / 2
+        return q.astype(float)
+
     def transform_track(self, layer_id, track_idx, dx=0, dy=0, orient='R0', unit_mode=False):
         # type: (int, Union[float, int], Union[float, int], Union[float, int], str, bool) -> Union[float, int]
         """Transform the given track index.
@@ -1226,6 +1388,54 @@ class RoutingGrid(object):
         else:
             return (new_hidx - 1) / 2
 
+    def transform_track_array(self, layer_id, track_idx, dx=0, dy=0, orient='R0', unit_mode=False):
+        # type: (int, np.ndarray, Union[float, int], Union[float, int], str, bool) -> np.ndarray
+        """Transform an array of track indices.
+
+        This is the vectorized version of transform_track().
+
+        Parameters
+        ----------
+        layer_id : int
+            the layer ID.
+        track_idx : np.ndarray
+            the track indices.
+        dx : Union[float, int]
+            X shift.
+        dy : Union[float, int]
+            Y shift.
+        orient : str
+            orientation.
+        unit_mode : bool
+            True if dx/dy are given in resolution units.
+
+        Returns
+        -------
+        new_track_idx : np.ndarray
+            the transformed track indices, as a float array.
+        """
+        if not unit_mode:
+            dx = int(round(dx / self._resolution))
+            dy = int(round(dy / self._resolution))
+
+        is_x = self.get_direction(layer_id) == 'x'
+        if is_x:
+            hidx_shift = int(2 * self.coord_to_track(layer_id, dy, unit_mode=True)) + 1
+        else:
+            hidx_shift = int(2 * self.coord_to_track(layer_id, dx, unit_mode=True)) + 1
+
+        hidx_scale = 1
+        if orient == 'R180':
+            hidx_scale = -1
+        elif orient == 'MX' and is_x:
+            hidx_scale = -1
+        elif orient == 'MY' and not is_x:
+            hidx_scale = -1
+
+        old_hidx = np.trunc(np.asarray(track_idx, dtype=float) * 2 + 1).astype(np.int64)
+        new_hidx = old_hidx * hidx_scale + hidx_shift
+        return (new_hidx - 1) / 2
+
     def track_to_coord(self, layer_id, track_idx, unit_mode=False):
         # type: (int, Union[float, int], bool) -> Union[float, int]
         """Convert given track number to coordinate.
@@ -1250,6 +1460,33 @@ class RoutingGrid(object):
             return coord_unit
         return coord_unit * self._resolution
 
+    def track_to_coord_array(self, layer_id, track_idx, unit_mode=False):
+        # type: (int, np.ndarray, bool) -> np.ndarray
+        """Convert an array of track numbers to coordinates.
+
+        This is the vectorized version of track_to_coord().
+
+        Parameters
+        ----------
+        layer_id : int
+            the layer number.
+        track_idx : np.ndarray
+            the track numbers.
+        unit_mode : bool
+            True to return coordinates in resolution units.
+
+        Returns
+        -------
+        coord : np.ndarray
+            the coordinates perpendicular to track direction.
+        """
+        pitch = self.sp_tracks[layer_id] + self.w_tracks[layer_id]
+        coord_unit = np.trunc(pitch * np.asarray(track_idx, dtype=float) +
+                              self.offset_tracks[layer_id]).astype(np.int64)
+        if unit_mode:
+            return coord_unit
+        return coord_unit * self._resolution
+
     def interval_to_track(self, layer_id, intv, unit_mode=False):
         # type: (int, Tuple[Union[float, int], Union[float, int]], bool) -> Tuple[Union[float, int], int]
         """Convert given coordinates to track number and width.
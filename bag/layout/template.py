@@ -31,23 +31,32 @@ from __future__ import (absolute_import, division,
 from builtins import *
 
 import os
+import sys
 import time
+import traceback
 import abc
 import copy
-from collections import OrderedDict
+import importlib
+import multiprocessing
+from collections import OrderedDict, deque
 from itertools import chain, islice
-from typing import Union, Dict, Any, List, Set, Type, Optional, Tuple, Generator, TypeVar
+from typing import Union, Dict, Any, List, Set, Type, Optional, Tuple, Generator, TypeVar, Callable, Iterator
 import yaml
+import numpy as np
 
 from bag.core import BagProject
 from bag.util.libimport import ClassImporter
 from bag.util.interval import IntervalSet
-from .core import BagLayout
+from bag.util.digest import compute_digest
+from .core import BagLayout, TechInfo
+from .cache import TemplateCache, pickle_dumps, pickle_loads
 from .util import BBox, BBoxArray
 from ..io import fix_string, get_encoding, open_file
 from .routing import Port, TrackID, WireArray, RoutingGrid
 from .routing.fill import UsedTracks, get_power_fill_tracks, get_available_tracks
 from .objects import Instance, Rect, Via, Path, Blockage, Boundary
+from .geometry import FlatGeometry
+from .gds import GDSWriter, read_layer_map
 from future.utils import with_metaclass
 
 # try to import cybagoa module
@@ -61,6 +70,40 @@ ldim = Union[float, int]
 
 TempBase = TypeVar('TempBase', bound='TemplateBase')
 
+# the TemplateDB and job list inherited by forked worker processes of TemplateDB.
+_worker_info = None  # type: Optional[Tuple[TemplateDB, Optional[List[Any]]]]
+
+
+def _new_template_worker(worker_idx, job_queue, msg_queue):
+    # type: (int, Any, Any) -> None
+    """Main loop of worker processes of TemplateDB.new_template_batch().
+
+    Each job is the serialized header of a template to create.  See TemplateDB.run_template_worker()
+    for the messages exchanged with the parent process.
+    """
+    temp_db = _worker_info[0]
+    temp_db.run_template_worker(worker_idx, job_queue, msg_queue)
+
+
+def _layout_content_worker(job_idx):
+    # type: (int) -> Any
+    """Compute the layout content of a template in a worker process."""
+    temp_db, job_list = _worker_info
+    cell_name, master, flatten = job_list[job_idx]
+    return master.get_layout_content(cell_name, flatten=flatten)
+
+
+def _get_fork_context():
+    """Returns the multiprocessing fork context, or None if fork is not supported."""
+    if hasattr(multiprocessing, 'get_context'):
+        try:
+            return multiprocessing.get_context('fork')
+        except ValueError:
+            return None
+    if sys.platform.startswith('win'):
+        return None
+    return multiprocessing
+
 
 class TemplateDB(object):
     """A database of all templates.
@@ -86,22 +129,45 @@ class TemplateDB(object):
         Default pin purpose name.  Defaults to 'pin'.
     make_pin_rect : bool
         True to create pin object in addition to label.  Defaults to True.
+    cache_dir : Optional[str]
+        If given, finalized templates are saved to and loaded from a persistent cache
+        in this directory, so unchanged templates are not redrawn across runs.  The cache
+        is not used if cybagoa is enabled.
+    digest_cell_names : bool
+        True to append a digest of the template unique key to all cell names, so cell names
+        do not depend on the order templates are created in.  Defaults to False.
     """
 
     def __init__(self, lib_defs, routing_grid, lib_name, name_prefix='', use_cybagoa=False,
-                 flatten=False, pin_purpose='pin', make_pin_rect=True):
-        # type: (str, RoutingGrid, str, str, bool, bool, str, bool) -> None
+                 flatten=False, pin_purpose='pin', make_pin_rect=True, cache_dir=None,
+                 digest_cell_names=False):
+        # type: (str, RoutingGrid, str, str, bool, bool, str, bool, Optional[str], bool) -> None
         self._importer = ClassImporter(lib_defs)
 
         self._grid = routing_grid
         self._lib_name = lib_name
-        self._template_lookup = {}  # type: Dict[Any, TempBase]
+        # use ordered dict so templates are stored after all templates they reference.
+        self._template_lookup = OrderedDict()  # type: Dict[Any, TempBase]
         self._name_prefix = name_prefix
         self._used_cell_names = set()  # type: Set[str]
         self._use_cybagoa = use_cybagoa and cybagoa is not None
         self._flatten = flatten
         self._pin_purpose = pin_purpose
         self._make_pin_rect = make_pin_rect
+        self._digest_cell_names = digest_cell_names
+        if cache_dir is None or self._use_cybagoa:
+            self._cache = None  # type: Optional[TemplateCache]
+        else:
+            self._cache = TemplateCache(cache_dir)
+        self._cache_key_lookup = {}  # type: Dict[Any, str]
+        # template dependency graph, from template key to keys of templates it depends on, and reverse.
+        # dependencies are ordered by creation, so new_template_batch() adds them in a deterministic order.
+        self._dep_graph = {}  # type: Dict[Any, Dict[Any, None]]
+        self._rev_dep_graph = {}  # type: Dict[Any, Set[Any]]
+        # keys of templates currently being drawn
+        self._build_stack = []  # type: List[Any]
+        # worker index, job queue and message queue in worker processes of new_template_batch().
+        self._worker_queues = None  # type: Optional[Tuple[int, Any, Any]]
 
     @property
     def grid(self):
@@ -186,6 +252,198 @@ class TemplateDB(object):
         template : TempBase
             the new template instance.
         """
+        master = self._new_master(lib_name, temp_name, params, temp_cls, kwargs)
+        key = master.key
+
+        if key in self._template_lookup:
+            master = self._template_lookup[key]
+            if debug:
+                print('layout cached')
+        elif self._worker_queues is not None and self._build_stack and not self._claim_template(master):
+            # created by another worker process
+            master = self._template_lookup[key]
+            if debug:
+                print('layout created by another worker')
+        else:
+            start = time.time()
+            # record all templates created while drawing this template as dependencies
+            self._build_stack.append(key)
+            try:
+                if self._load_from_cache(master):
+                    if debug:
+                        print('layout loaded from persistent cache')
+                else:
+                    if debug:
+                        print('Computing layout')
+                    master.draw_layout()
+                    master.finalize(flatten=self._flatten)
+                    self._save_to_cache(master)
+            finally:
+                self._build_stack.pop()
+            end = time.time()
+            self._register_template(master)
+            if self._worker_queues is not None:
+                self._publish_template(master)
+            if debug:
+                print('layout computation took %.4g seconds' % (end - start))
+
+        if self._build_stack:
+            self._add_dependency(self._build_stack[-1], key)
+
+        return master
+
+    def _register_template(self, master):
+        # type: (TempBase) -> None
+        """Add the given finalized template to this database."""
+        key = master.key
+        self._template_lookup[key] = master
+        self._used_cell_names.add(master.cell_name)
+        for child_key in master.children:
+            self._add_dependency(key, child_key)
+
+    def _add_dependency(self, key, dep_key):
+        # type: (Any, Any) -> None
+        """Record that the template with the given key depends on the template with key dep_key."""
+        if key not in self._dep_graph:
+            self._dep_graph[key] = OrderedDict()
+        self._dep_graph[key][dep_key] = None
+        if dep_key not in self._rev_dep_graph:
+            self._rev_dep_graph[dep_key] = set()
+        self._rev_dep_graph[dep_key].add(key)
+
+    def get_dependencies(self, template):
+        # type: (TempBase) -> List[TempBase]
+        """Returns all templates the given template directly depends on.
+
+        A template depends on all its children templates, as well as all other templates created
+        while drawing it.
+
+        Parameters
+        ----------
+        template : TempBase
+            the template.
+
+        Returns
+        -------
+        dep_list : List[TempBase]
+            list of templates the given template depends on.
+        """
+        return [self._template_lookup[dep_key] for dep_key in self._dep_graph.get(template.key, [])
+                if dep_key in self._template_lookup]
+
+    def get_affected_keys(self, key_list=None, temp_cls=None):
+        # type: (Optional[List[Any]], Optional[Union[Type[TempBase], str]]) -> Set[Any]
+        """Returns keys of the given templates and all templates that depend on them.
+
+        Parameters
+        ----------
+        key_list : Optional[List[Any]]
+            list of changed template keys.
+        temp_cls : Optional[Union[Type[TempBase], str]]
+            the changed template class, or its fully qualified name.  All templates that are instances
+            of this class, or one of its subclasses, are changed.  Class names are compared instead of
+            class objects, so this works with reloaded modules.
+
+        Returns
+        -------
+        affected_keys : Set[Any]
+            set of affected template keys.
+        """
+        changed = set(key_list or [])
+        if temp_cls is not None:
+            if not isinstance(temp_cls, str):
+                temp_cls = '%s.%s' % (temp_cls.__module__, temp_cls.__name__)
+            for key, master in self._template_lookup.items():
+                for cls in master.__class__.__mro__:
+                    if '%s.%s' % (cls.__module__, cls.__name__) == temp_cls:
+                        changed.add(key)
+                        break
+
+        # traverse the reverse dependency graph
+        affected = set()
+        key_stack = list(changed)
+        while key_stack:
+            key = key_stack.pop()
+            if key not in affected:
+                affected.add(key)
+                key_stack.extend(self._rev_dep_graph.get(key, []))
+
+        return affected
+
+    def invalidate(self, key_list=None, temp_cls=None):
+        # type: (Optional[List[Any]], Optional[Union[Type[TempBase], str]]) -> Set[Any]
+        """Remove the given templates and all templates depending on them from this database.
+
+        Invalidated templates are also removed from the persistent cache, and their cell names are
+        released, so regenerated templates reuse the same cell names if created in the same order.
+
+        Parameters
+        ----------
+        key_list : Optional[List[Any]]
+            list of changed template keys.
+        temp_cls : Optional[Union[Type[TempBase], str]]
+            the changed template class, or its fully qualified name.  See get_affected_keys().
+
+        Returns
+        -------
+        affected_keys : Set[Any]
+            set of invalidated template keys.
+        """
+        affected = self.get_affected_keys(key_list=key_list, temp_cls=temp_cls)
+        for key in affected:
+            master = self._template_lookup.pop(key, None)
+            if master is not None:
+                self._used_cell_names.discard(master.cell_name)
+            cache_key = self._cache_key_lookup.pop(key, None)
+            if cache_key is not None and self._cache is not None:
+                self._cache.remove(cache_key)
+            for dep_key in self._dep_graph.pop(key, []):
+                rev_deps = self._rev_dep_graph.get(dep_key, None)
+                if rev_deps is not None:
+                    rev_deps.discard(key)
+
+        return affected
+
+    def regenerate(self, template_list, key_list=None, temp_cls=None, debug=False):
+        # type: (List[TempBase], Optional[List[Any]], Optional[Union[Type[TempBase], str]], bool) -> List[TempBase]
+        """Invalidate changed templates, then recreate the given templates.
+
+        Only the changed templates and the templates depending on them are redrawn; all other
+        templates are reused.  Template classes are looked up again from their modules, so
+        reloaded modules take effect.  Note that modules that import the changed classes by name
+        must also be reloaded.
+
+        Parameters
+        ----------
+        template_list : List[TempBase]
+            list of templates to recreate, usually the top level templates.
+        key_list : Optional[List[Any]]
+            list of changed template keys.
+        temp_cls : Optional[Union[Type[TempBase], str]]
+            the changed template class, or its fully qualified name.  See get_affected_keys().
+        debug : bool
+            True to print debug messages.
+
+        Returns
+        -------
+        new_template_list : List[TempBase]
+            list of recreated templates.
+        """
+        affected = self.invalidate(key_list=key_list, temp_cls=temp_cls)
+        if debug:
+            print('%d templates invalidated' % len(affected))
+
+        new_list = []
+        for template in template_list:
+            cls = template.__class__
+            cur_cls = getattr(importlib.import_module(cls.__module__), cls.__name__)
+            new_list.append(self.new_template(params=template.params, temp_cls=cur_cls,
+                                              grid=template.grid, debug=debug))
+        return new_list
+
+    def _new_master(self, lib_name, temp_name, params, temp_cls, kwargs):
+        # type: (str, str, Optional[Dict[str, Any]], Optional[Type[TempBase]], Dict[str, Any]) -> TempBase
+        """Construct a new template object without drawing its layout."""
         if params is None:
             params = {}
 
@@ -195,27 +453,444 @@ class TemplateDB(object):
         kwargs['use_cybagoa'] = self._use_cybagoa
         kwargs['pin_purpose'] = self._pin_purpose
         kwargs['make_pin_rect'] = self._make_pin_rect
-        master = temp_cls(self, self._lib_name, params, self._used_cell_names, **kwargs)
-        key = master.key
+        kwargs['digest_cell_names'] = self._digest_cell_names
+        return temp_cls(self, self._lib_name, params, self._used_cell_names, **kwargs)
 
-        if key in self._template_lookup:
-            master = self._template_lookup[key]
-            if debug:
-                print('layout cached')
-        else:
+    def new_template_batch(self, temp_list, num_workers=None, debug=False):
+        # type: (List[Dict[str, Any]], Optional[int], bool) -> List[TempBase]
+        """Create many templates concurrently using a pool of worker processes.
+
+        Each template is created in a forked worker process.  Before a worker creates another
+        template needed by the template it draws, it claims the template from this process, so
+        every template is only created once.  If the template is being created by another worker,
+        the worker waits for it.  This way, shared children are only created once, and independent
+        subtrees are created in parallel.  Every created template is shipped in serialized form to
+        this process and to the workers that need it.  The templates are added to this database
+        after all of them are created, in an order that does not depend on process scheduling, so
+        cell names are assigned deterministically.
+
+        If cybagoa is enabled, the fork start method is not available, or num_workers is 1, the
+        templates are created serially.
+
+        Parameters
+        ----------
+        temp_list : List[Dict[str, Any]]
+            list of keyword arguments to new_template(), one per template.
+        num_workers : Optional[int]
+            number of worker processes.  Defaults to the number of CPUs.
+        debug : bool
+            True to print debug messages.
+
+        Returns
+        -------
+        template_list : List[TempBase]
+            list of templates, in the same order as temp_list.
+        """
+        # find distinct templates that are not created yet
+        key_list = []
+        job_table = OrderedDict()  # type: Dict[Any, TempBase]
+        for kwargs in temp_list:
+            kwargs = kwargs.copy()
+            master = self._new_master(kwargs.pop('lib_name', ''), kwargs.pop('temp_name', ''),
+                                      kwargs.pop('params', None), kwargs.pop('temp_cls', None), kwargs)
+            key = master.key
+            key_list.append(key)
+            if key not in self._template_lookup and key not in job_table:
+                job_table[key] = master
+
+        if num_workers is None:
+            num_workers = multiprocessing.cpu_count()
+        mp_ctx = _get_fork_context()
+        if self._use_cybagoa or self._worker_queues is not None or mp_ctx is None or num_workers <= 1:
+            for master in job_table.values():
+                self.new_template(params=master.params, temp_cls=master.__class__, grid=master.grid,
+                                  debug=debug)
+        elif job_table:
             if debug:
-                print('Computing layout')
+                print('Creating %d templates with %d workers' % (len(job_table), num_workers))
             start = time.time()
-            master.draw_layout()
-            master.finalize(flatten=self._flatten)
+            exports = self._new_template_parallel(mp_ctx, job_table, num_workers)
             end = time.time()
-            self._template_lookup[key] = master
-            self._used_cell_names.add(master.cell_name)
             if debug:
-                print('layout computation took %.4g seconds' % (end - start))
+                print('parallel layout computation of %d templates took %.4g seconds' %
+                      (len(exports), end - start))
+
+            # add templates in depth-first order of dependencies, so cell names are deterministic.
+            key_stack = [(key, False) for key in reversed(job_table)]
+            while key_stack:
+                key, deps_added = key_stack.pop()
+                if key in exports:
+                    if deps_added:
+                        self._import_template(*exports.pop(key)[:3])
+                    else:
+                        key_stack.append((key, True))
+                        key_stack.extend(((dep_key, False) for dep_key in reversed(exports[key][3])))
+
+        if self._build_stack:
+            for key in key_list:
+                self._add_dependency(self._build_stack[-1], key)
+
+        return [self._template_lookup[key] for key in key_list]
+
+    def _new_template_parallel(self, mp_ctx, job_table, num_workers):
+        # type: (Any, Dict[Any, TempBase], int) -> Dict[Any, Tuple[bytes, bytes, Optional[str], List[Any], int]]
+        """Create the given templates and all templates they need in worker processes.
+
+        See new_template_batch() and run_template_worker() for a description of the scheduling.
+
+        Parameters
+        ----------
+        mp_ctx : Any
+            the multiprocessing context.
+        job_table : Dict[Any, TempBase]
+            dictionary from template key to the unfinalized template.
+        num_workers : int
+            number of worker processes.
+
+        Returns
+        -------
+        exports : Dict[Any, Tuple[bytes, bytes, Optional[str], List[Any], int]]
+            dictionary from template key to the serialized template header, state, persistent
+            cache key, keys of templates it depends on, and index of the worker that created it.
+        """
+        global _worker_info
+
+        ready = deque(job_table.keys())
+        exports = OrderedDict()  # type: Dict[Any, Tuple[bytes, bytes, Optional[str], List[Any], int]]
+        # worker creating each template, and workers waiting for it.
+        owner = {}  # type: Dict[Any, int]
+        waiting = {}  # type: Dict[Any, List[int]]
+
+        num_workers = min(num_workers, len(ready))
+        msg_queue = mp_ctx.Queue()
+        job_queues = [mp_ctx.Queue() for _ in range(num_workers)]
+        # worker processes inherit this database, and receive templates created by other workers.
+        _worker_info = self, None
+        workers = []
+        try:
+            for idx in range(num_workers):
+                proc = mp_ctx.Process(target=_new_template_worker, args=(idx, job_queues[idx], msg_queue))
+                proc.daemon = True
+                proc.start()
+                workers.append(proc)
+        finally:
+            _worker_info = None
+
+        num_sent = [0] * num_workers
+
+        def get_import_list(worker_idx):
+            export_list = list(exports.values())
+            import_list = [val[:3] for val in islice(export_list, num_sent[worker_idx], None)
+                           if val[4] != worker_idx]
+            num_sent[worker_idx] = len(export_list)
+            return import_list
+
+        idle = list(range(num_workers))
+        num_busy = 0
+        try:
+            while True:
+                while ready and idle:
+                    key = ready.popleft()
+                    if key not in exports and key not in owner:
+                        idx = idle.pop()
+                        owner[key] = idx
+                        job_queues[idx].put(('job', get_import_list(idx), self._dump_header(job_table[key])))
+                        num_busy += 1
+                if num_busy == 0:
+                    break
+
+                idx, msg_type, data = msg_queue.get()
+                if msg_type == 'claim':
+                    if data in exports:
+                        job_queues[idx].put(('import', get_import_list(idx)))
+                    elif data in owner:
+                        waiting.setdefault(data, []).append(idx)
+                    else:
+                        owner[data] = idx
+                        job_queues[idx].put(('build', None))
+                elif msg_type == 'export':
+                    key = data[0]
+                    exports[key] = data[1:] + (idx, )
+                    del owner[key]
+                    for wait_idx in waiting.pop(key, []):
+                        job_queues[wait_idx].put(('import', get_import_list(wait_idx)))
+                elif msg_type == 'done':
+                    idle.append(idx)
+                    num_busy -= 1
+                else:
+                    raise RuntimeError('Error creating template in worker process:\n%s' % data)
+        finally:
+            for job_queue in job_queues:
+                job_queue.put(None)
+            for proc in workers:
+                proc.join(timeout=1)
+                if proc.is_alive():
+                    proc.terminate()
+
+        return exports
+
+    def run_template_worker(self, worker_idx, job_queue, msg_queue):
+        # type: (int, Any, Any) -> None
+        """Create templates in a worker process of new_template_batch().
+
+        The worker receives ('job', import_list, header) messages, and sends ('done', None) after
+        the template is created.  Every template created in this process is sent to the parent
+        process with an ('export', data) message.  Before this process creates a template needed
+        by another template, it sends a ('claim', key) message.  The parent replies
+        ('build', None) if this process should create the template, or ('import', import_list)
+        after the template is created by another worker.  Errors are sent as ('error', message).
+
+        Parameters
+        ----------
+        worker_idx : int
+            the worker index.
+        job_queue : Any
+            the queue of messages from the parent process.
+        msg_queue : Any
+            the queue of messages to the parent process.
+        """
+        self._worker_queues = worker_idx, job_queue, msg_queue
+        while True:
+            job = job_queue.get()
+            if job is None:
+                break
+            _, import_list, header_data = job
+            try:
+                self._import_template_list(import_list)
+                self.new_template(**self._load_header(header_data))
+                msg_queue.put((worker_idx, 'done', None))
+            except Exception:
+                msg_queue.put((worker_idx, 'error', traceback.format_exc()))
+                break
+
+    def _claim_template(self, master):
+        # type: (TempBase) -> bool
+        """Claim the given template in a worker process of new_template_batch().
+
+        Returns True if this process should create the template.  Otherwise, waits until the
+        template is created by another worker and adds it to this database.
+        """
+        worker_idx, job_queue, msg_queue = self._worker_queues
+        msg_queue.put((worker_idx, 'claim', master.key))
+        reply = job_queue.get()
+        if reply is None:
+            raise RuntimeError('Worker process stopped by parent process.')
+        if reply[0] == 'build':
+            return True
+        self._import_template_list(reply[1])
+        return False
+
+    def _import_template_list(self, import_list):
+        # type: (List[Tuple[bytes, bytes, Optional[str]]]) -> None
+        """Add the given serialized templates to this database."""
+        for header_data, state_data, cache_key in import_list:
+            self._import_template(header_data, state_data, cache_key)
+
+    def _publish_template(self, master):
+        # type: (TempBase) -> None
+        """Send the given new template to the parent process of this worker process."""
+        ref_keys = []
 
+        def get_ref(temp):
+            ref_keys.append(temp.key)
+            return temp.key
+
+        def pid_fun(obj):
+            return self._get_persistent_id(obj, master, get_ref)
+
+        key = master.key
+        state_data = pickle_dumps(master.get_state(), pid_fun)
+        # templates are added in the order they are referenced, then in the order they are created.
+        dep_list = ref_keys + [dep_key for dep_key in self._dep_graph.get(key, []) if dep_key not in ref_keys]
+        worker_idx, _, msg_queue = self._worker_queues
+        msg_queue.put((worker_idx, 'export', (key, self._dump_header(master), state_data,
+                                              self._cache_key_lookup.get(key, None), dep_list)))
+
+    def _dump_header(self, master):
+        # type: (TempBase) -> bytes
+        """Serialize the class, parameters, and routing grid of the given template."""
+        def pid_fun(obj):
+            return self._get_persistent_id(obj, master, lambda temp: temp.key)
+
+        # save a copy of the routing grid so it is stored by value
+        return pickle_dumps((master.__class__, master.params, master.grid.copy()), pid_fun)
+
+    def _load_header(self, header_data):
+        # type: (bytes) -> Dict[str, Any]
+        """Returns the new_template() keyword arguments from a header serialized by _dump_header()."""
+        temp_cls, params, grid = pickle_loads(header_data, self._load_persistent_object)
+        return dict(params=params, temp_cls=temp_cls, grid=grid)
+
+    def _import_template(self, header_data, state_data, cache_key):
+        # type: (bytes, bytes, Optional[str]) -> TempBase
+        """Add a template serialized by a worker process of new_template_batch() to this database.
+
+        Parameters
+        ----------
+        header_data : bytes
+            the serialized template header.
+        state_data : bytes
+            the serialized template state.
+        cache_key : Optional[str]
+            the persistent cache key of the template.
+
+        Returns
+        -------
+        master : TempBase
+            the template.
+        """
+        temp_cls, params, grid = pickle_loads(header_data, self._load_persistent_object)
+        master = self._new_master('', '', params, temp_cls, dict(grid=grid))
+        key = master.key
+        if key in self._template_lookup:
+            # already in this database
+            return self._template_lookup[key]
+
+        def load_fun(pid):
+            if pid[0] == 'template':
+                self._add_dependency(key, pid[1])
+                return self._template_lookup[pid[1]]
+            return self._load_persistent_object(pid, master=master)
+
+        master.restore_state(pickle_loads(state_data, load_fun))
+        self._register_template(master)
+        if cache_key is not None:
+            self._cache_key_lookup[key] = cache_key
         return master
 
+    def _get_cache_key(self, master):
+        # type: (TempBase) -> str
+        """Returns the persistent cache key of the given template."""
+        config = [self._lib_name, self._flatten, self._pin_purpose, self._make_pin_rect]
+        return self._cache.compute_cache_key(master.key, master.__class__, master.grid, config)
+
+    def _load_from_cache(self, master):
+        # type: (TempBase) -> bool
+        """Restore the given template from the persistent cache.
+
+        Parameters
+        ----------
+        master : TempBase
+            the newly constructed template.
+
+        Returns
+        -------
+        success : bool
+            True if the template is restored and finalized.
+        """
+        if self._cache is None:
+            return False
+
+        cache_key = self._get_cache_key(master)
+        if not self._cache.has_entry(cache_key):
+            return False
+
+        def load_fun(pid):
+            if pid[0] == 'template':
+                child = self._load_cache_reference(pid[1])
+                if child is None:
+                    raise ValueError('Stale template reference %s' % pid[1])
+                return child
+            return self._load_persistent_object(pid, master=master)
+
+        try:
+            state = self._cache.load(cache_key, load_fun)
+        except Exception as ex:
+            print('WARNING: cannot load cached template %s: %s' % (cache_key, ex))
+            return False
+
+        master.restore_state(state)
+        self._cache_key_lookup[master.key] = cache_key
+        return True
+
+    def _load_cache_reference(self, cache_key):
+        # type: (str) -> Optional[TempBase]
+        """Returns the template referenced by a cache entry, or None if the reference is stale."""
+        header = self._cache.load_header(cache_key, self._load_persistent_object)
+        if header is None:
+            return None
+        temp_cls, params, grid = header
+        child = self.new_template(params=params, temp_cls=temp_cls, grid=grid)
+        if self._cache_key_lookup.get(child.key, None) != cache_key:
+            # template changed since the reference was saved
+            return None
+        return child
+
+    def _load_persistent_object(self, pid, master=None):
+        # type: (Tuple[Any, ...], Optional[TempBase]) -> Any
+        """Resolves a persistent ID of a shared object stored in the cache."""
+        obj_type = pid[0]
+        if obj_type == 'db':
+            return self
+        elif obj_type == 'tech':
+            return self._grid.tech_info
+        elif obj_type == 'self' and master is not None:
+            return master
+        elif obj_type == 'grid' and master is not None:
+            return master.grid
+        raise ValueError('Unknown persistent ID: %s' % (pid, ))
+
+    def _get_persistent_id(self, obj, master, template_ref):
+        # type: (Any, Optional[TempBase], Callable[[TempBase], Any]) -> Optional[Tuple[Any, ...]]
+        """Returns the persistent ID of a shared object when serializing the given template.
+
+        Parameters
+        ----------
+        obj : Any
+            the object to serialize.
+        master : Optional[TempBase]
+            the template being serialized.
+        template_ref : Callable[[TempBase], Any]
+            a function that returns the reference ID of another template.
+
+        Returns
+        -------
+        pid : Optional[Tuple[Any, ...]]
+            the persistent ID, or None if the object should be serialized by value.
+        """
+        if isinstance(obj, TemplateBase):
+            if obj is master:
+                return 'self',
+            return 'template', template_ref(obj)
+        elif isinstance(obj, TemplateDB):
+            return 'db',
+        elif obj is self._grid.tech_info:
+            return 'tech',
+        elif master is not None and obj is master.grid:
+            return 'grid',
+        elif isinstance(obj, TechInfo):
+            raise ValueError('Templates with different TechInfo objects are not supported.')
+        return None
+
+    def _save_to_cache(self, master):
+        # type: (TempBase) -> None
+        """Save the given finalized template to the persistent cache."""
+        if self._cache is None:
+            return
+
+        cache_key = self._get_cache_key(master)
+
+        def pid_fun(obj):
+            # children must be cached before their parents
+            return self._get_persistent_id(obj, master, lambda temp: self._cache_key_lookup[temp.key])
+
+        # save a copy of the routing grid so it is stored by value
+        header = master.__class__, master.params, master.grid.copy()
+        try:
+            self._cache.save(cache_key, header, master.get_state(), pid_fun)
+        except Exception as ex:
+            print('WARNING: cannot cache template %s: %s' % (master.cell_name, ex))
+            return
+
+        self._cache_key_lookup[master.key] = cache_key
+
+    def clear_cache(self):
+        # type: () -> None
+        """Remove all entries from the persistent template cache."""
+        if self._cache is not None:
+            self._cache.clear()
+            self._cache_key_lookup.clear()
+
     def instantiate_layout(self, prj, template, top_cell_name=None, debug=False):
         # type: (BagProject, TempBase, Optional[str], bool, bool) -> None
         """Instantiate the layout of the given :class:`~bag.layout.template.TemplateBase`.
@@ -233,8 +908,8 @@ class TemplateDB(object):
         """
         self.batch_layout(prj, [template], [top_cell_name], debug=debug)
 
-    def batch_layout(self, prj, template_list, name_list=None, debug=False):
-        # type: (BagProject, List[TempBase], Optional[List[str]], bool) -> None
+    def batch_layout(self, prj, template_list, name_list=None, debug=False, num_workers=1):
+        # type: (BagProject, List[TempBase], Optional[List[str]], bool, int) -> None
         """Instantiate all given templates.
 
         Parameters
@@ -247,43 +922,17 @@ class TemplateDB(object):
             list of template layout names.  If not given, default names will be used.
         debug : bool
             True to print debugging messages
+        num_workers : int
+            number of worker processes used to compute layout contents.  Contents are computed
+            in this process if num_workers is 1 or cybagoa is enabled.  Defaults to 1.
         """
-        if name_list is None:
-            name_list = [None] * len(template_list)
-        else:
-            if len(name_list) != len(template_list):
-                raise ValueError("Template list and name list length mismatch.")
-
-        # error checking
-        for template, name in zip(template_list, name_list):
-            if name != template.cell_name and name in self._used_cell_names:
-                raise ValueError('top cell name = %s is already used.' % name)
-
-        if debug:
-            print('Retrieving layout info')
-
-        # use ordered dict so that children are created before parents.
-        layout_dict = OrderedDict()
-        start = time.time()
-        real_name_list = []
-        for temp, top_name in zip(template_list, name_list):
-            real_name = self._instantiate_layout_helper(layout_dict, temp, top_name)
-            real_name_list.append(real_name)
-        end = time.time()
-
-        if self._flatten:
-            layout_list = [layout_dict[name].get_layout_content(name, flatten=True)
-                           for name in real_name_list]
-        else:
-            layout_list = [master.get_layout_content(cell_name) for cell_name, master in layout_dict.items()]
-
-        if debug:
-            print('layout retrieval took %.4g seconds' % (end - start))
+        layout_iter = self._batch_layout_iter(template_list, name_list, debug, num_workers=num_workers)
 
         # create library if it does not exist
         prj.create_library(self._lib_name)
 
         if self._use_cybagoa:
+            layout_list = list(layout_iter)
             # remove write locks from old layouts
             cell_view_list = [(item[0], 'layout') for item in layout_list]
             prj.release_write_locks(self._lib_name, cell_view_list)
@@ -319,11 +968,146 @@ class TemplateDB(object):
                 print('Instantiating layout')
             via_tech_name = self._grid.tech_info.via_tech_name
             start = time.time()
-            prj.instantiate_layout(self._lib_name, 'layout', via_tech_name, layout_list)
+            # layout contents are streamed to Virtuoso one chunk at a time.
+            prj.instantiate_layout(self._lib_name, 'layout', via_tech_name, layout_iter, debug=debug)
             end = time.time()
             if debug:
                 print('layout instantiation took %.4g seconds' % (end - start))
 
+    def _batch_layout_iter(self, template_list, name_list, debug, num_workers=1):
+        # type: (List[TempBase], Optional[List[str]], bool, int) -> Iterator[Any]
+        """Returns an iterator over layout contents of all given templates and their children.
+
+        Children are listed before their parents.  Layout contents are computed on demand,
+        so they can be consumed one cell at a time.
+
+        Parameters
+        ----------
+        template_list : List[TempBase]
+            list of templates to instantiate.
+        name_list : Optional[List[str]]
+            list of template layout names.  If not given, default names will be used.
+        debug : bool
+            True to print debugging messages
+        num_workers : int
+            number of worker processes used to compute layout contents.
+
+        Returns
+        -------
+        layout_iter : Iterator[Any]
+            an iterator over layout contents.
+        """
+        if name_list is None:
+            name_list = [None] * len(template_list)
+        else:
+            if len(name_list) != len(template_list):
+                raise ValueError("Template list and name list length mismatch.")
+
+        # error checking
+        for template, name in zip(template_list, name_list):
+            if name != template.cell_name and name in self._used_cell_names:
+                raise ValueError('top cell name = %s is already used.' % name)
+
+        if debug:
+            print('Retrieving layout info')
+
+        # use ordered dict so that children are created before parents.
+        layout_dict = OrderedDict()
+        start = time.time()
+        real_name_list = []
+        for temp, top_name in zip(template_list, name_list):
+            real_name = self._instantiate_layout_helper(layout_dict, temp, top_name)
+            real_name_list.append(real_name)
+        end = time.time()
+
+        if debug:
+            print('layout retrieval took %.4g seconds' % (end - start))
+
+        if self._flatten:
+            job_list = [(name, layout_dict[name], True) for name in real_name_list]
+        else:
+            job_list = [(cell_name, master, False) for cell_name, master in layout_dict.items()]
+        return self._get_layout_content_iter(job_list, num_workers)
+
+    def _get_layout_content_iter(self, job_list, num_workers):
+        # type: (List[Tuple[str, TempBase, bool]], int) -> Iterator[Any]
+        """Returns an iterator over layout contents of the given templates.
+
+        If num_workers is greater than 1, the contents are computed in forked worker processes,
+        and returned in order.
+
+        Parameters
+        ----------
+        job_list : List[Tuple[str, TempBase, bool]]
+            list of cell name, template, and whether to flatten the layout.
+        num_workers : int
+            number of worker processes.
+
+        Returns
+        -------
+        layout_iter : Iterator[Any]
+            an iterator over layout contents.
+        """
+        global _worker_info
+
+        num_workers = min(num_workers, len(job_list))
+        mp_ctx = _get_fork_context()
+        if self._use_cybagoa or mp_ctx is None or num_workers <= 1:
+            for cell_name, master, flatten in job_list:
+                yield master.get_layout_content(cell_name, flatten=flatten)
+        else:
+            # worker processes inherit the job list, so templates do not need to be pickled
+            _worker_info = self, job_list
+            try:
+                pool = mp_ctx.Pool(num_workers)
+            finally:
+                _worker_info = None
+            try:
+                chunk_size = max(1, len(job_list) // (4 * num_workers))
+                for content in pool.imap(_layout_content_worker, range(len(job_list)), chunksize=chunk_size):
+                    yield content
+            finally:
+                pool.terminate()
+                pool.join()
+
+    def batch_gds(self, fname, layer_map, template_list, name_list=None, debug=False, num_workers=1, **kwargs):
+        # type: (str, Union[str, Dict[Tuple[str, str], Tuple[int, int]]], List[TempBase], Optional[List[str]], bool, int, Any) -> None
+        """Write all given templates to a GDS file, without Virtuoso.
+
+        Parameters
+        ----------
+        fname : str
+            the output GDS file name.
+        layer_map : Union[str, Dict[Tuple[str, str], Tuple[int, int]]]
+            the stream layer map file name, or a dictionary from (layer, purpose) pair to
+            GDS (layer, datatype) pair.
+        template_list : List[TempBase]
+            list of templates to write.
+        name_list : Optional[List[str]]
+            list of template layout names.  If not given, default names will be used.
+        debug : bool
+            True to print debugging messages
+        num_workers : int
+            number of worker processes used to compute layout contents.  Defaults to 1.
+        **kwargs : Any
+            additional arguments for :class:`~bag.layout.gds.GDSWriter`.
+        """
+        if self._use_cybagoa:
+            raise ValueError('GDS output is not supported when cybagoa is used.')
+
+        if isinstance(layer_map, str):
+            layer_map = read_layer_map(layer_map)
+
+        if debug:
+            print('Writing GDS file')
+        start = time.time()
+        with GDSWriter(fname, self._lib_name, self._grid.tech_info, layer_map, **kwargs) as writer:
+            for content in self._batch_layout_iter(template_list, name_list, debug, num_workers=num_workers):
+                writer.add_cell(content)
+        end = time.time()
+        if debug:
+            print('GDS output took %.4g seconds' % (end - start))
+
     def _instantiate_layout_helper(self, layout_dict, template, top_cell_name):
         # type: (Dict[str, TempBase], TempBase, Optional[str]) -> str
         """Helper method for batch_layout().
@@ -379,6 +1163,8 @@ class TemplateBase(with_metaclass(abc.ABCMeta, object)):
             Default pin purpose name.  Defaults to 'pin'.
         make_pin_rect : bool
             True to create pin object in addition to label.  Defaults to True.
+        digest_cell_names : bool
+            True to append a digest of the unique key to the cell name.  Defaults to False.
 
     Attributes
     ----------
@@ -433,15 +1219,50 @@ class TemplateBase(with_metaclass(abc.ABCMeta, object)):
         if fp_dict is not None:
             self._grid.set_flip_parity(fp_dict)
 
-        # get unique cell name
-        self._cell_name = self._get_unique_cell_name(used_names)
-
         self._key = self.compute_unique_key()
 
+        # get unique cell name
+        self._cell_name = self._get_unique_cell_name(used_names,
+                                                     use_digest=kwargs.get('digest_cell_names', False))
+
     def get_used_tracks(self):
         # type: () -> UsedTracks
         return self._used_tracks
 
+    def get_state(self):
+        # type: () -> Dict[str, Any]
+        """Returns the state of this finalized template for persistent caching.
+
+        The template database, cell name, unique key, parameters, and routing grid are excluded,
+        as they are recomputed when the template is constructed.
+
+        Returns
+        -------
+        state : Dict[str, Any]
+            the template state dictionary.
+        """
+        if not self._finalized:
+            raise Exception('Template is not finalized.')
+
+        exclude = {'_temp_db', '_cell_name', '_key', 'params', '_grid'}
+        return {key: val for key, val in self.__dict__.items() if key not in exclude}
+
+    def restore_state(self, state):
+        # type: (Dict[str, Any]) -> None
+        """Restore this template to the given finalized state.
+
+        Parameters
+        ----------
+        state : Dict[str, Any]
+            the template state dictionary returned by get_state().
+        """
+        if self._finalized:
+            raise RuntimeError('Template already finalized.')
+
+        self.__dict__.update(state)
+        # cell names of children may be different from when the state is saved
+        self._layout.update_master_cell_names()
+
     def new_template_with(self, **kwargs):
         # type: (TempBase, **Any) -> TempBase
         """Create a new template with the given parameters.
@@ -762,6 +1583,22 @@ class TemplateBase(with_metaclass(abc.ABCMeta, object)):
         """Returns flattened geometries in this template."""
         return self._layout.get_flat_geometries()
 
+    def get_flat_geometry(self, orient='R0'):
+        # type: (str) -> FlatGeometry
+        """Returns the flattened geometries of this template under the given orientation.
+
+        Parameters
+        ----------
+        orient : str
+            the orientation.
+
+        Returns
+        -------
+        flat_geo : FlatGeometry
+            the flattened geometries, in columnar format.  Should not be modified.
+        """
+        return self._layout.get_flat_geometry(orient=orient)
+
     def get_layout_content(self, cell_name, flatten=False):
         # type: (str, bool) -> Union[List[Any], 'cybagoa.PyOALayout']
         """Returns the layout content of this template.
@@ -780,14 +1617,17 @@ class TemplateBase(with_metaclass(abc.ABCMeta, object)):
         """
         return self._layout.get_content(cell_name, flatten=flatten)
 
-    def _get_unique_cell_name(self, used_names):
-        # type: (Set[str]) -> str
+    def _get_unique_cell_name(self, used_names, use_digest=False):
+        # type: (Set[str], bool) -> str
         """Returns a unique cell name.
 
         Parameters
         ----------
         used_names : Set[str]
             a set of used names.
+        use_digest : bool
+            True to append a digest of the unique key to the base name, so the cell name
+            does not depend on the order templates are created in.
 
         Returns
         -------
@@ -796,6 +1636,8 @@ class TemplateBase(with_metaclass(abc.ABCMeta, object)):
         """
         counter = 0
         basename = self.get_layout_basename()
+        if use_digest:
+            basename = '%s_%s' % (basename, compute_digest(self._key)[:10])
         cell_name = basename
         while cell_name in used_names:
             counter += 1
@@ -816,13 +1658,15 @@ class TemplateBase(with_metaclass(abc.ABCMeta, object)):
         # type: () -> Any
         """Returns a unique hashable object (usually tuple or string) that represents the given parameters.
 
+        By default, this method returns a fixed-size digest string of the qualified class name
+        and all parameters, with float parameters normalized to the layout resolution.
+
         Returns
         -------
         unique_id : Any
             a hashable unique ID representing the given parameters.
         """
-
-        return self.to_immutable_id((self._get_qualified_name(), self.params))
+        return compute_digest((self._get_qualified_name(), self.params), resolution=self._grid.resolution)
 
     def get_layout_basename(self):
         # type: () -> str
@@ -1082,6 +1926,27 @@ class TemplateBase(with_metaclass(abc.ABCMeta, object)):
         self._layout.add_rect(rect)
         return rect
 
+    def add_rect_arrays(self, layer, box_arr):
+        # type: (Layer, np.ndarray) -> None
+        """Add many rectangles on the same layer.
+
+        Unlike add_rect(), this method does not create Rect objects, so it is much faster and
+        uses much less memory when adding a large number of rectangles, such as fills.
+
+        Parameters
+        ----------
+        layer: Layer
+            the layer name, or the (layer, purpose) pair.
+        box_arr : np.ndarray
+            an integer array of rectangles, in resolution units.  Must have either 4 columns
+            (xl, yb, xr, yt) or 8 columns (xl, yb, xr, yt, nx, ny, spx, spy).
+        """
+        # python 2/3 compatibility: convert raw bytes to string.
+        layer = fix_string(layer)
+        if isinstance(layer, str):
+            layer = (layer, 'drawing')
+        self._layout.add_rect_arrays((layer[0], layer[1]), box_arr)
+
     def add_path(self, path):
         # type: (Path) -> Path
         """Add a new path.
@@ -2502,13 +3367,14 @@ class TemplateBase(with_metaclass(abc.ABCMeta, object)):
         if not self._added_inst_tracks:
             self._added_inst_tracks = True
             for inst in self._layout.inst_iter():
+                xo, yo = inst.location_unit
+                loc_list = []
                 for cidx in range(inst.nx):
                     for ridx in range(inst.ny):
-                        try:
-                            inst_used_tracks = inst.get_used_tracks(row=ridx, col=cidx)
-                            self._used_tracks.merge(inst_used_tracks, self.grid.layers)
-                        except ValueError:
-                            print('WARNING: detect tracks not on grid.  ignoring instance')
+                        dx, dy = inst.get_item_location(row=ridx, col=cidx, unit_mode=True)
+                        loc_list.append((xo + dx, yo + dy))
+                # instance used tracks are only transformed when queried
+                self._used_tracks.add_instance(inst.master, loc_list, inst.orientation, self.grid.layers)
 
     def get_available_tracks(self,  # type: TemplateBase
                              layer_id,  # type: int
@@ -2529,7 +3395,7 @@ class TemplateBase(with_metaclass(abc.ABCMeta, object)):
 
         self._merge_inst_used_tracks()
         return get_available_tracks(self.grid, layer_id, tr_idx_list, lower, upper,
-                                    width, margin, self._used_tracks.get_tracks_info(layer_id))
+                                    width, margin, self._used_tracks.get_tracks_view(layer_id))
 
     def do_power_fill(self,  # type: TemplateBase
                       layer_id,  # type: int
@@ -40,7 +40,7 @@ __all__ = ['interpolate_grid']
 
 
 def interpolate_grid(scale_list, values, method='spline',
-                     extrapolate=False, delta=1e-4, num_extrapolate=2):
+                     extrapolate=False, delta=1e-4, num_extrapolate=2, filt_values=None):
     """Interpolates multidimensional data on a regular grid.
 
     returns an Interpolator for the given dataset.
@@ -65,6 +65,10 @@ def interpolate_grid(scale_list, values, method='spline',
         If spline interpolation is selected on 3D data or greater, we linearly
         extrapolate the given data by this many points to fix behavior near
         input boundaries.
+    filt_values : numpy.array or None
+        If spline interpolation is selected on 3D data or greater, the prefiltered
+        spline coefficients previously computed with the same data and num_extrapolate.
+        If None, they are computed from the data.
 
     Returns
     -------
@@ -81,7 +85,7 @@ def interpolate_grid(scale_list, values, method='spline',
             return Spline2D(scale_list, values, extrapolate=extrapolate)
         else:
             return MapCoordinateSpline(scale_list, values, delta=delta, extrapolate=extrapolate,
-                                       num_extrapolate=num_extrapolate)
+                                       num_extrapolate=num_extrapolate, filt_values=filt_values)
     else:
         raise ValueError('Unsupported interpolation method: %s' % method)
 
@@ -338,10 +342,13 @@ class MapCoordinateSpline(DiffFunction):
         number of points to extrapolate in each dimension in each direction.
     delta : float
         the finite difference step size.  Defaults to 1e-4 (relative to a spacing of 1).
+    filt_values : numpy.array or None
+        the prefiltered spline coefficients of the extrapolated data, as returned by
+        the filt_values property.  If None, they are computed from the data.
     """
 
     def __init__(self, scale_list, values, extrapolate=False, num_extrapolate=2,
-                 delta=1e-4):
+                 delta=1e-4, filt_values=None):
         shape = values.shape
         ndim = len(shape)
 
@@ -366,16 +373,26 @@ class MapCoordinateSpline(DiffFunction):
             ext_xi_shape.append(n + 2 * num_extrapolate)
             delta_list.append(scale * delta)
 
-        ext_xi_shape.append(ndim)
-        xi = np.empty(ext_xi_shape)
-        xmat_list = np.meshgrid(*swp_values, indexing='ij', copy=False)
-        for idx, xmat in enumerate(xmat_list):
-            xi[..., idx] = xmat
-
-        values_ext = self._extfun(xi)
-        self._filt_values = imag_interp.spline_filter(values_ext)
+        if filt_values is not None:
+            if filt_values.shape != tuple(ext_xi_shape):
+                raise ValueError('filt_values shape mismatch.')
+            self._filt_values = filt_values
+        else:
+            ext_xi_shape.append(ndim)
+            xi = np.empty(ext_xi_shape)
+            xmat_list = np.meshgrid(*swp_values, indexing='ij', copy=False)
+            for idx, xmat in enumerate(xmat_list):
+                xi[..., idx] = xmat
+
+            values_ext = self._extfun(xi)
+            self._filt_values = imag_interp.spline_filter(values_ext)
         DiffFunction.__init__(self, ndim, delta_list=delta_list)
 
+    @property
+    def filt_values(self):
+        """The prefiltered spline coefficients of the extrapolated data."""
+        return self._filt_values
+
     def _normalize_inputs(self, xi):
         """Normalize the inputs."""
         xi = np.asarray(xi, dtype=float)
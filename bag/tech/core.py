@@ -32,8 +32,13 @@ from future.utils import with_metaclass
 
 import os
 import abc
+import shutil
+import hashlib
 import itertools
 import pprint
+import concurrent.futures
+from collections import deque
+from queue import Queue, Empty
 from typing import List, Union, Tuple, Dict, Any, Optional, Set
 
 import numpy as np
@@ -81,6 +86,71 @@ def _in_list(item_list, item, rtol, atol):
     return _index_in_list(item_list, item, rtol, atol) >= 0
 
 
+def _get_unique_index(val_list, rtol, atol):
+    # type: (List[Any], float, float) -> Tuple[np.ndarray, np.ndarray]
+    """Returns the sorted unique values of the given list and the index of each item.
+
+    Floats are compared with tolerance: after sorting, every value that is close to
+    its predecessor belongs to the same unique value, which is represented by the
+    smallest item.
+
+    Parameters
+    ----------
+    val_list : List[Any]
+        list of strings or numbers.
+    rtol : float
+        relative tolerance.
+    atol : float
+        absolute tolerance.
+
+    Returns
+    -------
+    unique_values : np.ndarray
+        the sorted unique values.
+    index : np.ndarray
+        index of each item of val_list in unique_values.
+    """
+    arr = np.asarray(val_list)
+    if arr.dtype.kind not in 'biuf':
+        return np.unique(arr, return_inverse=True)
+
+    order = np.argsort(arr, kind='mergesort')
+    arr_sorted = arr[order]
+    is_new = np.empty(arr_sorted.size, dtype=bool)
+    is_new[:1] = True
+    is_new[1:] = ~np.isclose(arr_sorted[1:], arr_sorted[:-1], rtol=rtol, atol=atol)
+    index = np.empty(arr.size, dtype=int)
+    index[order] = np.cumsum(is_new) - 1
+    return arr_sorted[is_new], index
+
+
+def _read_hdf5_dataset(dset_id, out, raw=None):
+    # type: (h5py.h5d.DatasetID, np.ndarray, Optional[np.ndarray]) -> None
+    """Read the given HDF5 dataset into the given array.
+
+    This method uses the low level h5py API to avoid the overhead of creating
+    high level dataset objects when reading many small datasets.
+
+    Parameters
+    ----------
+    dset_id : h5py.h5d.DatasetID
+        the dataset to read.
+    out : np.ndarray
+        the output array.  Must be C contiguous and have the same shape as the dataset.
+    raw : Optional[np.ndarray]
+        the HDF5 file memory-mapped as a byte array.  If given, datasets with contiguous
+        layout (which are never compressed) are copied directly from the mapped file.
+    """
+    if raw is not None and dset_id.get_create_plist().get_layout() == h5py.h5d.CONTIGUOUS:
+        offset = dset_id.get_offset()
+        if offset is not None:
+            dtype = dset_id.dtype
+            nbytes = dtype.itemsize * out.size
+            out[...] = raw[offset:offset + nbytes].view(dtype).reshape(out.shape)
+            return
+    dset_id.read(h5py.h5s.ALL, h5py.h5s.ALL, out)
+
+
 class CircuitCharacterization(with_metaclass(abc.ABCMeta, object)):
     """A class that handles characterization a circuit with simulation and saving simulation results to file.
 
@@ -195,6 +265,12 @@ class CircuitCharacterization(with_metaclass(abc.ABCMeta, object)):
         -------
         tb : bag.core.Testbench
             the resulting testbench object.
+
+        Notes
+        -----
+        When simulate() characterizes several attribute combinations at once, each combination
+        has its own dut_cell.  The testbench cell name should be derived from dut_cell so that
+        concurrent testbenches do not overwrite each other.
         """
         return None
 
@@ -361,10 +437,85 @@ class CircuitCharacterization(with_metaclass(abc.ABCMeta, object)):
                 for name, val in env_result.items():
                     grp.create_dataset(name, data=val, compression=self._compression)
 
+    def _create_dut(self, temp_db, constants, attr_table, cell_name, sch_kwargs, lay_kwargs, extracted):
+        """Create the schematic and layout of the device-under-test.
+
+        Parameters
+        ----------
+        temp_db : bag.layout.template.TemplateDB
+            the TemplateDB instance used to create templates.
+        constants : dict[str, any]
+            constants dictionary.
+        attr_table : dict[str, any]
+            the attributes dictionary.
+        cell_name : str
+            the generated cell name.
+        sch_kwargs : dict[str, any]
+            additional schematic creation parameters.
+        lay_kwargs : dict[str, any]
+            additional layout creation parameters.
+        extracted : bool
+            True to create layout.
+        """
+        print('creating schematic %s' % cell_name)
+        dsn = self.create_schematic_design(constants, attr_table, **sch_kwargs)
+        dsn.implement_design(self._impl_lib, top_cell_name=cell_name, erase=True)
+        print('schematic done')
+
+        if extracted:
+            print('creating layout %s' % cell_name)
+            layout_params = dsn.get_layout_params(**self._layout_params)
+            self.create_layout(temp_db, self._impl_lib, cell_name, layout_params, **lay_kwargs)
+            print('layout done')
+
+    def _run_verification(self, cell_name, rcx_params, skip_lvs):
+        """Run LVS and RCX on the given cell.
+
+        This method only runs the checkers, and does not access the design database, so it
+        can be called from worker threads.
+
+        Parameters
+        ----------
+        cell_name : str
+            the cell name.
+        rcx_params : dict[str, any]
+            Override RCX parameters.
+        skip_lvs : bool
+            True to skip running LVS.
+
+        Returns
+        -------
+        netlist : str
+            the extracted netlist file name.  Empty if extracted schematic is not supported.
+        """
+        if not skip_lvs:
+            print('running lvs on %s' % cell_name)
+            lvs_passed, lvs_log = self.prj.run_lvs(self._impl_lib, cell_name)
+            if not lvs_passed:
+                raise Exception('oops lvs died.  See LVS log file %s' % lvs_log)
+            print('lvs on %s passed' % cell_name)
+
+        print('running rcx on %s' % cell_name)
+        netlist, rcx_log = self.prj.run_rcx(self._impl_lib, cell_name, rcx_params=rcx_params,
+                                            create_schematic=False)
+        if netlist is None:
+            raise Exception('oops rcx died.  See RCX log file %s' % rcx_log)
+        print('rcx on %s passed' % cell_name)
+        return netlist
+
     def simulate(self, temp_db, constants, sweep_attrs, sweep_params, env_list,
-                 sch_kwargs=None, lay_kwargs=None, extracted=True, rcx_params=None, skip_lvs=False):
+                 sch_kwargs=None, lay_kwargs=None, extracted=True, rcx_params=None, skip_lvs=False,
+                 max_jobs=1, max_verify=None, max_sim=None):
         """Run simulations and save results to raw simulation data file.
 
+        Independent attribute combinations are characterized concurrently.  Schematics, layouts
+        and testbenches are created one at a time in the calling thread, as the design database
+        is not thread-safe.  LVS/RCX runs in a thread pool, and simulations are submitted without
+        blocking.  Each result is saved as soon as its simulation finishes.
+
+        If a job fails, no new jobs are started, and the error is raised once all running jobs
+        finish.
+
         Parameters
         ----------
         temp_db : bag.layout.template.TemplateDB
@@ -388,10 +539,20 @@ class CircuitCharacterization(with_metaclass(abc.ABCMeta, object)):
         skip_lvs : bool
             True to directly run RCX and skip running LVS.  Set this to true if RCX runs LVS
             first anyways.
+        max_jobs : int
+            maximum number of attribute combinations to characterize at the same time.  If
+            greater than 1, the combinations use the cells <impl_cell>_0, <impl_cell>_1, etc.
+            Defaults to 1.
+        max_verify : int or None
+            maximum number of concurrent LVS/RCX runs.  Defaults to max_jobs.
+        max_sim : int or None
+            maximum number of concurrent simulations.  Defaults to max_jobs.
         """
         sch_kwargs = sch_kwargs or {}
         lay_kwargs = lay_kwargs or {}
         rcx_params = rcx_params or {}
+        max_verify = max_verify or max_jobs
+        max_sim = max_sim or max_jobs
 
         fname = os.path.join(self._root_dir, self.get_sim_file_name(constants))
 
@@ -399,47 +560,96 @@ class CircuitCharacterization(with_metaclass(abc.ABCMeta, object)):
         print('sweeping the following:')
         for val in total_combo:
             print(val)
-        for attr_values, env_list in total_combo:
-            attr_table = dict(zip(attr_list, attr_values))
-
-            if env_list:
-                print('characterizing:\n %s\n' % pprint.pformat(attr_table))
-                print('creating schematic')
-                dsn = self.create_schematic_design(constants, attr_table, **sch_kwargs)
-                dsn.implement_design(self._impl_lib, top_cell_name=self._impl_cell, erase=True)
-                print('schematic done')
-
-                if extracted:
-                    print('creating layout')
-                    layout_params = dsn.get_layout_params(**self._layout_params)
-                    self.create_layout(temp_db, self._impl_lib, self._impl_cell, layout_params, **lay_kwargs)
-                    print('layout done')
-
-                    if not skip_lvs:
-                        print('running lvs')
-                        lvs_passed, lvs_log = self.prj.run_lvs(self._impl_lib, self._impl_cell)
-                        if not lvs_passed:
-                            raise Exception('oops lvs died.  See LVS log file %s' % lvs_log)
-                        print('lvs passed')
-
-                    print('running rcx')
-                    rcx_passed, rcx_log = self.prj.run_rcx(self._impl_lib, self._impl_cell,
-                                                           rcx_params=rcx_params)
-                    if not rcx_passed:
-                        raise Exception('oops rcx died.  See RCX log file %s' % rcx_log)
-                    print('rcx passed')
-
-                print('setup testbench')
-                tb = self.setup_testbench(self._impl_lib, self._impl_cell, self._impl_lib,
-                                          env_list, constants, sweep_params, extracted)
-                print('testbench done')
-
-                print('run simulation')
-                tb.run_simulation()
-                print('simulation done')
-
-                results = data.load_sim_results(tb.save_dir)
-                self._record_data(fname, results, attr_table, env_list)
+
+        job_queue = deque(((dict(zip(attr_list, attr_values)), cur_env_list)
+                           for attr_values, cur_env_list in total_combo if cur_env_list))
+        if max_jobs > 1:
+            cell_list = ['%s_%d' % (self._impl_cell, idx) for idx in range(max_jobs - 1, -1, -1)]
+        else:
+            cell_list = [self._impl_cell]
+
+        # callbacks of LVS/RCX and simulation are called from other threads, so they
+        # put events in this queue, which are then processed in this thread.
+        events = Queue()
+        sim_queue = deque()
+        running_sims = {}
+        num_running = 0
+        error = None
+        verify_exec = concurrent.futures.ThreadPoolExecutor(max_workers=max_verify) if extracted else None
+        try:
+            while num_running or (job_queue and error is None):
+                # start new jobs
+                while error is None and job_queue and cell_list:
+                    attr_table, cur_env_list = job_queue.popleft()
+                    cell_name = cell_list.pop()
+                    job = (cell_name, attr_table, cur_env_list)
+                    num_running += 1
+                    print('characterizing:\n %s\n' % pprint.pformat(attr_table))
+                    self._create_dut(temp_db, constants, attr_table, cell_name, sch_kwargs, lay_kwargs, extracted)
+                    if extracted:
+                        future = verify_exec.submit(self._run_verification, cell_name, rcx_params, skip_lvs)
+                        future.add_done_callback(lambda fut, job=job: events.put(('verify', job, fut)))
+                    else:
+                        sim_queue.append(job)
+
+                # start simulations
+                while sim_queue and len(running_sims) < max_sim:
+                    job = sim_queue.popleft()
+                    cell_name, attr_table, cur_env_list = job
+                    print('setup testbench for %s' % cell_name)
+                    tb = self.setup_testbench(self._impl_lib, cell_name, self._impl_lib,
+                                              cur_env_list, constants, sweep_params, extracted)
+                    print('run simulation for %s' % cell_name)
+                    sim_id = tb.run_simulation(block=False,
+                                               callback=lambda save_dir, retcode, job=job:
+                                               events.put(('sim', job, (save_dir, retcode))))
+                    running_sims[cell_name] = (tb, sim_id)
+
+                if num_running == 0:
+                    break
+
+                # wait for the next LVS/RCX or simulation to finish.  Use timeout so Ctrl-C works.
+                event = None
+                while event is None:
+                    try:
+                        event = events.get(timeout=1.0)
+                    except Empty:
+                        pass
+
+                ev_type, job, result = event
+                cell_name, attr_table, cur_env_list = job
+                if ev_type == 'verify':
+                    try:
+                        netlist = result.result()
+                    except Exception as ex:
+                        error = error or ex
+                        num_running -= 1
+                        cell_list.append(cell_name)
+                    else:
+                        if netlist:
+                            self.prj.create_schematic_from_netlist(netlist, self._impl_lib, cell_name)
+                        sim_queue.append(job)
+                else:
+                    del running_sims[cell_name]
+                    num_running -= 1
+                    cell_list.append(cell_name)
+                    save_dir, retcode = result
+                    if retcode is None:
+                        error = error or Exception('simulation of %s failed.' % cell_name)
+                    else:
+                        print('simulation of %s done' % cell_name)
+                        results = data.load_sim_results(save_dir)
+                        self._record_data(fname, results, attr_table, cur_env_list)
+        except BaseException:
+            for tb, sim_id in running_sims.values():
+                tb.sim.cancel(sim_id)
+            raise
+        finally:
+            if verify_exec is not None:
+                verify_exec.shutdown(wait=False)
+
+        if error is not None:
+            raise error
 
 
 class CharDB(with_metaclass(abc.ABCMeta, object)):
@@ -470,7 +680,8 @@ class CharDB(with_metaclass(abc.ABCMeta, object)):
     atol : float
         relative tolerance used to compare constants/sweep parameters/sweep attributes.
     compression : str
-        HDF5 compression method.  Used only during post-processing.
+        HDF5 compression method.  Used only during post-processing.  Data arrays of
+        lazy databases are never compressed, so they can be memory-mapped.
     method : str
         interpolation method.
     opt_package : str
@@ -481,6 +692,15 @@ class CharDB(with_metaclass(abc.ABCMeta, object)):
         Defaults to 'SLSQP'.
     opt_settings : Optional[Dict[str, Any]]
         optimizer specific settings.
+    lazy : bool
+        True to load data from the post-processed data file on demand.  The data is
+        memory-mapped if possible, and only the slice for the requested environment and
+        discrete parameter values is read when a function is first created.  Defaults
+        to False.
+    cache_interp : bool
+        True to save the spline coefficients of the interpolators to a directory next to
+        the post-processed data file, so they are only computed once.  The coefficients
+        are memory-mapped when loaded.  Defaults to True.
     """
 
     def __init__(self,  # type: CharDB
@@ -497,6 +717,8 @@ class CharDB(with_metaclass(abc.ABCMeta, object)):
                  opt_package='scipy',  # type: str
                  opt_method='SLSQP',  # type: str
                  opt_settings=None,  # type: Optional[Dict[str, Any]]
+                 lazy=False,  # type: bool
+                 cache_interp=True,  # type: bool
                  **kwargs  # type: **kwargs
                  ):
         # type: (...) -> None
@@ -527,17 +749,33 @@ class CharDB(with_metaclass(abc.ABCMeta, object)):
                             rtol=rtol,
                             atol=atol,
                             method=method,
+                            num_extrapolate=2,
                             )
 
+        # data array axes are ordered so that environment and discrete parameters come first.
+        env_disc_params = ['env'] + discrete_params
+        num_disc = len(env_disc_params)
         cache_fname = self.get_cache_file(root_dir, constants)
+        self._cache_file = None
+        self._interp_dir = os.path.splitext(cache_fname)[0] + '_interp' if cache_interp else None
         if not os.path.isfile(cache_fname) or update:
+            # remove interpolator cache of old data
+            interp_dir = os.path.splitext(cache_fname)[0] + '_interp'
+            if os.path.isdir(interp_dir):
+                shutil.rmtree(interp_dir)
+
             sim_fname = self.get_sim_file(root_dir, constants)
             results = self._load_sim_data(sim_fname, constants, discrete_params)
             sim_data, total_params, total_values, self._constants = results
             self._data = self.post_process_data(sim_data, total_params, total_values, self._constants)
-
-            # save to cache
-            with h5py.File(cache_fname, 'w') as f:
+            axes = self._move_axes_to_front(total_params, total_values, env_disc_params)
+            for key, val in self._data.items():
+                self._data[key] = np.transpose(val, axes)
+
+            # save to cache.  Write to a temporary file first, so we never truncate a
+            # cache file that is still open or memory-mapped by a lazy database.
+            tmp_fname = '%s.%d.tmp' % (cache_fname, os.getpid())
+            with h5py.File(tmp_fname, 'w') as f:
                 for key, val in self._constants.items():
                     f.attrs[key] = val
                 sp_grp = f.create_group('sweep_params')
@@ -550,31 +788,39 @@ class CharDB(with_metaclass(abc.ABCMeta, object)):
                     sp_grp.create_dataset(par, data=val_list, compression=compression)
                 data_grp = f.create_group('data')
                 for name, data_arr in self._data.items():
-                    data_grp.create_dataset(name, data=data_arr, compression=compression)
+                    if compression and not lazy:
+                        # one chunk per discrete index, so lazy loading decompresses only what it needs.
+                        chunks = (1,) * num_disc + data_arr.shape[num_disc:]
+                        data_grp.create_dataset(name, data=data_arr, compression=compression, chunks=chunks)
+                    else:
+                        # contiguous layout, which can be memory-mapped.
+                        data_grp.create_dataset(name, data=data_arr)
+            os.rename(tmp_fname, cache_fname)
         else:
             # load from cache
-            with h5py.File(cache_fname, 'r') as f:
+            f = h5py.File(cache_fname, 'r')
+            try:
                 self._constants = dict(iter(f.attrs.items()))
                 sp_grp = f['sweep_params']
                 total_params = [fix_string(swp) for swp in sp_grp.attrs['sweep_order']]
                 total_values = [self._convert_hdf5_array(sp_grp[par][()]) for par in total_params]
+                axes = self._move_axes_to_front(total_params, total_values, env_disc_params)
                 data_grp = f['data']
-                self._data = {name: data_grp[name][()] for name in data_grp}
-
-        # change axes location so discrete parameters are at the start of sweep_params
-        env_disc_params = ['env'] + discrete_params
-        for idx, dpar in enumerate(env_disc_params):
-            if total_params[idx] != dpar:
-                # swap
-                didx = total_params.index(dpar)
-                ptmp = total_params[idx]
-                vtmp = total_values[idx]
-                total_params[idx] = total_params[didx]
-                total_values[idx] = total_values[didx]
-                total_params[didx] = ptmp
-                total_values[didx] = vtmp
-                for key, val in self._data.items():
-                    self._data[key] = np.swapaxes(val, idx, didx)
+                if lazy and axes != list(range(len(axes))):
+                    print('WARNING: cache file %s has a different axes order, '
+                          'loading all data.  Use update=True to regenerate it.' % cache_fname)
+                    lazy = False
+
+                if lazy:
+                    self._data = {name: self._open_lazy_array(cache_fname, data_grp[name]) for name in data_grp}
+                    if any(isinstance(val, h5py.Dataset) for val in self._data.values()):
+                        # keep file open for datasets that cannot be memory-mapped.
+                        self._cache_file, f = f, None
+                else:
+                    self._data = {name: np.transpose(data_grp[name][()], axes) for name in data_grp}
+            finally:
+                if f is not None:
+                    f.close()
 
         sidx = len(self._discrete_params) + 1
         self._cont_params = total_params[sidx:]
@@ -583,11 +829,68 @@ class CharDB(with_metaclass(abc.ABCMeta, object)):
         self._env_values = total_values[0]
 
         # get lazy function table.
-        shape = [total_values[idx].size for idx in range(len(env_disc_params))]
+        shape = [total_values[idx].size for idx in range(num_disc)]
 
         fun_name_iter = itertools.chain(iter(self._data.keys()), self.derived_parameters())
         # noinspection PyTypeChecker
         self._fun = {name: np.full(shape, None, dtype=object) for name in fun_name_iter}
+        self._fun_vec = {}  # type: Dict[Tuple[str, Tuple[int, ...], Tuple[int, ...]], VectorDiffFunction]
+
+    @staticmethod
+    def _move_axes_to_front(total_params, total_values, front_params):
+        # type: (List[str], List[np.ndarray], List[str]) -> List[int]
+        """Move the given parameters to the start of the sweep parameters list.
+
+        total_params and total_values are modified in place.
+
+        Parameters
+        ----------
+        total_params : List[str]
+            list of parameter names for each data array dimension.
+        total_values : List[np.ndarray]
+            list of parameter values for each data array dimension.
+        front_params : List[str]
+            list of parameters to move to the start.
+
+        Returns
+        -------
+        axes : List[int]
+            the data array axes permutation, to be used with np.transpose().
+        """
+        axes = list(range(len(total_params)))
+        for idx, dpar in enumerate(front_params):
+            if total_params[idx] != dpar:
+                # swap
+                didx = total_params.index(dpar)
+                total_params[idx], total_params[didx] = total_params[didx], total_params[idx]
+                total_values[idx], total_values[didx] = total_values[didx], total_values[idx]
+                axes[idx], axes[didx] = axes[didx], axes[idx]
+
+        return axes
+
+    @staticmethod
+    def _open_lazy_array(fname, dset):
+        # type: (str, h5py.Dataset) -> Union[np.ndarray, h5py.Dataset]
+        """Returns an array-like object that reads the given dataset on demand.
+
+        Parameters
+        ----------
+        fname : str
+            the HDF5 file name.
+        dset : h5py.Dataset
+            the dataset.
+
+        Returns
+        -------
+        arr : Union[np.ndarray, h5py.Dataset]
+            a memory-mapped array if the dataset has contiguous layout, otherwise the
+            dataset itself.
+        """
+        if dset.id.get_create_plist().get_layout() == h5py.h5d.CONTIGUOUS:
+            offset = dset.id.get_offset()
+            if offset is not None:
+                return np.memmap(fname, dtype=dset.dtype, mode='r', offset=offset, shape=dset.shape)
+        return dset
 
     @staticmethod
     def _convert_hdf5_array(arr):
@@ -644,39 +947,45 @@ class CharDB(with_metaclass(abc.ABCMeta, object)):
             if len(f) == 0:
                 raise ValueError('simulation file has no data.')
 
-            # check that attributes sweep forms regular grid.
+            # read all group attributes in one pass.
+            grp_list = [f[gname] for gname in f]
             attr_table = {}
-            for gname in f:
-                grp = f[gname]
+            for gidx, grp in enumerate(grp_list):
                 for key, val in grp.attrs.items():
-                    # convert raw bytes to unicode
-                    # python 2/3 compatibility: convert raw bytes to string
-                    val = fix_string(val)
-
                     if key != 'sweep_params':
                         if key not in attr_table:
-                            attr_table[key] = []
-                        val_list = attr_table[key]
-                        if not _in_list(val_list, val, rtol, atol):
-                            val_list.append(val)
-
-            expected_len = 1
-            for val in attr_table.values():
-                expected_len *= len(val)
-
-            if expected_len != len(f):
-                raise ValueError('Attributes of f does not form complete sweep. '
-                                 'Expect length = %d, but actually = %d.' % (expected_len, len(f)))
+                            attr_table[key] = [None] * len(grp_list)
+                        # python 2/3 compatibility: convert raw bytes to string
+                        attr_table[key][gidx] = fix_string(val)
 
             # check all discrete parameters in attribute table.
             for disc_par in discrete_params:
                 if disc_par not in attr_table:
                     raise ValueError('Discrete attribute %s not found' % disc_par)
 
-            # get attribute order
+            # get attribute order, then compute unique attribute values and the grid index of each group.
             attr_order = sorted(attr_table.keys())
+            attr_values = []
+            master_index = []
+            for attr in attr_order:
+                val_list = attr_table[attr]
+                if any(val is None for val in val_list):
+                    raise ValueError('Attribute %s not defined in all groups.' % attr)
+                aval_list, aidx_list = _get_unique_index(val_list, rtol, atol)
+                attr_values.append(aval_list)
+                master_index.append(aidx_list)
+
+            attr_shape = [len(val) for val in attr_values]
+            expected_len = int(np.prod(attr_shape))
+            if expected_len != len(grp_list):
+                raise ValueError('Attributes of f does not form complete sweep. '
+                                 'Expect length = %d, but actually = %d.' % (expected_len, len(grp_list)))
+            flat_index = np.ravel_multi_index(master_index, attr_shape)
+            if np.unique(flat_index).size != len(grp_list):
+                raise ValueError('Attributes of f does not form complete sweep. '
+                                 'Some attribute combinations are repeated.')
+
             # check all non-discrete attribute value list lies on regular grid
-            attr_values = [np.array(sorted(attr_table[attr])) for attr in attr_order]
             for attr, aval_list in zip(attr_order, attr_values):
                 if attr not in discrete_params and attr != 'env':
                     test_vec = np.linspace(aval_list[0], aval_list[-1], len(aval_list), endpoint=True)
@@ -699,20 +1008,30 @@ class CharDB(with_metaclass(abc.ABCMeta, object)):
                                       endpoint=True) for var in sweep_params]  # type: List[np.array]
             master_values = attr_values + swp_values
             master_shape = [len(val_list) for val_list in master_values]
-            master_index = [slice(0, n) for n in master_shape]
-            master_dict = {}
-            for gname in f:
-                grp = f[gname]
-                # get index of the current group in the giant array.
-                # Note: using linear search to compute index now, but attr_val_list should be small.
-                for aidx, (attr, aval_list) in enumerate(zip(attr_order, attr_values)):
-                    master_index[aidx] = _index_in_list(aval_list, grp.attrs[attr], rtol, atol)
+            swp_shape = master_shape[len(attr_order):]
+
+            # memory-map the file so uncompressed datasets are copied without going through HDF5.
+            try:
+                raw = np.memmap(fname, dtype=np.uint8, mode='r')
+            except (OSError, ValueError):
+                raw = None
 
-                for output in grp:
-                    dset = grp[output]
+            # each group fills a contiguous block of the giant array, so view the arrays
+            # as a list of blocks and read every dataset directly into its block.
+            master_dict = {}
+            flat_dict = {}
+            for gidx in np.argsort(flat_index):
+                grp = grp_list[gidx]
+                fidx = flat_index[gidx]
+                for output in grp.id:
+                    dset_id = h5py.h5d.open(grp.id, output)
+                    output = fix_string(output)
                     if output not in master_dict:
-                        master_dict[output] = np.empty(master_shape, dtype=dset.dtype)
-                    master_dict[output][master_index] = dset
+                        master_dict[output] = np.empty(master_shape, dtype=dset_id.dtype)
+                        flat_dict[output] = master_dict[output].reshape([expected_len] + swp_shape)
+                    _read_hdf5_dataset(dset_id, flat_dict[output][fidx, ...], raw=raw)
+
+            del raw
 
         return master_dict, master_attrs, master_values, file_constants
 
@@ -761,6 +1080,26 @@ class CharDB(with_metaclass(abc.ABCMeta, object)):
 
         self._params[key] = value
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        # type: () -> None
+        """Release the post-processed data file.
+
+        This closes the data file kept open by lazy databases and drops all references
+        to memory-mapped data.  This database cannot be queried afterwards.
+        """
+        self._data = {}
+        self._fun = {name: np.full(ftable.shape, None, dtype=object) for name, ftable in self._fun.items()}
+        self._fun_vec = {}
+        if self._cache_file is not None:
+            self._cache_file.close()
+            self._cache_file = None
+
     def get_config(self, name):
         # type: (str) -> Any
         """Returns the configuration value.
@@ -940,20 +1279,15 @@ class CharDB(with_metaclass(abc.ABCMeta, object)):
         ftable = self._fun[name]
         if ftable[fidx_list] is None:
             if name in self._data:
-                # core parameter
-                char_data = self._data[name]
+                # core parameter.  Only read the data of the given function index,
+                # as data may be loaded on demand.
+                cur_data = np.asarray(self._data[name][fidx_list])
 
-                # get scale list and data index
-                scale_list = []
-                didx = list(fidx_list)  # type: List[Union[int, slice]]
-                for vec in self._cont_values:
-                    scale_list.append((vec[0], vec[1] - vec[0]))
-                    didx.append(slice(0, vec.size))
+                # get scale list
+                scale_list = [(vec[0], vec[1] - vec[0]) for vec in self._cont_values]
 
                 # make interpolator.
-                cur_data = char_data[didx]
-                method = self.get_config('method')
-                ftable[fidx_list] = interpolate_grid(scale_list, cur_data, method=method, extrapolate=True)
+                ftable[fidx_list] = self._make_interpolator(scale_list, cur_data)
             else:
                 # derived parameter
                 core_fdict = {fn: self._get_function_helper(fn, fidx_list) for fn in self._data}
@@ -963,6 +1297,91 @@ class CharDB(with_metaclass(abc.ABCMeta, object)):
 
         return ftable[fidx_list]
 
+    def _get_env_index(self, env):
+        # type: (str) -> int
+        """Returns the function index of the given simulation environment."""
+        occur_list = np.where(self._env_values == env)[0]
+        if occur_list.size == 0:
+            raise ValueError('environment %s not found.' % env)
+        return occur_list[0]
+
+    def _get_function_vector(self, name, fidx_list):
+        # type: (str, List[int]) -> VectorDiffFunction
+        """Returns the vector function of the given output over all simulation environments.
+
+        The vector functions are cached, so repeated queries do not rebuild them.
+
+        Parameters
+        ----------
+        name : str
+            name of the function.
+        fidx_list : List[int]
+            function index.  The simulation environment index is ignored.
+
+        Returns
+        -------
+        output : VectorDiffFunction
+            the output vector function.
+        """
+        env_idx_list = tuple((self._get_env_index(env) for env in self.env_list))
+        key = (name, env_idx_list, tuple(fidx_list[1:]))
+        fun_vec = self._fun_vec.get(key, None)
+        if fun_vec is None:
+            fidx_list = list(fidx_list)
+            fun_list = []
+            for env_idx in env_idx_list:
+                fidx_list[0] = env_idx
+                fun_list.append(self._get_function_helper(name, fidx_list))
+            fun_vec = self._fun_vec[key] = VectorDiffFunction(fun_list)
+        return fun_vec
+
+    def _make_interpolator(self, scale_list, values):
+        # type: (List[Tuple[float, float]], np.ndarray) -> DiffFunction
+        """Create an interpolator of the given data.
+
+        If interpolator caching is enabled, the spline coefficients are saved to and
+        loaded from the interpolator cache directory, keyed by the data hash, the
+        interpolation method, and the number of extrapolation points.
+
+        Parameters
+        ----------
+        scale_list : List[Tuple[float, float]]
+            a list of (offset, spacing) for each input dimension.
+        values : np.ndarray
+            the data to interpolate.
+
+        Returns
+        -------
+        fun : DiffFunction
+            the interpolator function.
+        """
+        method = self.get_config('method')
+        num_ext = self.get_config('num_extrapolate')
+        if self._interp_dir is None or method != 'spline' or values.ndim < 3:
+            # no spline prefiltering for these interpolators.
+            return interpolate_grid(scale_list, values, method=method, extrapolate=True,
+                                    num_extrapolate=num_ext)
+
+        values = np.ascontiguousarray(values)
+        data_hash = hashlib.sha1(to_bytes('%s%s' % (values.dtype.str, values.shape)))
+        data_hash.update(values.data)
+        fname = os.path.join(self._interp_dir, '%s_%s_%d.npy' % (data_hash.hexdigest(), method, num_ext))
+        if os.path.isfile(fname):
+            filt_values = np.load(fname, mmap_mode='r')
+            return interpolate_grid(scale_list, values, method=method, extrapolate=True,
+                                    num_extrapolate=num_ext, filt_values=filt_values)
+
+        fun = interpolate_grid(scale_list, values, method=method, extrapolate=True,
+                               num_extrapolate=num_ext)
+        # write to a temporary file first, so other processes never see partial files.
+        if not os.path.isdir(self._interp_dir):
+            os.makedirs(self._interp_dir)
+        tmp_fname = '%s.%d.tmp' % (fname, os.getpid())
+        with open(tmp_fname, 'wb') as f:
+            np.save(f, fun.filt_values)
+        os.rename(tmp_fname, fname)
+        return fun
+
     def get_function(self, name, env='', **kwargs):
         # type: (str, str, **kwargs) -> Union[VectorDiffFunction, DiffFunction]
         """Returns a function for the given output.
@@ -983,21 +1402,9 @@ class CharDB(with_metaclass(abc.ABCMeta, object)):
         """
         fidx_list = self._get_function_index(**kwargs)
         if not env:
-            fun_list = []
-            for env in self.env_list:
-                occur_list = np.where(self._env_values == env)[0]
-                if occur_list.size == 0:
-                    raise ValueError('environment %s not found.')
-                env_idx = occur_list[0]
-                fidx_list[0] = env_idx
-                fun_list.append(self._get_function_helper(name, fidx_list))
-            return VectorDiffFunction(fun_list)
+            return self._get_function_vector(name, fidx_list)
         else:
-            occur_list = np.where(self._env_values == env)[0]
-            if occur_list.size == 0:
-                raise ValueError('environment %s not found.')
-            env_idx = occur_list[0]
-            fidx_list[0] = env_idx
+            fidx_list[0] = self._get_env_index(env)
             return self._get_function_helper(name, fidx_list)
 
     def get_fun_sweep_params(self):
@@ -1015,7 +1422,11 @@ class CharDB(with_metaclass(abc.ABCMeta, object)):
 
     def _get_fun_arg(self, **kwargs):
         # type: (**kwargs) -> np.ndarray
-        """Make numpy array of interpolation function arguments."""
+        """Make numpy array of interpolation function arguments.
+
+        Parameter values are broadcasted against each other, and the last axis of the
+        returned array indexes the interpolation function sweep parameters.
+        """
         val_list = []
         for par in self._cont_params:
             val = kwargs.get(par, self[par])
@@ -1023,13 +1434,15 @@ class CharDB(with_metaclass(abc.ABCMeta, object)):
                 raise ValueError('Parameter %s value not specified.' % par)
             val_list.append(val)
 
-        return np.array(val_list)
+        return np.stack(np.broadcast_arrays(*val_list), axis=-1)
 
     def query(self, **kwargs):
         # type: (**kwargs) -> Dict[str, np.ndarray]
         """Query the database for the values associated with the given parameters.
 
-        All parameters must be specified.
+        All parameters must be specified.  Discrete parameters must be scalars, but
+        continuous parameters can be arrays, in which case the database is queried
+        at all operating points at once.  Numpy broadcasting rules apply.
 
         Parameters
         ----------
@@ -1039,12 +1452,14 @@ class CharDB(with_metaclass(abc.ABCMeta, object)):
         Returns
         -------
         results : Dict[str, np.ndarray]
-            the characterization results.
+            the characterization results.  If the continuous parameters broadcast to
+            shape S, each result has shape S + (num_env,).
         """
         results = {}
         arg = self._get_fun_arg(**kwargs)
+        fidx_list = self._get_function_index(**kwargs)
         for name in self._data:
-            fun = self.get_function(name, **kwargs)
+            fun = self._get_function_vector(name, fidx_list)
             results[name] = fun(arg)
 
         for var in itertools.chain(self._discrete_params, self._cont_params):
@@ -1054,6 +1469,31 @@ class CharDB(with_metaclass(abc.ABCMeta, object)):
 
         return results
 
+    def query_grid(self, **kwargs):
+        # type: (**kwargs) -> Dict[str, np.ndarray]
+        """Query the database on a grid of operating points.
+
+        Same as query(), but the continuous parameters given as 1D arrays form a grid
+        of operating points, with axes ordered as in get_fun_sweep_params().
+
+        Parameters
+        ----------
+        **kwargs :
+            parameter values.
+
+        Returns
+        -------
+        results : Dict[str, np.ndarray]
+            the characterization results.  Each result has shape (n_1, n_2, ..., num_env),
+            where n_i is the number of values of the i-th array parameter.  The values of
+            the array parameters are also returned on the grid.
+        """
+        grid_params = [par for par in self._cont_params if np.ndim(kwargs.get(par, self[par])) > 0]
+        grid_values = np.meshgrid(*(kwargs.get(par, self[par]) for par in grid_params), indexing='ij')
+        grid_kwargs = kwargs.copy()
+        grid_kwargs.update(zip(grid_params, grid_values))
+        return self.query(**grid_kwargs)
+
     def minimize(self,  # type: CharDB
                  objective,  # type: str
                  define=None,  # type: List[Tuple[str, int]]
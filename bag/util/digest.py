@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+########################################################################################################################
+#
+# Copyright (c) 2014, Regents of the University of California
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+#   disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+#    following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+########################################################################################################################
+
+
+
+"""This module provides a canonical fixed-size digest of parameter values.
+"""
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+# noinspection PyUnresolvedReferences,PyCompatibility
+from builtins import *
+
+import math
+import hashlib
+from typing import Any, Optional, List
+
+import numpy as np
+
+from ..io import fix_string
+
+# a float is snapped to the resolution grid if its distance to the nearest non-zero grid point,
+# relative to that grid point, is within this tolerance.
+_res_rtol = 1e-9
+
+
+def _float_token(val, resolution):
+    # type: (float, Optional[float]) -> str
+    """Returns the canonical token of the given float value.
+
+    Floats that are not snapped to the resolution grid use their exact representation, so
+    different values never share a token.
+    """
+    if math.isnan(val) or math.isinf(val):
+        return 'F%r;' % val
+    if val.is_integer():
+        # integral floats are equal to integers
+        return 'I%d;' % int(val)
+    if resolution is not None:
+        num_unit = val / resolution
+        num_round = round(num_unit)
+        if num_round != 0 and abs(num_unit - num_round) <= _res_rtol * abs(num_round):
+            # value is on the grid.  Use integer token if the grid point is an integer.
+            val_snap = num_round * resolution
+            int_snap = round(val_snap)
+            if abs(val_snap - int_snap) <= _res_rtol * abs(val_snap):
+                return 'I%d;' % int(int_snap)
+            return 'R%d;' % int(num_round)
+    return 'F%r;' % val
+
+
+def _add_tokens(val, resolution, tokens):
+    # type: (Any, Optional[float], List[str]) -> None
+    """Append canonical tokens of the given value to the token list."""
+    # python 2/3 compatibility: convert raw bytes to string
+    val = fix_string(val)
+
+    if val is None:
+        tokens.append('N')
+    elif isinstance(val, bool) or isinstance(val, np.bool_):
+        tokens.append('B1' if val else 'B0')
+    elif isinstance(val, str):
+        tokens.append('S%d:' % len(val))
+        tokens.append(val)
+    elif isinstance(val, int) or isinstance(val, np.integer):
+        tokens.append('I%d;' % val)
+    elif isinstance(val, float) or isinstance(val, np.floating):
+        tokens.append(_float_token(float(val), resolution))
+    elif isinstance(val, list) or isinstance(val, tuple):
+        tokens.append('L%d;' % len(val))
+        for item in val:
+            _add_tokens(item, resolution, tokens)
+    elif isinstance(val, np.ndarray):
+        _add_tokens(val.tolist(), resolution, tokens)
+    elif isinstance(val, dict):
+        tokens.append('D%d;' % len(val))
+        for key in sorted(val.keys()):
+            _add_tokens(key, resolution, tokens)
+            _add_tokens(val[key], resolution, tokens)
+    elif isinstance(val, set) or isinstance(val, frozenset):
+        item_tokens = []
+        for item in val:
+            cur_tokens = []
+            _add_tokens(item, resolution, cur_tokens)
+            item_tokens.append(''.join(cur_tokens))
+        tokens.append('E%d;' % len(val))
+        tokens.extend(sorted(item_tokens))
+    else:
+        raise Exception('Unrecognized value %s with type %s' % (str(val), type(val)))
+
+
+def compute_digest(val, resolution=None):
+    # type: (Any, Optional[float]) -> str
+    """Returns a canonical fixed-size digest of the given value.
+
+    The value may be any nested combination of None, booleans, strings, integers, floats,
+    lists, tuples, dictionaries, sets, and numpy scalars/arrays.  Values that compare equal
+    have the same digest regardless of dictionary ordering, list/tuple type, or integer/float
+    type.  The digest does not depend on the Python process, so it can be used as a
+    cross-process or on-disk identifier.
+
+    Parameters
+    ----------
+    val : Any
+        the value to compute digest of.
+    resolution : Optional[float]
+        the layout resolution.  If given, floats within floating point error of a non-zero
+        multiple of the resolution are considered equal.  All other floats are compared exactly.
+
+    Returns
+    -------
+    digest : str
+        the SHA-1 hex digest.
+    """
+    tokens = []
+    _add_tokens(val, resolution, tokens)
+    return hashlib.sha1(''.join(tokens).encode('utf-8')).hexdigest()
@@ -31,6 +31,7 @@ from __future__ import (absolute_import, division,
 from builtins import *
 
 import bisect
+import itertools
 from typing import List, Optional, Tuple, Any, Iterable
 
 
@@ -176,6 +177,13 @@ class IntervalSet(object):
         return IntervalSet(intv_list=list(zip(self._start_list, self._end_list)),
                            val_list=self._val_list)
 
+    def _reset(self, start_list, end_list, val_list):
+        # type: (List[int], List[int], List[Any]) -> None
+        """Replace the content of this IntervalSet with the given sorted lists."""
+        self._start_list = start_list
+        self._end_list = end_list
+        self._val_list = val_list
+
     def _get_first_overlap_idx(self, intv):
         # type: (Tuple[int, int]) -> int
         """Returns the index of the first interval that overlaps with the given interval.
@@ -301,25 +309,24 @@ class IntervalSet(object):
         intersection : IntervalSet
             a new IntervalSet containing all intervals present in both sets.
         """
-        idx1 = idx2 = 0
-        len1 = len(self._start_list)
-        len2 = len(other._start_list)
+        iter1 = iter(self.intervals())
+        iter2 = iter(other.intervals())
+        intv1 = next(iter1, None)
+        intv2 = next(iter2, None)
         intvs = []
-        while idx1 < len1 and idx2 < len2:
-            intv1 = self._start_list[idx1], self._end_list[idx1]
-            intv2 = other._start_list[idx2], other._end_list[idx2]
+        while intv1 is not None and intv2 is not None:
             test = max(intv1[0], intv2[0]), min(intv1[1], intv2[1])
             if test[1] > test[0]:
                 intvs.append(test)
             if intv1[1] < intv2[1]:
-                idx1 += 1
+                intv1 = next(iter1, None)
             elif intv2[1] < intv1[1]:
-                idx2 += 1
+                intv2 = next(iter2, None)
             else:
-                idx1 += 1
-                idx2 += 1
+                intv1 = next(iter1, None)
+                intv2 = next(iter2, None)
 
-        return IntervalSet(intv_list=intvs)
+        return self.__class__(intv_list=intvs)
 
     def get_complement(self, total_intv):
         # type: (Tuple[int, int]) -> IntervalSet
@@ -338,16 +345,16 @@ class IntervalSet(object):
         complement : IntervalSet
             the complement of this IntervalSet.
         """
-        if not self._start_list:
+        if not self:
             # complement of empty interval is the universal interval
-            return IntervalSet(intv_list=[total_intv])
+            return self.__class__(intv_list=[total_intv])
 
-        if self._start_list[0] < total_intv[0] or total_intv[1] < self._end_list[-1]:
+        if self.get_start() < total_intv[0] or total_intv[1] < self.get_end():
             raise ValueError('The given interval [{0}, {1}) is '
                              'not a valid universal interval'.format(*total_intv))
         intv_list = []
         marker = total_intv[0]
-        for start, end in zip(self._start_list, self._end_list):
+        for start, end in self.intervals():
             if marker < start:
                 intv_list.append((marker, start))
             marker = end
@@ -355,7 +362,28 @@ class IntervalSet(object):
         if marker < total_intv[1]:
             intv_list.append((marker, total_intv[1]))
 
-        return IntervalSet(intv_list=intv_list)
+        return self.__class__(intv_list=intv_list)
+
+    def get_union(self, other):
+        # type: (IntervalSet) -> IntervalSet
+        """Returns the union of two IntervalSets.
+
+        The result is the same as adding all intervals of other to a copy of this set with
+        merge=True.  The new IntervalSet will have all values set to None.
+
+        Parameters
+        ----------
+        other : IntervalSet
+            the other IntervalSet.
+
+        Returns
+        -------
+        union : IntervalSet
+            a new IntervalSet containing all intervals present in either set.
+        """
+        result = self.__class__(intv_list=list(self.intervals()))
+        result.add_all(other.intervals(), merge=True)
+        return result
 
     def remove_all_overlaps(self, intv):
         # type: (Tuple[int, int]) -> None
@@ -416,6 +444,83 @@ class IntervalSet(object):
             self._val_list.insert(idx, val)
             return True
 
+    def add_all(self, intv_list, val=None, merge=False):
+        # type: (Iterable[Tuple[int, int]], Any, bool) -> bool
+        """Adds all given intervals to this IntervalSet.
+
+        This method sorts the given intervals and merges them with the existing ones in a single
+        pass, so it is much faster than calling add() repeatedly for large batches.  With
+        merge=True, the result is identical to calling add() on each interval in sorted order.
+
+        Parameters
+        ----------
+        intv_list : Iterable[Tuple[int, int]]
+            the intervals to add.
+        val : Any
+            the value associated with the added intervals.
+        merge : bool
+            If true, the given intervals will be merged with any existing intervals
+            that overlaps with them.  The merged intervals will have the given value.
+            Otherwise, if any given interval overlaps with an existing interval or another
+            given interval, no intervals are added.
+
+        Returns
+        -------
+        success : bool
+            True if the given intervals are added.
+        """
+        new_intvs = sorted(intv_list)
+        if not new_intvs:
+            return True
+
+        old_intvs = list(self.intervals())
+        old_vals = list(self.values())
+        num_old = len(old_intvs)
+        start_list, end_list, val_list = [], [], []
+        old_idx = 0
+        for start, end in new_intvs:
+            # intervals starting before this one cannot be absorbed by it
+            while old_idx < num_old and old_intvs[old_idx][0] <= start:
+                start_list.append(old_intvs[old_idx][0])
+                end_list.append(old_intvs[old_idx][1])
+                val_list.append(old_vals[old_idx])
+                old_idx += 1
+
+            if start_list and start < end_list[-1]:
+                # overlap with the last processed interval
+                if not merge:
+                    return False
+                new_start = start_list.pop()
+                new_end = max(end_list.pop(), end)
+                val_list.pop()
+            elif old_idx < num_old and old_intvs[old_idx][0] < end:
+                # overlap with the next existing interval
+                if not merge:
+                    return False
+                new_start = start
+                new_end = end
+            else:
+                start_list.append(start)
+                end_list.append(end)
+                val_list.append(val)
+                continue
+
+            # absorb all existing intervals up to the end of the added interval
+            while old_idx < num_old and old_intvs[old_idx][0] <= end:
+                new_end = max(new_end, old_intvs[old_idx][1])
+                old_idx += 1
+            start_list.append(new_start)
+            end_list.append(new_end)
+            val_list.append(val)
+
+        for idx in range(old_idx, num_old):
+            start_list.append(old_intvs[idx][0])
+            end_list.append(old_intvs[idx][1])
+            val_list.append(old_vals[idx])
+
+        self._reset(start_list, end_list, val_list)
+        return True
+
     def subtract(self, intv):
         # type: (Tuple[int, int]) -> List[Tuple[int, int]]
         """Subtract the given interval from this IntervalSet.
@@ -569,3 +674,352 @@ class IntervalSet(object):
         result._val_list = new_val
 
         return result
+
+
+class ChunkedIntervalSet(IntervalSet):
+    """An IntervalSet that stores intervals in a list of bounded-size sorted chunks.
+
+    The first start of each chunk is kept in a separate index list.  Lookups bisect the index
+    then the chunk, and add, remove, merge and subtract only shift entries within the affected
+    chunks, so these operations no longer scale linearly with the number of intervals.  This
+    class has the same API as IntervalSet, but has a small constant overhead, so it should only
+    be used for sets that hold many thousands of intervals.
+
+    Parameters
+    ----------
+    intv_list : Optional[List[Tuple[int, int]]]
+        the sorted initial interval list.
+    val_list : Optional[List[Any]]
+        the initial values list.
+    load_factor : int
+        the nominal number of intervals per chunk.
+    """
+
+    # noinspection PyMissingConstructor
+    def __init__(self, intv_list=None, val_list=None, load_factor=512):
+        # type: (Optional[List[Tuple[int, int]]], Optional[List[Any]], int) -> None
+        self._load = load_factor
+        if intv_list is None:
+            self._reset([], [], [])
+        else:
+            start_list = [v[0] for v in intv_list]
+            end_list = [v[1] for v in intv_list]
+            if val_list is None:
+                val_list = [None] * len(start_list)
+            else:
+                val_list = list(val_list)
+            self._reset(start_list, end_list, val_list)
+
+    def __contains__(self, key):
+        # type: (Tuple[int, int]) -> bool
+        cidx, idx, found = self._get_first_overlap_loc(key)
+        return found and key[0] == self._starts[cidx][idx] and key[1] == self._ends[cidx][idx]
+
+    def __getitem__(self, intv):
+        # type: (Tuple[int, int]) -> Any
+        cidx, idx, found = self._get_first_overlap_loc(intv)
+        if not found or intv[0] != self._starts[cidx][idx] or intv[1] != self._ends[cidx][idx]:
+            raise KeyError('Invalid interval: %s' % repr(intv))
+        return self._vals[cidx][idx]
+
+    def __setitem__(self, intv, value):
+        # type: (Tuple[int, int], Any) -> None
+        cidx, idx, found = self._get_first_overlap_loc(intv)
+        if not found:
+            self.add(intv, value)
+        elif intv[0] != self._starts[cidx][idx] or intv[1] != self._ends[cidx][idx]:
+            raise KeyError('Invalid interval: %s' % repr(intv))
+        else:
+            self._vals[cidx][idx] = value
+
+    def __iter__(self):
+        # type: () -> Iterable[Tuple[int, int]]
+        return itertools.chain.from_iterable(zip(starts, ends)
+                                             for starts, ends in zip(self._starts, self._ends))
+
+    def __len__(self):
+        # type: () -> int
+        return self._size
+
+    def get_start(self):
+        # type: () -> int
+        return self._starts[0][0]
+
+    def get_end(self):
+        # type: () -> int
+        return self._ends[-1][-1]
+
+    def copy(self):
+        # type: () -> ChunkedIntervalSet
+        result = self.__class__.__new__(self.__class__)
+        result._load = self._load
+        result._starts = [list(chunk) for chunk in self._starts]
+        result._ends = [list(chunk) for chunk in self._ends]
+        result._vals = [list(chunk) for chunk in self._vals]
+        result._firsts = list(self._firsts)
+        result._size = self._size
+        return result
+
+    def _reset(self, start_list, end_list, val_list):
+        # type: (List[int], List[int], List[Any]) -> None
+        load = self._load
+        num = len(start_list)
+        self._starts = [start_list[idx:idx + load] for idx in range(0, num, load)]
+        self._ends = [end_list[idx:idx + load] for idx in range(0, num, load)]
+        self._vals = [val_list[idx:idx + load] for idx in range(0, num, load)]
+        self._firsts = [chunk[0] for chunk in self._starts]
+        self._size = num
+
+    def _bisect_right(self, val):
+        # type: (int) -> Tuple[int, int]
+        """Returns the location after all intervals whose start is less than or equal to val."""
+        cidx = bisect.bisect_right(self._firsts, val) - 1
+        if cidx < 0:
+            return 0, 0
+        return cidx, bisect.bisect_right(self._starts[cidx], val)
+
+    def _prev_loc(self, cidx, idx):
+        # type: (int, int) -> Optional[Tuple[int, int]]
+        """Returns the location before the given one, or None if it does not exist."""
+        if idx > 0:
+            return cidx, idx - 1
+        if cidx > 0:
+            return cidx - 1, len(self._starts[cidx - 1]) - 1
+        return None
+
+    def _next_loc(self, cidx, idx):
+        # type: (int, int) -> Optional[Tuple[int, int]]
+        """Returns the first valid location at or after the given one, or None if it does not exist."""
+        if cidx < len(self._starts):
+            if idx < len(self._starts[cidx]):
+                return cidx, idx
+            if cidx + 1 < len(self._starts):
+                return cidx + 1, 0
+        return None
+
+    def _get_first_overlap_loc(self, intv):
+        # type: (Tuple[int, int]) -> Tuple[int, int, bool]
+        """Returns the location of the first interval that overlaps with the given interval.
+
+        Parameters
+        ----------
+        intv : Tuple[int, int]
+            the given interval.
+
+        Returns
+        -------
+        cidx : int
+            the chunk index.
+        idx : int
+            the index within the chunk.
+        found : bool
+            True if an overlapping interval is found.  Otherwise, (cidx, idx) is the location
+            to insert the given interval.
+        """
+        start, end = intv
+        cidx, idx = self._bisect_right(start)
+        loc = self._prev_loc(cidx, idx)
+        if loc is not None and start < self._ends[loc[0]][loc[1]]:
+            return loc[0], loc[1], True
+        loc = self._next_loc(cidx, idx)
+        if loc is not None and self._starts[loc[0]][loc[1]] < end:
+            return loc[0], loc[1], True
+        return cidx, idx, False
+
+    def _get_last_overlap_loc(self, intv):
+        # type: (Tuple[int, int]) -> Optional[Tuple[int, int]]
+        """Returns the location of the last interval that overlaps with the given interval.
+
+        Parameters
+        ----------
+        intv : Tuple[int, int]
+            the given interval.
+
+        Returns
+        -------
+        loc : Optional[Tuple[int, int]]
+            the chunk index and the index within the chunk, or None if no overlapping
+            intervals are found.
+        """
+        loc = self._prev_loc(*self._bisect_right(intv[1]))
+        if loc is None or self._ends[loc[0]][loc[1]] < intv[0]:
+            return None
+        return loc
+
+    def _iter_overlap_loc(self, intv):
+        # type: (Tuple[int, int]) -> Iterable[Tuple[int, int]]
+        """Iterates over locations of intervals overlapping the given interval."""
+        bcidx, bidx, found = self._get_first_overlap_loc(intv)
+        if not found:
+            return
+        ecidx, eidx = self._get_last_overlap_loc(intv)
+        for cidx in range(bcidx, ecidx + 1):
+            start_idx = bidx if cidx == bcidx else 0
+            stop_idx = eidx + 1 if cidx == ecidx else len(self._starts[cidx])
+            for idx in range(start_idx, stop_idx):
+                yield cidx, idx
+
+    def _splice(self, bcidx, bidx, ecidx, eidx, start_list, end_list, val_list):
+        # type: (int, int, int, int, List[int], List[int], List[Any]) -> None
+        """Replace intervals from location (bcidx, bidx) up to but excluding (ecidx, eidx)."""
+        if not self._starts:
+            if start_list:
+                self._starts.append(list(start_list))
+                self._ends.append(list(end_list))
+                self._vals.append(list(val_list))
+                self._firsts.append(start_list[0])
+                self._size = len(start_list)
+            return
+
+        if bcidx == ecidx:
+            self._size += len(start_list) - (eidx - bidx)
+            self._starts[bcidx][bidx:eidx] = start_list
+            self._ends[bcidx][bidx:eidx] = end_list
+            self._vals[bcidx][bidx:eidx] = val_list
+            self._fix_chunk(bcidx)
+        else:
+            num_rm = len(self._starts[bcidx]) - bidx + eidx
+            num_rm += sum((len(chunk) for chunk in self._starts[bcidx + 1:ecidx]))
+            self._size += len(start_list) - num_rm
+            for chunk_list, new_list in ((self._starts, start_list), (self._ends, end_list),
+                                         (self._vals, val_list)):
+                chunk_list[bcidx][bidx:] = new_list
+                del chunk_list[ecidx][:eidx]
+                del chunk_list[bcidx + 1:ecidx]
+            del self._firsts[bcidx + 1:ecidx]
+            self._fix_chunk(bcidx + 1)
+            self._fix_chunk(bcidx)
+
+    def _fix_chunk(self, cidx):
+        # type: (int) -> None
+        """Update the index of the given chunk, and merge or split it to keep its size bounded."""
+        num = len(self._starts[cidx])
+        if num == 0:
+            for chunk_list in (self._starts, self._ends, self._vals, self._firsts):
+                del chunk_list[cidx]
+            return
+
+        if num < self._load // 2 and cidx + 1 < len(self._starts):
+            # merge with next chunk
+            for chunk_list in (self._starts, self._ends, self._vals):
+                chunk_list[cidx].extend(chunk_list.pop(cidx + 1))
+            del self._firsts[cidx + 1]
+            num = len(self._starts[cidx])
+
+        self._firsts[cidx] = self._starts[cidx][0]
+        if num > 2 * self._load:
+            # split into two chunks
+            half = num // 2
+            for chunk_list in (self._starts, self._ends, self._vals):
+                chunk = chunk_list[cidx]
+                chunk_list.insert(cidx + 1, chunk[half:])
+                del chunk[half:]
+            self._firsts.insert(cidx + 1, self._starts[cidx + 1][0])
+
+    def has_overlap(self, intv):
+        # type: (Tuple[int, int]) -> bool
+        return self._get_first_overlap_loc(intv)[2]
+
+    def remove(self, intv):
+        # type: (Tuple[int, int]) -> bool
+        cidx, idx, found = self._get_first_overlap_loc(intv)
+        if found and intv[0] == self._starts[cidx][idx] and intv[1] == self._ends[cidx][idx]:
+            self._splice(cidx, idx, cidx, idx + 1, [], [], [])
+            return True
+        return False
+
+    def remove_all_overlaps(self, intv):
+        # type: (Tuple[int, int]) -> None
+        bcidx, bidx, found = self._get_first_overlap_loc(intv)
+        if found:
+            ecidx, eidx = self._get_last_overlap_loc(intv)
+            self._splice(bcidx, bidx, ecidx, eidx + 1, [], [], [])
+
+    def add(self, intv, val=None, merge=False):
+        # type: (Tuple[int, int], Any, bool) -> bool
+        bcidx, bidx, found = self._get_first_overlap_loc(intv)
+        if found:
+            if not merge:
+                return False
+            ecidx, eidx = self._get_last_overlap_loc(intv)
+            new_start = min(self._starts[bcidx][bidx], intv[0])
+            new_end = max(self._ends[ecidx][eidx], intv[1])
+            self._splice(bcidx, bidx, ecidx, eidx + 1, [new_start], [new_end], [val])
+        else:
+            self._splice(bcidx, bidx, bcidx, bidx, [intv[0]], [intv[1]], [val])
+        return True
+
+    def add_all(self, intv_list, val=None, merge=False):
+        # type: (Iterable[Tuple[int, int]], Any, bool) -> bool
+        new_intvs = sorted(intv_list)
+        if len(new_intvs) * 16 >= self._size:
+            # large batch, merge in a single pass
+            return super(ChunkedIntervalSet, self).add_all(new_intvs, val=val, merge=merge)
+
+        if not merge:
+            # make sure all intervals can be added before modifying this set
+            prev_end = None
+            for intv in new_intvs:
+                if (prev_end is not None and intv[0] < prev_end) or self.has_overlap(intv):
+                    return False
+                prev_end = intv[1]
+        for intv in new_intvs:
+            self.add(intv, val=val, merge=merge)
+        return True
+
+    def subtract(self, intv):
+        # type: (Tuple[int, int]) -> List[Tuple[int, int]]
+        bcidx, bidx, found = self._get_first_overlap_loc(intv)
+        insert_intv = []
+        if found:
+            ecidx, eidx = self._get_last_overlap_loc(intv)
+            insert_val = []
+            if self._starts[bcidx][bidx] < intv[0]:
+                insert_intv.append((self._starts[bcidx][bidx], intv[0]))
+                insert_val.append(self._vals[bcidx][bidx])
+            if intv[1] < self._ends[ecidx][eidx]:
+                insert_intv.append((intv[1], self._ends[ecidx][eidx]))
+                insert_val.append(self._vals[ecidx][eidx])
+            self._splice(bcidx, bidx, ecidx, eidx + 1, [v[0] for v in insert_intv],
+                         [v[1] for v in insert_intv], insert_val)
+
+        return insert_intv
+
+    def items(self):
+        # type: () -> Iterable[Tuple[Tuple[int, int], Any]]
+        return zip(self.__iter__(), self.values())
+
+    def values(self):
+        # type: () -> Iterable[Any]
+        return itertools.chain.from_iterable(self._vals)
+
+    def overlap_items(self, intv):
+        # type: (Tuple[int, int]) -> Iterable[Tuple[Tuple[int, int], Any]]
+        for cidx, idx in self._iter_overlap_loc(intv):
+            yield (self._starts[cidx][idx], self._ends[cidx][idx]), self._vals[cidx][idx]
+
+    def overlap_intervals(self, intv):
+        # type: (Tuple[int, int]) -> Iterable[Tuple[int, int]]
+        for cidx, idx in self._iter_overlap_loc(intv):
+            yield self._starts[cidx][idx], self._ends[cidx][idx]
+
+    def transform(self, scale=1, shift=0):
+        # type: (int, int) -> ChunkedIntervalSet
+        if scale < 0:
+            new_start = [[-v + shift for v in reversed(chunk)] for chunk in reversed(self._ends)]
+            new_end = [[-v + shift for v in reversed(chunk)] for chunk in reversed(self._starts)]
+            new_val = [list(reversed(chunk)) for chunk in reversed(self._vals)]
+        else:
+            new_start = [[v + shift for v in chunk] for chunk in self._starts]
+            new_end = [[v + shift for v in chunk] for chunk in self._ends]
+            new_val = [list(chunk) for chunk in self._vals]
+
+        result = self.__class__.__new__(self.__class__)
+        result._load = self._load
+        result._starts = new_start
+        result._ends = new_end
+        result._vals = new_val
+        result._firsts = [chunk[0] for chunk in new_start]
+        result._size = self._size
+
+        return result
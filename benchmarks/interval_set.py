@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+########################################################################################################################
+#
+# Copyright (c) 2014, Regents of the University of California
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+#   disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+#    following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+########################################################################################################################
+
+"""Compare the IntervalSet and ChunkedIntervalSet backends on 100k-interval workloads.
+
+usage: python benchmarks/interval_set.py [num_intvs]
+"""
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+# noinspection PyUnresolvedReferences,PyCompatibility
+from builtins import *
+
+import sys
+import time
+import random
+
+from bag.util.interval import IntervalSet, ChunkedIntervalSet
+
+
+def make_intervals(num_intvs, seed):
+    """Create a list of random intervals in shuffled order."""
+    rnd = random.Random(seed)
+    return [(start, start + rnd.randint(1, 10))
+            for start in (rnd.randrange(20 * num_intvs) for _ in range(num_intvs))]
+
+
+def bench_add(cls, intv_list):
+    intv_set = cls()
+    for intv in intv_list:
+        intv_set.add(intv)
+    return intv_set
+
+
+def bench_add_merge(cls, intv_list):
+    intv_set = cls()
+    for intv in intv_list:
+        intv_set.add(intv, merge=True)
+    return intv_set
+
+
+def bench_add_all(cls, intv_list):
+    intv_set = cls()
+    intv_set.add_all(intv_list, merge=True)
+    return intv_set
+
+
+def bench_subtract(cls, intv_list):
+    intv_set = cls(intv_list=[(0, 20 * len(intv_list) + 20)])
+    for intv in intv_list:
+        intv_set.subtract(intv)
+    return intv_set
+
+
+def bench_remove(cls, intv_list):
+    intv_set = bench_add(cls, intv_list)
+    for intv in list(intv_set):
+        intv_set.remove(intv)
+    return intv_set
+
+
+def bench_overlap(cls, intv_list):
+    intv_set = bench_add(cls, intv_list)
+    for intv in intv_list:
+        intv_set.has_overlap(intv)
+    return intv_set
+
+
+def bench_bulk(cls, intv_list):
+    half = len(intv_list) // 2
+    set1 = bench_add_all(cls, intv_list[:half])
+    set2 = bench_add_all(cls, intv_list[half:])
+    total_intv = (0, 20 * len(intv_list) + 20)
+    set1.get_union(set2)
+    set1.get_intersection(set2)
+    set1.get_complement(total_intv)
+    return set1
+
+
+def run_main():
+    num_intvs = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    intv_list = make_intervals(num_intvs, 0)
+    print('benchmarking with %d intervals' % num_intvs)
+    for bench_fun in (bench_add, bench_add_merge, bench_add_all, bench_subtract,
+                      bench_remove, bench_overlap, bench_bulk):
+        results = []
+        for cls in (IntervalSet, ChunkedIntervalSet):
+            start = time.time()
+            intv_set = bench_fun(cls, intv_list)
+            results.append((time.time() - start, list(intv_set.items())))
+        (t_list, items_list), (t_chunk, items_chunk) = results
+        print('%-16s IntervalSet: %8.4g s, ChunkedIntervalSet: %8.4g s, speedup: %6.3gx, '
+              'identical: %s' % (bench_fun.__name__, t_list, t_chunk, t_list / t_chunk,
+                                 items_list == items_chunk))
+
+
+if __name__ == '__main__':
+    run_main()
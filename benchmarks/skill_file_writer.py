@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+########################################################################################################################
+#
+# Copyright (c) 2014, Regents of the University of California
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+#   disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+#    following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+########################################################################################################################
+
+"""Compare the reference and fast skill file writers on a synthetic layout.
+
+usage: python benchmarks/skill_file_writer.py [num_rects]
+"""
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+# noinspection PyUnresolvedReferences,PyCompatibility
+from builtins import *
+
+import os
+import sys
+import time
+
+import bag.io
+from bag.interface.server import _object_to_skill_file_helper, object_to_skill_file
+
+
+def make_layout_list(num_rects):
+    """Create a layout list with a single cell containing the given number of rectangles."""
+    rect_list = []
+    for idx in range(num_rects):
+        xl = (idx % 1000) * 0.2
+        yb = (idx // 1000) * 0.2
+        rect = dict(layer=['M%d' % (idx % 8 + 1), 'drawing'],
+                    bbox=[[xl, yb], [xl + 0.1, yb + 0.05]])
+        if idx % 10 == 0:
+            rect['arr_nx'] = 4
+            rect['arr_ny'] = 1
+            rect['arr_spx'] = 0.2
+            rect['arr_spy'] = 0.0
+        rect_list.append(rect)
+    return [['BENCH_TOP', [], rect_list, [], [], []]]
+
+
+def time_writer(fun, layout_list):
+    """Write the layout list to a temporary file with the given function.
+
+    Returns the elapsed time and the file content.
+    """
+    with bag.io.open_temp(prefix='skill_bench', delete=False) as file_obj:
+        fname = file_obj.name
+        start = time.time()
+        fun(layout_list, file_obj)
+        elapsed = time.time() - start
+    content = bag.io.read_file(fname)
+    os.remove(fname)
+    return elapsed, content
+
+
+def reference_writer(py_obj, file_obj):
+    """object_to_skill_file() using the reference implementation."""
+    _object_to_skill_file_helper(py_obj, file_obj)
+    file_obj.write('\n')
+
+
+def run_main():
+    num_rects = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    print('creating layout with %d rectangles' % num_rects)
+    layout_list = make_layout_list(num_rects)
+
+    t_ref, content_ref = time_writer(reference_writer, layout_list)
+    print('reference writer: %.4g seconds' % t_ref)
+    t_fast, content_fast = time_writer(object_to_skill_file, layout_list)
+    print('fast writer: %.4g seconds' % t_fast)
+    print('speedup: %.3gx, output identical: %s' % (t_ref / t_fast, content_ref == content_fast))
+
+
+if __name__ == '__main__':
+    run_main()
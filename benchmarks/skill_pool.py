@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+########################################################################################################################
+#
+# Copyright (c) 2014, Regents of the University of California
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+#   disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+#    following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+########################################################################################################################
+
+"""Run SkillPool against local stub servers that speak the BAG server ZMQ protocol.
+
+Each stub server emulates a Virtuoso process: it keeps copies of the cellviews it opened in
+memory, and fails to open a child cellview that is missing on disk, or whose in-memory copy is
+older than the one on disk.  This checks that SkillPool creates all cells in dependency order
+without using stale copies, and measures the speedup of multiple workers.
+
+usage: python benchmarks/skill_pool.py [num_workers] [num_trees] [cell_delay]
+"""
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+# noinspection PyUnresolvedReferences,PyCompatibility
+from builtins import *
+
+import sys
+import time
+import threading
+
+from bag.interface import ZMQDealer, ZMQRouter, SkillPool
+from bag.interface.skill import SkillInterface
+from bag.verification.base import Checker
+
+LIB_NAME = 'STUB_LIB'
+VIEW_NAME = 'layout'
+
+
+class StubChecker(Checker):
+    """A checker whose LVS and RCX always fail, so DbAccess does not print warnings."""
+
+    def run_lvs(self, lib_name, cell_name, sch_view, lay_view, lvs_params, block=True, callback=None):
+        return False, ''
+
+    def run_rcx(self, lib_name, cell_name, sch_view, lay_view, rcx_params, block=True, callback=None,
+                create_schematic=True):
+        return None, ''
+
+
+class StubDisk(object):
+    """The cellviews on disk shared by all stub servers."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = {}
+        self.num_refresh = 0
+
+
+class StubServer(threading.Thread):
+    """A stub BAG server that handles create_layout and refresh_cellviews skill requests.
+
+    Parameters
+    ----------
+    disk : StubDisk
+        the shared disk.
+    cell_delay : float
+        time in seconds to create each cell.
+    """
+
+    def __init__(self, disk, cell_delay):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.router = ZMQRouter()
+        self.disk = disk
+        self.cell_delay = cell_delay
+        self.memory = {}
+
+    def run(self):
+        while True:
+            req = None
+            try:
+                req = self.router.recv_obj()
+                req_type = req['type']
+                if req_type == 'exit':
+                    self.router.close()
+                    return
+                elif req_type == 'codec':
+                    self.router.negotiate_codec(req)
+                    continue
+                self.process_skill(req['expr'], req['input_files'] or {})
+                reply = dict(type='str', data='t')
+            except Exception as ex:
+                # reply to every request, so the client never waits forever.
+                reply = dict(type='error', data='*Error* %s: %s' % (ex.__class__.__name__, ex))
+            if isinstance(req, dict) and 'req_id' in req:
+                reply['req_id'] = req['req_id']
+            self.router.send_obj(reply)
+
+    def process_skill(self, expr, input_files):
+        if 'refresh_cellviews' in expr:
+            for key in input_files['cell_view_list']:
+                self.memory.pop(tuple(key), None)
+            with self.disk.lock:
+                self.disk.num_refresh += 1
+        if 'create_layout' in expr:
+            for info_list in input_files['layout_list']:
+                for inst in info_list[1]:
+                    self.open_cellview((inst['lib'], inst['cell'], inst['view']))
+                time.sleep(self.cell_delay)
+                key = (LIB_NAME, info_list[0], VIEW_NAME)
+                with self.disk.lock:
+                    version = self.disk.version[key] = self.disk.version.get(key, 0) + 1
+                self.memory[key] = version
+
+    def open_cellview(self, key):
+        with self.disk.lock:
+            version = self.disk.version.get(key, None)
+        if version is None:
+            raise ValueError('Cannot open cellview %s__%s (%s).' % key)
+        mem_version = self.memory.setdefault(key, version)
+        if mem_version != version:
+            raise ValueError('Stale cellview %s__%s (%s) in memory.' % key)
+
+
+def make_layout_list(num_trees, prefix):
+    """Create a layout list of independent trees that share a common leaf cell.
+
+    Each tree is a chain of three cells with two leaf cells at the bottom.
+    """
+    def inst(cell_name):
+        return dict(lib=LIB_NAME, cell=cell_name, view=VIEW_NAME, name='X0')
+
+    shared = '%s_SHARED' % prefix
+    layout_list = [[shared, [], [], [], [], []]]
+    top_list = []
+    for idx in range(num_trees):
+        leaf = '%s_LEAF_%d' % (prefix, idx)
+        mid = '%s_MID_%d' % (prefix, idx)
+        top = '%s_TOP_%d' % (prefix, idx)
+        layout_list.append([leaf, [], [], [], [], []])
+        layout_list.append([mid, [inst(leaf), inst(shared)], [], [], [], []])
+        layout_list.append([top, [inst(mid)], [], [], [], []])
+        top_list.append(inst(top))
+    layout_list.append(['%s_ALL' % prefix, top_list, [], [], [], []])
+    return layout_list
+
+
+def make_pool(num_workers, disk, cell_delay):
+    """Start stub servers and returns a SkillPool connected to them."""
+    db_config = dict(schematic=dict(tech_lib='STUB_TECH'),
+                     checker=dict(checker_cls='%s.StubChecker' % __name__))
+    db_list = []
+    for _ in range(num_workers):
+        server = StubServer(disk, cell_delay)
+        server.start()
+        db_list.append(SkillInterface(ZMQDealer(server.router.get_port()), None, db_config))
+    return SkillPool(db_list, None, db_config)
+
+
+def run_main():
+    num_workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    num_trees = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    cell_delay = float(sys.argv[3]) if len(sys.argv) > 3 else 0.01
+
+    for cur_workers in (1, num_workers):
+        disk = StubDisk()
+        pool = make_pool(cur_workers, disk, cell_delay)
+        start = time.time()
+        num_cells = 0
+        for prefix in ('A', 'B', 'A'):
+            # create a library twice to check that re-created cells are refreshed.
+            layout_list = make_layout_list(num_trees, prefix)
+            num_cells += len(layout_list)
+            pool.instantiate_layout(LIB_NAME, VIEW_NAME, 'STUB_TECH', iter(layout_list))
+        elapsed = time.time() - start
+        pool.close()
+        print('%d workers: created %d cells in %.4g seconds, %d refresh requests' %
+              (cur_workers, num_cells, elapsed, disk.num_refresh))
+
+
+if __name__ == '__main__':
+    run_main()
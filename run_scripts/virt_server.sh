@@ -12,5 +12,11 @@ set max_port = 9999
 set port_file = "BAG_server_port.txt"
 set log = "skill_server.log"
 
+# each Virtuoso process in a BAG server pool needs its own port file and log.
+if ($?BAG_SERVER_PORT_FILE) then
+    set port_file = "${BAG_SERVER_PORT_FILE}"
+    set log = "${port_file:r}.log"
+endif
+
 set cmd = "${BAG_PYTHON} ${cmd} ${min_port} ${max_port} ${port_file} ${log}"
 exec $cmd